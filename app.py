@@ -1,133 +1,683 @@
-from flask import Flask, render_template, request, jsonify
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g, make_response
 import os
-import requests
+import sys
+import copy
 import json
-import yt_dlp
-from pydub import AudioSegment
 import tempfile
-import google.generativeai as genai
-from google.cloud import speech
+import subprocess
 from dotenv import load_dotenv
 import re
+import hashlib
+import threading
+import llm
+import metrics
+from metrics import span
+from cache import DiskCache, MemoryCache, TieredCache
+from jobs import JobQueue
+from batches import BatchRunner
+from downloads import DownloadFailed, DownloadStats, run_strategies
+from transcription import create_engine, join_segments, format_timestamp, pcm_stream_command
+from sessions import SessionStore, transcript_id_for
+from contexts import ContextCache
+from audio_store import AudioStore
+from classifier import ContentClassifier
+from compression import Compressor
+from retrieval import RetrievalStats, TranscriptIndex, estimate_tokens
+from segments import parse_timestamp, detect_time_window
+from search import TranscriptSearch, fts5_available
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 
+# Bump whenever download/transcription changes would produce a different transcript
+PIPELINE_VERSION = '1'
+
+# Audio formats download_audio can produce:
+#   mp3    - the original 192 kbps MP3 transcode
+#   native - keep YouTube's own m4a/webm stream, no FFmpeg pass at all
+#   speech - transcode straight to 16 kHz mono Opus, all speech recognition needs
+# transcribe_audio probes the container itself, so it accepts any of them.
+AUDIO_MODES = {
+    'mp3': {
+        'format': 'bestaudio/best',
+        'codec': 'mp3',
+        'quality': '192',
+        'ffmpeg_args': [],
+        'extensions': ('.mp3',),
+    },
+    'native': {
+        'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
+        'codec': None,
+        'quality': None,
+        'ffmpeg_args': [],
+        'extensions': ('.m4a', '.webm', '.opus', '.mp4'),
+    },
+    'speech': {
+        'format': 'bestaudio/best',
+        'codec': 'opus',
+        'quality': '24',
+        # compression_level 0 keeps the Opus encoder cheaper than the MP3 path
+        'ffmpeg_args': ['-ar', '16000', '-ac', '1', '-compression_level', '0'],
+        'extensions': ('.opus',),
+    },
+}
+ALL_AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.webm', '.opus', '.mp4', '.ogg', '.wav')
+
+AUDIO_MODE = os.getenv('AUDIO_MODE', 'speech')
+if AUDIO_MODE not in AUDIO_MODES:
+    print(f"⚠️  Warning: unknown AUDIO_MODE '{AUDIO_MODE}', falling back to 'speech'")
+    AUDIO_MODE = 'speech'
+
+# Speech-to-text engine: 'google' (Cloud Speech-to-Text), 'offline' (local
+# stand-in for testing) or 'content' (title-based content analysis only)
+TRANSCRIPTION_ENGINE = os.getenv(
+    'TRANSCRIPTION_ENGINE',
+    'google' if os.getenv('GOOGLE_APPLICATION_CREDENTIALS') else 'content'
+)
+TRANSCRIPTION_WORKERS = int(os.getenv('TRANSCRIPTION_WORKERS', '4'))
+_transcription_engine = None
+
+# Content analysis (no speech engine, or no speech found) picks a category
+# from keyword rules scored over the title, tags and description
+CONTENT_RULES = os.getenv('CONTENT_RULES', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'content_rules.json'))
+content_classifier = ContentClassifier.load(CONTENT_RULES)
+
+# 'streaming' pipes the audio through FFmpeg into the speech engine as it
+# downloads, with at most STREAM_MAX_PENDING chunks buffered; 'staged'
+# downloads the whole file first. The content engine always uses 'staged'.
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'streaming')
+STREAM_MAX_PENDING = int(os.getenv('STREAM_MAX_PENDING', str(2 * TRANSCRIPTION_WORKERS)))
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Persistent transcript cache shared by all workers on this host
+CACHE_DIR = os.getenv('ASKVID_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'askvid-cache'))
+CACHE_DB = os.path.join(CACHE_DIR, 'cache.sqlite3')
+transcript_cache = DiskCache(
+    CACHE_DB,
+    namespace='transcripts',
+    max_bytes=int(os.getenv('TRANSCRIPT_CACHE_MAX_MB', '256')) * 1024 * 1024,
+    ttl=int(os.getenv('TRANSCRIPT_CACHE_TTL', str(7 * 24 * 3600))) or None
+)
+# Seconds to keep the content-analysis stand-in when the speech engine failed,
+# 0 to not cache it at all
+TRANSCRIPT_FALLBACK_TTL = int(os.getenv('TRANSCRIPT_FALLBACK_TTL', '300'))
+
+# Full-text search over every transcript ever produced. It lives in its own
+# database so entries survive transcript cache eviction.
+SEARCH_ENABLED = os.getenv('SEARCH_INDEX', '1') == '1' and fts5_available()
+MAX_SEARCH_RESULTS = int(os.getenv('MAX_SEARCH_RESULTS', '50'))
+search_index = TranscriptSearch(
+    os.getenv('SEARCH_DB', os.path.join(CACHE_DIR, 'search.sqlite3'))
+) if SEARCH_ENABLED else None
+
+# Preflight: video metadata is fetched (and cached by video ID) before any
+# media is downloaded, so over-limit videos are rejected up front. A limit of
+# 0 disables it. MIN_AUDIO_BITRATE is the lowest kbps stream worth transcribing.
+MAX_VIDEO_DURATION = int(os.getenv('MAX_VIDEO_DURATION', str(2 * 3600)))
+MAX_AUDIO_MB = int(os.getenv('MAX_AUDIO_MB', '200'))
+MIN_AUDIO_BITRATE = int(os.getenv('MIN_AUDIO_BITRATE', '48'))
+metadata_cache = DiskCache(
+    CACHE_DB,
+    namespace='metadata',
+    max_bytes=32 * 1024 * 1024,
+    ttl=int(os.getenv('METADATA_CACHE_TTL', '86400')) or None
+)
+
+# Failed downloads are classified and retried per strategy with bounded
+# exponential backoff; private/removed/geo-blocked videos fail immediately
+DOWNLOAD_MAX_ATTEMPTS = int(os.getenv('DOWNLOAD_MAX_ATTEMPTS', '4'))
+DOWNLOAD_BACKOFF_BASE = float(os.getenv('DOWNLOAD_BACKOFF_BASE', '0.5'))
+DOWNLOAD_BACKOFF_MAX = float(os.getenv('DOWNLOAD_BACKOFF_MAX', '4'))
+download_stats = DownloadStats()
+
+# Downloaded audio is kept per video and AUDIO_MODE so a failed transcription,
+# an engine change or a crash mid-download does not download it all again.
+# Workers on the host share one download per video; the least recently used
+# files are evicted once the store is over AUDIO_STORE_MAX_MB.
+AUDIO_STORE_ENABLED = os.getenv('AUDIO_STORE', '1') == '1'
+audio_store = AudioStore(
+    os.getenv('AUDIO_STORE_DIR', os.path.join(CACHE_DIR, 'audio')),
+    max_bytes=int(os.getenv('AUDIO_STORE_MAX_MB', '2048')) * 1024 * 1024,
+    lock_timeout=int(os.getenv('AUDIO_STORE_LOCK_TIMEOUT', '600'))
+) if AUDIO_STORE_ENABLED else None
+
+# Bounded pool that runs download + transcription off the request thread.
+# Job state is mirrored to the cache DB so any worker can answer a status poll.
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_WAIT_TIMEOUT = int(os.getenv('JOB_WAIT_TIMEOUT', '600'))
+job_queue = JobQueue(
+    max_workers=JOB_WORKERS,
+    result_ttl=int(os.getenv('JOB_RESULT_TTL', '3600')),
+    store=DiskCache(CACHE_DB, namespace='jobs', max_bytes=64 * 1024 * 1024)
+)
+
+# /process_batch runs at most BATCH_CONCURRENCY batch videos (across all
+# batches) through the job pool at once, leaving the other job workers for
+# interactive requests
+MAX_BATCH_ITEMS = int(os.getenv('MAX_BATCH_ITEMS', '50'))
+batch_runner = BatchRunner(
+    job_queue,
+    concurrency=int(os.getenv('BATCH_CONCURRENCY', str(max(1, JOB_WORKERS // 2)))),
+    store=DiskCache(CACHE_DB, namespace='batches', max_bytes=32 * 1024 * 1024),
+    result_ttl=int(os.getenv('JOB_RESULT_TTL', '3600')),
+    wait_timeout=JOB_WAIT_TIMEOUT
+)
+
+# Server-side transcript sessions, so clients send a handle instead of the
+# whole transcript with every question
+session_store = SessionStore(
+    DiskCache(CACHE_DB, namespace='sessions',
+              max_bytes=int(os.getenv('SESSION_DISK_MAX_MB', '256')) * 1024 * 1024, sliding=True),
+    max_bytes=int(os.getenv('SESSION_MAX_MB', '64')) * 1024 * 1024,
+    ttl=int(os.getenv('SESSION_TTL', '3600')),
+    index_options={
+        'window_words': int(os.getenv('RETRIEVAL_CHUNK_WORDS', '180')),
+        'overlap_words': int(os.getenv('RETRIEVAL_CHUNK_OVERLAP', '40')),
+    }
+)
+
+# Long transcripts only send the most relevant chunks to the model
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', '3000'))
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '6'))
+retrieval_stats = RetrievalStats()
+
+# Questions that name a time ("around 12:30", "minute 5") are answered from
+# that part of the transcript, padded by this many seconds on each side
+TIME_WINDOW_PADDING = float(os.getenv('TIME_WINDOW_PADDING', '60'))
+MAX_PHRASE_MATCHES = int(os.getenv('MAX_PHRASE_MATCHES', '50'))
+
+# Model used for answers and analyses; bump PROMPT_TEMPLATE_VERSION whenever a
+# prompt changes so cached responses from the old prompt are not served
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+PROMPT_TEMPLATE_VERSION = '1'
+
+# The structured analysis is produced once per transcript (eagerly after
+# processing when EAGER_ANALYSIS=1, never for batch items), served by
+# /analyze_topics and reused as compact context for questions
+EAGER_ANALYSIS = os.getenv('EAGER_ANALYSIS', '0') == '1'
+ANALYSIS_CONTEXT_BUDGET = int(os.getenv('ANALYSIS_CONTEXT_BUDGET', '1500'))
+analysis_queue = JobQueue(max_workers=int(os.getenv('ANALYSIS_WORKERS', '4')), result_ttl=60)
+
+# Cache of model responses keyed by model, prompt version, transcript and question
+response_cache = TieredCache(
+    MemoryCache(
+        max_bytes=int(os.getenv('LLM_CACHE_MAX_MB', '32')) * 1024 * 1024,
+        ttl=int(os.getenv('LLM_CACHE_TTL', '86400'))
+    ),
+    DiskCache(
+        CACHE_DB, namespace='responses',
+        max_bytes=int(os.getenv('LLM_CACHE_DISK_MAX_MB', '256')) * 1024 * 1024,
+        ttl=int(os.getenv('LLM_CACHE_TTL', '86400'))
+    ) if os.getenv('LLM_CACHE_DISK', '1') == '1' else None
+)
+
+# Long transcripts are registered once with Gemini's context cache so that
+# follow-up questions only send the question. The cached context expires
+# after the same period of inactivity as the transcript session. Caching
+# needs a model that supports it (usually a versioned name such as
+# gemini-1.5-flash-002) and a transcript of at least CONTEXT_CACHE_MIN_TOKENS.
+context_cache = ContextCache(
+    llm,
+    DiskCache(CACHE_DB, namespace='contexts', max_bytes=8 * 1024 * 1024),
+    model=os.getenv('CONTEXT_CACHE_MODEL', GEMINI_MODEL),
+    ttl=int(os.getenv('SESSION_TTL', '3600')),
+    min_tokens=int(os.getenv('CONTEXT_CACHE_MIN_TOKENS', '32768')),
+    refusal_ttl=int(os.getenv('CONTEXT_CACHE_REFUSAL_TTL', '600'))
+) if os.getenv('CONTEXT_CACHE', '1') == '1' else None
+
+# /ask_batch answers up to MAX_BATCH_QUESTIONS questions about one transcript
+# with a single model call; questions the response does not answer in the
+# expected format are asked individually
+MAX_BATCH_QUESTIONS = int(os.getenv('MAX_BATCH_QUESTIONS', '10'))
+
+# Prometheus-style metrics on /metrics. Per-stage timings are also sent in a
+# Server-Timing header on every response when TIMING_HEADER=1, or on requests
+# that send "X-Timing: 1".
+TIMING_HEADER = os.getenv('TIMING_HEADER', '0') == '1'
+
+# JSON and text responses of at least COMPRESS_MIN_BYTES are brotli- or
+# gzip-compressed for clients that accept it; COMPRESS=0 leaves that to a
+# reverse proxy. Static assets are linked with a fingerprint of their content
+# (?v=...) and cached by browsers for a year; index.html is revalidated.
+COMPRESS_ENABLED = os.getenv('COMPRESS', '1') == '1'
+compressor = Compressor(
+    min_bytes=int(os.getenv('COMPRESS_MIN_BYTES', '1024')),
+    gzip_level=int(os.getenv('COMPRESS_GZIP_LEVEL', '6')),
+    brotli_quality=int(os.getenv('COMPRESS_BROTLI_QUALITY', '5'))
+) if COMPRESS_ENABLED else None
+STATIC_MAX_AGE = 365 * 24 * 3600
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    'askvid_request_seconds', 'HTTP request latency', ('endpoint', 'method', 'status'))
+DOWNLOAD_ATTEMPT_SECONDS = metrics.REGISTRY.histogram(
+    'askvid_download_attempt_seconds', 'yt-dlp download attempts by strategy and outcome', ('strategy', 'outcome'))
+DOWNLOADED_BYTES = metrics.REGISTRY.counter(
+    'askvid_downloaded_bytes_total', 'Bytes of audio downloaded to disk', ('mode',))
+LLM_TOKENS = metrics.REGISTRY.counter(
+    'askvid_llm_tokens_total', 'Gemini tokens by call kind and direction', ('kind', 'direction'))
+CACHE_REQUESTS = metrics.REGISTRY.counter(
+    'askvid_cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result'))
+BATCH_ANSWERS = metrics.REGISTRY.counter(
+    'askvid_batch_answers_total', '/ask_batch answers by where they came from', ('source',))
+
+# Outbound Gemini calls share one scheduler per worker: at most
+# LLM_MAX_CONCURRENT at once, paced to LLM_RATE_LIMIT calls per minute (0 =
+# unpaced), with rate-limit errors retried after a jittered backoff. A call
+# that cannot start within LLM_QUEUE_TIMEOUT seconds is answered with 503.
+llm.configure_scheduler(
+    max_concurrent=int(os.getenv('LLM_MAX_CONCURRENT', '4')),
+    rate_per_minute=float(os.getenv('LLM_RATE_LIMIT', '0')),
+    burst=int(os.getenv('LLM_BURST', '0')) or None,
+    max_retries=int(os.getenv('LLM_MAX_RETRIES', '3')),
+    backoff_base=float(os.getenv('LLM_BACKOFF_BASE', '1')),
+    backoff_max=float(os.getenv('LLM_BACKOFF_MAX', '30')),
+    queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '60'))
+)
+
+def gevent_worker():
+    """True when running under a gevent worker (see gunicorn_async.py)"""
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('socket')
+
+# gRPC calls are invisible to gevent and would stall every request in the
+# worker, so gevent workers talk to Gemini over REST
+LLM_TRANSPORT = os.getenv('LLM_TRANSPORT') or ('rest' if gevent_worker() else None)
+
 # Configure Gemini AI
 gemini_api_key = os.getenv('GEMINI_API_KEY')
 if not gemini_api_key:
     print("⚠️  Warning: GEMINI_API_KEY environment variable not set!")
     print("   Please set your Gemini API key in a .env file or environment variable")
 else:
-    genai.configure(api_key=gemini_api_key)
+    llm.configure(gemini_api_key, LLM_TRANSPORT)
     print(f"🚀 Gemini AI configured successfully!")
     print(f"🔑 API Key: {gemini_api_key[:20]}...")
 
 # Configure Google Cloud Speech (using default credentials)
-print("🎤 Google Cloud Speech-to-Text configured!")
+if TRANSCRIPTION_ENGINE == 'google':
+    print("🎤 Google Cloud Speech-to-Text configured!")
+else:
+    print(f"🎤 Transcription engine: {TRANSCRIPTION_ENGINE}")
 
 def extract_video_id(url):
     """Extract YouTube video ID from URL"""
     patterns = [
         r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([^&\n?#]+)',
-        r'youtube\.com\/v\/([^&\n?#]+)'
+        r'youtube\.com\/(?:v|shorts|live)\/([^&\n?#\/]+)',
+        r'youtube\.com\/watch\?.*?[&?]v=([^&\n?#]+)'
     ]
     
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
+    with span('extract_video_id'):
+        for pattern in patterns:
+            match = re.search(pattern, url)
+            if match:
+                return match.group(1)
     return None
 
-def download_audio(url, output_path):
-    """Download audio from YouTube video"""
-    # Extract directory and filename
-    output_dir = os.path.dirname(output_path)
-    output_filename = os.path.basename(output_path)
+def canonical_video_url(video_id):
+    """The plain watch URL for a video, without playlist or tracking parameters"""
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def extract_video_info(ydl, url):
+    """Unprocessed yt-dlp info for a single video.
+
+    Extractors may answer with a `url` stub pointing at the real video
+    (notably for links that also carry list=); those are followed so callers
+    always see duration and formats, never a playlist.
+    """
+    info = ydl.extract_info(url, download=False, process=False)
+    for _ in range(3):
+        if info.get('_type') not in ('url', 'url_transparent'):
+            break
+        info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+    if info.get('_type') in ('playlist', 'multi_video', 'url', 'url_transparent'):
+        raise RuntimeError('The URL points to a playlist, not a single video')
+    return info
+
+def streaming_enabled():
+    """Whether videos are transcribed while they download"""
+    return PIPELINE_MODE == 'streaming' and TRANSCRIPTION_ENGINE != 'content'
+
+def is_playlist_url(url):
+    """A playlist link (as opposed to a video that happens to be in one)"""
+    return extract_video_id(url) is None and re.search(r'[?&]list=', url) is not None
+
+def expand_playlist(url, limit=None):
+    """Video URLs in a playlist, listed without extracting each video"""
+    import yt_dlp
+    
+    ydl_opts = {'extract_flat': 'in_playlist', 'quiet': True, 'http_headers': YDL_HTTP_HEADERS}
+    if limit:
+        ydl_opts['playlistend'] = limit
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    
+    return [f"https://www.youtube.com/watch?v={entry['id']}"
+            for entry in info.get('entries') or [] if entry and entry.get('id')]
+
+def transcript_cache_key(video_id):
+    """Cache key for a video's transcript under the current pipeline version"""
+    audio = 'stream' if streaming_enabled() else AUDIO_MODE
+    engine = TRANSCRIPTION_ENGINE
+    if engine == 'content':
+        # Editing the rules changes every content-analysis transcript
+        engine = f"content-{content_classifier.version}"
+    return f"{video_id}:v{PIPELINE_VERSION}:{audio}:{engine}"
+
+def get_transcription_engine():
+    """Return the configured speech engine, or None for content analysis only"""
+    global _transcription_engine
+    if TRANSCRIPTION_ENGINE == 'content':
+        return None
+    if _transcription_engine is None:
+        options = {'max_workers': TRANSCRIPTION_WORKERS}
+        if TRANSCRIPTION_ENGINE == 'google':
+            options['language_code'] = os.getenv('TRANSCRIPTION_LANGUAGE', 'en-US')
+        elif TRANSCRIPTION_ENGINE == 'offline':
+            options['latency'] = float(os.getenv('OFFLINE_TRANSCRIBE_LATENCY', '0'))
+        _transcription_engine = create_engine(TRANSCRIPTION_ENGINE, **options)
+    return _transcription_engine
+
+def audio_postprocessors(mode):
+    """yt-dlp postprocessor config for an audio mode (empty for native streams)"""
+    settings = AUDIO_MODES[mode]
+    if not settings['codec']:
+        return []
+    return [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': settings['codec'],
+        'preferredquality': settings['quality'],
+    }]
+
+# Add headers to avoid 403 errors
+YDL_HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+class VideoRejected(Exception):
+    """Preflight metadata puts a video over the configured limits"""
+    error_code = 'video_rejected'
+
+def failed_job_response(error, error_code, job_id, video_id=None):
+    """The response for a failed processing job; rejections answer 422 like the preflight does"""
+    if error_code == VideoRejected.error_code:
+        return jsonify({'error': error, 'code': error_code, 'video_id': video_id, 'job_id': job_id}), 422
+    return jsonify({'error': error, 'job_id': job_id}), 500
+
+def summarize_video_info(info):
+    """The parts of a yt-dlp info dict the pipeline needs, small enough to cache"""
+    audio_formats = []
+    for fmt in info.get('formats') or []:
+        # Audio-only streams; muxed video formats are never the cheap option
+        if fmt.get('vcodec') != 'none' or fmt.get('acodec') in (None, 'none'):
+            continue
+        audio_formats.append({
+            'format_id': fmt.get('format_id'),
+            'ext': fmt.get('ext'),
+            'acodec': fmt.get('acodec'),
+            'abr': fmt.get('abr') or fmt.get('tbr'),
+            'filesize': fmt.get('filesize') or fmt.get('filesize_approx'),
+            'protocol': fmt.get('protocol'),
+        })
+    
+    return {
+        'id': info.get('id'),
+        'title': info.get('title'),
+        'duration': info.get('duration'),
+        'is_live': bool(info.get('is_live')),
+        'uploader': info.get('uploader'),
+        'description': (info.get('description') or '')[:5000],
+        'tags': info.get('tags') or [],
+        'categories': info.get('categories') or [],
+        'audio_formats': audio_formats,
+    }
+
+def estimated_audio_bytes(audio_format, duration):
+    """Reported or bitrate-estimated download size of a format, if knowable"""
+    if audio_format.get('filesize'):
+        return audio_format['filesize']
+    if audio_format.get('abr') and duration:
+        return int(audio_format['abr'] * 1000 / 8 * duration)
+    return None
+
+def select_audio_format(metadata, mode=None):
+    """Pick the cheapest audio-only format that still meets MIN_AUDIO_BITRATE.
+
+    Returns None when the metadata lists no usable audio-only format, in
+    which case the download falls back to the mode's format selector.
+    """
+    settings = AUDIO_MODES[mode or AUDIO_MODE]
+    formats = [f for f in metadata.get('audio_formats') or []
+               if f.get('format_id') and f.get('protocol') != 'mhtml']
+    if not settings['codec']:
+        # Native mode keeps the stream as-is, so only containers we can read
+        formats = [f for f in formats if f'.{f.get("ext")}' in settings['extensions']]
+    if not formats:
+        return None
+    
+    duration = metadata.get('duration')
+    adequate = [f for f in formats if (f.get('abr') or 0) >= MIN_AUDIO_BITRATE]
+    if adequate:
+        return min(adequate, key=lambda f: (f['abr'], estimated_audio_bytes(f, duration) or 0))
+    # Nothing reaches the floor: take the best of what there is
+    return max(formats, key=lambda f: f.get('abr') or 0)
+
+def check_video_limits(metadata, audio_format=None):
+    """Raise VideoRejected if a video is live or over the duration/size limits"""
+    if metadata.get('is_live'):
+        raise VideoRejected('Live streams cannot be processed. Please try again once the broadcast has ended.')
+    
+    duration = metadata.get('duration')
+    if MAX_VIDEO_DURATION and duration and duration > MAX_VIDEO_DURATION:
+        raise VideoRejected(
+            f"Video is {format_timestamp(duration)} long; the limit is {format_timestamp(MAX_VIDEO_DURATION)}."
+        )
+    
+    size = estimated_audio_bytes(audio_format, duration) if audio_format else None
+    if MAX_AUDIO_MB and size and size > MAX_AUDIO_MB * 1024 * 1024:
+        raise VideoRejected(
+            f"Audio download would be about {size / 1024 / 1024:.0f} MB; the limit is {MAX_AUDIO_MB} MB."
+        )
+
+def probe_video(url, video_id=None):
+    """Preflight: fetch a video's metadata without downloading any media.
+
+    Returns (metadata, info). metadata is the compact summary cached by video
+    ID; info is the raw extraction, which download_audio reuses instead of
+    extracting again (None when the metadata came from the cache).
+    """
+    if video_id:
+        metadata = metadata_cache.get(video_id)
+        # Entries without a duration came from playlist stubs before they were resolved
+        if metadata is not None and not metadata.get('duration'):
+            metadata = None
+        CACHE_REQUESTS.inc(cache='metadata', result='miss' if metadata is None else 'hit')
+        if metadata is not None:
+            return metadata, None
+    
+    with span('probe'):
+        import yt_dlp
+        
+        ydl_opts = {'http_headers': YDL_HTTP_HEADERS, 'noplaylist': True, 'quiet': True}
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            # process=False skips format selection; download_audio does that
+            info = extract_video_info(ydl, url)
+    
+    metadata = summarize_video_info(info)
+    # Without these the limit checks cannot run, so never let them stick
+    if metadata['duration'] and info.get('formats'):
+        metadata_cache.set(video_id or metadata['id'], metadata)
+    return metadata, info
+
+def audio_extension(mode, audio_format=None):
+    """Extension of the file download_audio will produce"""
+    settings = AUDIO_MODES[mode]
+    if settings['codec']:
+        return f".{settings['codec']}"
+    if audio_format and audio_format.get('ext'):
+        return f".{audio_format['ext']}"
+    return settings['extensions'][0]
+
+def find_audio_file(base_path, extensions):
+    """Return base_path plus the first extension that was actually written"""
+    for extension in extensions:
+        if os.path.exists(base_path + extension):
+            return base_path + extension
+    return None
+
+def download_strategies(mode, audio_format=None):
+    """Ordered fallbacks for download_audio: preferred format, cheapest, untranscoded"""
+    settings = AUDIO_MODES[mode]
+    preferred = settings['format']
+    if audio_format:
+        # Fall back to the mode's selector inside the same attempt if the
+        # preflight format has disappeared
+        preferred = f"{audio_format['format_id']}/{preferred}"
+    
+    strategies = [
+        {'name': 'preferred', 'format': preferred, 'postprocess': bool(settings['codec']),
+         'extensions': settings['extensions']},
+        {'name': 'worst_audio', 'format': 'worstaudio/worst', 'postprocess': bool(settings['codec']),
+         'extensions': settings['extensions']},
+    ]
+    if settings['codec']:
+        strategies.append({'name': 'no_postprocess', 'format': 'bestaudio/best', 'postprocess': False,
+                           'extensions': ALL_AUDIO_EXTENSIONS})
+    return strategies
+
+def download_audio(url, output_path, mode=None, info=None, audio_format=None):
+    """Download audio from YouTube video in the configured AUDIO_MODE.
+
+    The video is extracted once (or not at all when probe_video's info is
+    passed in) and every fallback strategy reuses that extraction; only a 403
+    triggers a fresh one, since it usually means the stream URLs expired.
+    audio_format from select_audio_format replaces the mode's generic format
+    selector. yt-dlp writes to output_path's stem, so the file name is known
+    up front. Raises DownloadFailed when no strategy works.
+    """
+    mode = mode or AUDIO_MODE
+    settings = AUDIO_MODES[mode]
+    
+    # yt-dlp is slow to import, so only load it when a download actually happens
+    import yt_dlp
+    
+    base_path = os.path.splitext(output_path)[0]
+    extracted = {'info': info}
+    
+    def attempt(strategy, refresh):
+        """Run one strategy; returns the original filename or None"""
+        ydl_opts = {
+            'format': strategy['format'],
+            'outtmpl': base_path + '.%(ext)s',
+            'postprocessors': audio_postprocessors(mode) if strategy['postprocess'] else [],
+            'postprocessor_args': {'extractaudio': settings['ffmpeg_args']},
+            'http_headers': YDL_HTTP_HEADERS,
+            'noplaylist': True,
+            # Pick up a .part file left by an interrupted download
+            'continuedl': True,
+            'quiet': True,
+            'noprogress': True,
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            if extracted['info'] is None or refresh:
+                extracted['info'] = extract_video_info(ydl, url)
+            # Processing mutates the info dict, so each attempt gets a copy
+            result = ydl.process_ie_result(copy.deepcopy(extracted['info']), download=True)
+        
+        downloaded_file = find_audio_file(
+            base_path, (os.path.splitext(output_path)[1],) + tuple(strategy['extensions'])
+        )
+        if not downloaded_file:
+            return None
+        if downloaded_file != output_path:
+            os.replace(downloaded_file, output_path)
+        return f"{(result or {}).get('title') or 'audio'}{os.path.splitext(downloaded_file)[1]}"
+    
+    def observe(strategy, seconds, error_class):
+        DOWNLOAD_ATTEMPT_SECONDS.observe(seconds, strategy=strategy, outcome=error_class or 'ok')
+    
+    with span('download'):
+        original_filename = run_strategies(
+            download_strategies(mode, audio_format), attempt,
+            max_attempts=DOWNLOAD_MAX_ATTEMPTS, backoff_base=DOWNLOAD_BACKOFF_BASE,
+            backoff_max=DOWNLOAD_BACKOFF_MAX, stats=download_stats, on_attempt=observe
+        )
+    DOWNLOADED_BYTES.inc(os.path.getsize(output_path), mode=mode)
+    return True, original_filename
+
+def resolve_audio_stream(url, info=None, audio_format=None):
+    """Direct media URL, request headers and title of the audio stream to transcribe"""
+    import yt_dlp
     
     ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
-        # Add headers to avoid 403 errors
-        'http_headers': {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        },
-        # Add more robust error handling
-        'ignoreerrors': False,
-        'no_warnings': False,
-        'verbose': True,  # Add verbose output for debugging
+        'format': download_strategies(AUDIO_MODE, audio_format)[0]['format'],
+        'http_headers': YDL_HTTP_HEADERS,
+        'noplaylist': True,
+        'quiet': True,
     }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        if info is None:
+            info = extract_video_info(ydl, url)
+        selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+    
+    stream = selected if selected.get('url') else (selected.get('requested_formats') or [{}])[0]
+    if not stream.get('url'):
+        raise RuntimeError('No direct audio stream URL available')
+    return stream['url'], stream.get('http_headers') or {}, selected.get('title')
+
+def stream_transcribe(url, video_id, info=None, audio_format=None):
+    """Transcribe a video while its audio is still downloading.
+
+    FFmpeg reads the selected stream straight from YouTube and writes 16 kHz
+    mono PCM to a pipe that the speech engine consumes chunk by chunk, so
+    nothing is written to disk. Partial transcripts are published as job
+    progress. Returns (segments, title).
+    """
+    engine = get_transcription_engine()
+    with span('resolve_stream'):
+        source, headers, title = resolve_audio_stream(url, info, audio_format)
+    
+    partial = []
+    def publish(segment):
+        partial.append(segment)
+        job_queue.report_progress(video_id, {
+            'stage': 'transcribing',
+            'segments': len(partial),
+            'audio_seconds': segment['end'],
+            'partial_transcript': join_segments(partial),
+        })
     
+    process = subprocess.Popen(pcm_stream_command(source, headers),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-            
-            # Find the downloaded file
-            downloaded_files = [f for f in os.listdir(output_dir) if f.endswith('.mp3')]
-            if downloaded_files:
-                # Get original filename before renaming
-                original_filename = downloaded_files[0]
-                # Rename to expected filename
-                downloaded_file = os.path.join(output_dir, original_filename)
-                os.rename(downloaded_file, output_path)
-                return True, original_filename
-            else:
-                print("No MP3 file found after download")
-                return False, None
-                
-    except Exception as e:
-        print(f"First attempt failed: {str(e)}")
-        try:
-            # Try with different format if first attempt fails
-            ydl_opts['format'] = 'worstaudio/worst'
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-                
-                # Find the downloaded file
-                downloaded_files = [f for f in os.listdir(output_dir) if f.endswith('.mp3')]
-                if downloaded_files:
-                    original_filename = downloaded_files[0]
-                    downloaded_file = os.path.join(output_dir, original_filename)
-                    os.rename(downloaded_file, output_path)
-                    return True, original_filename
-                else:
-                    print("No MP3 file found after second attempt")
-                    return False, None
-                    
-        except Exception as e2:
-            print(f"Second attempt failed: {str(e2)}")
-            # Try without postprocessors
-            ydl_opts.pop('postprocessors', None)
-            ydl_opts['format'] = 'bestaudio'
-            try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([url])
-                    
-                    # Find the downloaded file
-                    downloaded_files = [f for f in os.listdir(output_dir) if f.endswith(('.mp3', '.webm', '.m4a'))]
-                    if downloaded_files:
-                        original_filename = downloaded_files[0]
-                        downloaded_file = os.path.join(output_dir, original_filename)
-                        os.rename(downloaded_file, output_path)
-                        return True, original_filename
-                    else:
-                        print("No audio file found after third attempt")
-                        return False, None
-                        
-            except Exception as e3:
-                print(f"Third attempt failed: {str(e3)}")
-                return False, None
+        with span('stream_transcribe'):
+            segments = engine.transcribe_stream(process.stdout, on_segment=publish,
+                                                max_pending=STREAM_MAX_PENDING)
+        _, stderr = process.communicate()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg exited with {process.returncode}: {stderr.decode(errors='replace').strip()}")
+    return segments, title
 
-def transcribe_audio(audio_path, video_id=None, original_filename=None):
-    """Transcribe audio using smart content analysis and enhanced mock transcripts"""
+def transcribe_audio_segments(audio_path, video_id=None, original_filename=None):
+    """Transcribe audio into timestamped (segments, fallback) with the configured engine.
 
+    Falls back to content analysis of the title when no speech engine is
+    configured or the engine fails. fallback is True when a configured engine
+    produced nothing, so the result stands in for a transcript a retry may get.
+    """
     try:
         print(f"Processing video ID: {video_id}")
         print(f"Original filename: {original_filename}")
@@ -136,65 +686,61 @@ def transcribe_audio(audio_path, video_id=None, original_filename=None):
         # Check if audio file exists
         if not os.path.exists(audio_path):
             print(f"Audio file not found: {audio_path}")
-            return "Audio file not found for transcription."
+            return [{'start': 0.0, 'end': None, 'text': "Audio file not found for transcription."}], True
         
-        # Enhanced content analysis based on filename and video ID
-        if original_filename:
-            filename_lower = original_filename.lower()
-            
-            
-            # Music videos with detailed mock transcripts
-            if any(word in filename_lower for word in ["music", "song", "singer", "album", "track", "lyrics", "sahiba", "jasleen", "royal", "vijay", "vededa"]):
-                if "sahiba" in filename_lower or "jasleen" in filename_lower:
-                    return "This is the song 'Sahiba' by Jasleen Royal featuring Vijay Deverakonda and Radhikka Madan. The lyrics include romantic verses about love and relationships. The song has a melodious tune with emotional vocals by Jasleen Royal. The music video shows romantic scenes between the lead actors. The chorus includes phrases like 'Sahiba, tujhe pata hai kya' and romantic dialogues throughout the song."
-                elif "vededa" in filename_lower:
-                    return "This is the song 'Vededa Nadagu' which appears to be a Telugu or South Indian song. The audio contains traditional Indian music elements with classical instruments. The song likely includes lyrics in Telugu language with traditional musical composition. The audio features classical Indian vocals and instrumental music typical of South Indian film songs."
-                else:
-                    return f"This appears to be a music video titled '{original_filename}'. The audio contains songs, lyrics, and musical performances. The content includes audio tracks and possibly music videos with visual elements. The song features vocals, instrumental music, and possibly background music typical of music videos."
-            
-            # Educational/Tutorial videos with detailed mock transcripts
-            elif any(word in filename_lower for word in ["tutorial", "guide", "how to", "learn", "course", "lesson", "portfolio", "website", "html", "css", "coding", "programming", "development", "beginner", "project"]):
-                if "portfolio" in filename_lower and "website" in filename_lower:
-                    return "This tutorial teaches how to build a stunning portfolio website using AI, HTML, and CSS. The instructor explains step-by-step how to create a modern portfolio website. Topics covered include HTML structure, CSS styling, responsive design, and using AI tools to enhance the development process. The tutorial shows how to create navigation menus, hero sections, about pages, project showcases, and contact forms. The instructor demonstrates coding techniques and best practices for web development."
-                elif "medical" in filename_lower and "coding" in filename_lower:
-                    return "This video is about medical coding, a high-demand course that guarantees job placement in 3 months. The instructor explains medical coding concepts, terminology, and industry requirements. Topics covered include ICD-10 codes, CPT codes, medical billing procedures, and healthcare documentation. The course promises to teach students how to work with medical records, insurance claims, and healthcare data. The instructor discusses career opportunities in the medical coding field and certification requirements."
-                else:
-                    return f"This appears to be an educational video titled '{original_filename}'. The content includes tutorials, explanations, and instructional material. The video provides step-by-step guidance and educational content. Topics covered include various learning objectives and practical demonstrations."
-            
-            # Professional/Career videos
-            elif any(word in filename_lower for word in ["interview", "internship", "job", "career", "placement", "preparation", "google", "company", "professional"]):
-                return f"This appears to be a professional or career-related video titled '{original_filename}'. The content includes information about jobs, internships, career advice, and professional development. The video likely covers interview preparation, job search strategies, and industry insights."
-            
-            # Entertainment videos
-            elif any(word in filename_lower for word in ["movie", "film", "show", "series", "episode", "comedy", "drama", "entertainment"]):
-                return f"This appears to be an entertainment video titled '{original_filename}'. The content includes entertainment material, shows, movies, or other media content. The video features various entertainment elements and storytelling."
-            
-            # Default for unknown content
-            else:
-                return f"This video titled '{original_filename}' contains various content including speech, music, and other audio elements. The transcript shows the actual words spoken in the video. The content appears to be educational or entertainment-based with mixed audio content."
+        engine = get_transcription_engine()
+        if engine is not None:
+            try:
+                with span('transcribe'):
+                    segments = engine.transcribe(audio_path)
+                if segments:
+                    return segments, False
+                print(f"{engine.name} engine found no speech, falling back to content analysis")
+            except Exception as e:
+                print(f"{engine.name} transcription failed, falling back to content analysis: {str(e)}")
         
-        else:
-            # Fallback for when filename is not available
-            return "This video contains various content including speech, music, and other audio elements. The transcript shows the actual words spoken in the video. The content appears to be educational or entertainment-based."
+        metadata = metadata_cache.get(video_id) if video_id else None
+        return [{'start': 0.0, 'end': None, 'text': content_transcript(original_filename, metadata)}], engine is not None
             
     except Exception as e:
         print(f"Transcription error: {str(e)}")
-        return "Audio content detected but transcription failed due to technical issues."
+        return [{'start': 0.0, 'end': None, 'text': "Audio content detected but transcription failed due to technical issues."}], True
 
-def get_ai_answer(question, transcript):
-    """Get AI answer using Gemini AI with enhanced analysis"""
-    try:
-        # Initialize Gemini model
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Enhanced prompt for detailed analysis
-        prompt = f"""You are an expert AI tutor and content analyst. Based on the video transcript, provide comprehensive analysis and detailed answers.
+def transcribe_audio(audio_path, video_id=None, original_filename=None):
+    """Transcribe audio to plain text"""
+    return join_segments(transcribe_audio_segments(audio_path, video_id, original_filename)[0])
 
-Transcript: {transcript}
+def content_transcript(original_filename, metadata=None):
+    """Content analysis from the video's title, tags and description when there is no speech transcript"""
+    metadata = metadata or {}
+    return content_classifier.describe(original_filename, metadata.get('description'), metadata.get('tags'))
 
-Question: {question}
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return ' '.join(question.lower().split()).rstrip('?!. ')
+
+def response_cache_key(kind, transcript, question=''):
+    """Cache key for a model response to (transcript, question) under the current prompts"""
+    parts = [
+        GEMINI_MODEL,
+        PROMPT_TEMPLATE_VERSION,
+        kind,
+        f"{RETRIEVAL_TOKEN_BUDGET}:{RETRIEVAL_TOP_K}",
+        hashlib.sha256(transcript.encode('utf-8')).hexdigest(),
+        normalize_question(question),
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
 
-Please provide a structured response with:
+def answer_cache_kind(analysis=None, window=None):
+    """Response cache kind for an answer built with the given context"""
+    if window:
+        return f"answer@{window['start']:g}-{window['end']:g}"
+    return 'answer+analysis' if analysis else 'answer'
+
+ANSWER_ROLE = ("You are an expert AI tutor and content analyst. Based on the video transcript, "
+               "provide comprehensive analysis and detailed answers.")
+
+ANSWER_FORMAT = """Please provide a structured response with:
 
 **📋 MAIN POINTS:**
 • List the key topics and main points covered
@@ -222,16 +768,434 @@ Please provide a structured response with:
 • Key learning objectives achieved
 
 Format with clear bullet points and structured sections for easy reading."""
+
+# Instructions registered with a cached context, ahead of the transcript
+ANSWER_SYSTEM_INSTRUCTION = f"{ANSWER_ROLE}\n\n{ANSWER_FORMAT}"
+
+def select_transcript(query, transcript, index=None, budget=None, top_k=None):
+    """(label, text): the whole transcript, or the chunks of it most relevant to query"""
+    if index is None:
+        return 'Transcript', transcript
+    transcript, report = index.select(query, budget or RETRIEVAL_TOKEN_BUDGET, top_k or RETRIEVAL_TOP_K)
+    retrieval_stats.record(report)
+    print(f"Prompt context: {report['full_tokens']} -> {report['context_tokens']} tokens "
+          f"({report['strategy']}, {report['chunks_used']}/{report['chunks_total']} chunks)")
+    if report['strategy'] != 'full':
+        return 'Transcript excerpts (most relevant parts, in order)', transcript
+    return 'Transcript', transcript
+
+def format_analysis_context(analysis):
+    """The structured analysis as a prompt section, or '' when there is none"""
+    if not analysis:
+        return ''
+    return f"Video analysis (prepared earlier from the full transcript):\n{analysis}\n\n"
+
+def build_answer_prompt(question, transcript, index=None, analysis=None, window=None):
+    """Build the Q&A prompt.
+
+    With a retrieval index, long transcripts are cut down to the chunks most
+    relevant to the question first. When the transcript's structured analysis
+    is available it is sent as compact context, with a smaller excerpt budget.
+    A time window ({'start', 'end', 'text'}) replaces both with the
+    timestamped segments from that part of the video.
+    """
+    if window:
+        transcript = window['text']
+        analysis = None
+        index = TranscriptIndex(transcript) if estimate_tokens(transcript) > RETRIEVAL_TOKEN_BUDGET else None
+    budget = ANALYSIS_CONTEXT_BUDGET if analysis else RETRIEVAL_TOKEN_BUDGET
+    transcript_label, transcript = select_transcript(question, transcript, index, budget)
+    if window and transcript_label == 'Transcript':
+        transcript_label = (f"Transcript from {format_timestamp(window['start'])} to "
+                            f"{format_timestamp(window['end'])} (answer about this part of the video)")
+    
+    # Enhanced prompt for detailed analysis
+    prompt = f"""{ANSWER_ROLE}
+
+{format_analysis_context(analysis)}{transcript_label}: {transcript}
+
+Question: {question}
+
+{ANSWER_FORMAT}"""
+    return prompt
+
+def build_context_prompt(question, analysis=None):
+    """The Q&A prompt sent on top of a cached context that already holds the transcript"""
+    return f"{format_analysis_context(analysis)}Question: {question}"
+
+def answer_context(transcript):
+    """The transcript's cached model context, or None when it is sent inline"""
+    if context_cache is None or not gemini_api_key:
+        return None
+    return context_cache.get(
+        transcript_id_for(transcript),
+        ANSWER_SYSTEM_INSTRUCTION,
+        f"Transcript: {transcript}",
+        estimate_tokens(transcript)
+    )
+
+def answer_request(question, transcript, index=None, analysis=None, window=None):
+    """(prompt, context) for a question; context is None when the transcript is sent inline"""
+    context = None if window else answer_context(transcript)
+    if context:
+        return build_context_prompt(question, analysis), context
+    return build_answer_prompt(question, transcript, index, analysis, window), None
+
+BATCH_ANSWER_HEADING = re.compile(r'^[ \t]*#{1,4}[ \t]*\**[ \t]*Answer[ \t]+(\d+)\b.*$', re.M | re.I)
+
+def batch_instructions(questions):
+    """The numbered questions of a batch and how to mark each answer"""
+    numbered = '\n'.join(f"{number}. {question}" for number, question in enumerate(questions, 1))
+    return f"""Answer each of the following {len(questions)} questions separately:
+
+{numbered}
+
+Begin each answer with a line containing only "### Answer N", where N is the question's number, and answer the questions in order."""
+
+def build_batch_prompt(questions, transcript, index=None, analysis=None):
+    """Build one prompt for several questions, with context selected for all of them"""
+    # Each question may need a different part of the transcript
+    scale = min(len(questions), 3)
+    budget = (ANALYSIS_CONTEXT_BUDGET if analysis else RETRIEVAL_TOKEN_BUDGET) * scale
+    transcript_label, transcript = select_transcript(' '.join(questions), transcript, index,
+                                                     budget, RETRIEVAL_TOP_K * scale)
+    return f"""{ANSWER_ROLE}
+
+{format_analysis_context(analysis)}{transcript_label}: {transcript}
+
+{batch_instructions(questions)} Structure each answer as follows.
+
+{ANSWER_FORMAT}"""
+
+def batch_request(questions, transcript, index=None, analysis=None):
+    """(prompt, context) for a batch of questions, as answer_request"""
+    context = answer_context(transcript)
+    if context:
+        return f"{format_analysis_context(analysis)}{batch_instructions(questions)}", context
+    return build_batch_prompt(questions, transcript, index, analysis), None
+
+def parse_batch_answers(text, count):
+    """{number: answer} for the "### Answer N" sections of a batch response.
+
+    Numbers outside 1..count, repeated headings and empty sections are
+    ignored, so the caller can ask whatever is missing again.
+    """
+    headings = list(BATCH_ANSWER_HEADING.finditer(text))
+    answers = {}
+    for i, heading in enumerate(headings):
+        number = int(heading.group(1))
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        answer = text[heading.end():end].strip()
+        if 1 <= number <= count and answer and number not in answers:
+            answers[number] = answer
+    return answers
+
+def build_analysis_prompt(transcript):
+    """Build the full topic-analysis prompt"""
+    # Special prompt for comprehensive topic analysis
+    prompt = f"""You are an expert content analyst. Provide a comprehensive analysis of this video transcript:
+
+Transcript: {transcript}
+
+Please provide a detailed analysis with clear bullet points:
+
+**📋 MAIN TOPICS COVERED:**
+• List all major topics and themes discussed
+• Identify the primary subject matter
+• Highlight key areas of focus
+• Break down main categories of content
+
+**🎯 KEY POINTS & INSIGHTS:**
+• Extract the most important points made
+• Identify critical information and facts
+• Highlight valuable insights and takeaways
+• List specific details and examples
+
+**📚 DETAILED BREAKDOWN:**
+• Provide a thorough explanation of each major topic
+• Include specific details, examples, and explanations
+• Cover all significant content areas
+• Explain concepts step by step
+
+**💡 PRACTICAL APPLICATIONS:**
+• What can viewers learn or apply from this content?
+• Identify actionable information and lessons
+• Highlight practical value and benefits
+• List specific skills or knowledge gained
+
+**📖 COMPREHENSIVE SUMMARY:**
+• Overall summary of the video content
+• Main message or purpose of the video
+• Key learning objectives achieved
+• Final takeaways and conclusions
+
+Format with clear bullet points (•) for each item and structured sections for easy reading."""
+    return prompt
+
+def parse_analysis_sections(analysis):
+    """Split an analysis into [{'title', 'content'}] on its **HEADING:** lines"""
+    sections = []
+    for match in re.finditer(r'\*\*([^*\n]+?):?\*\*\s*\n(.*?)(?=\n\s*\*\*[^*\n]+?:?\*\*\s*\n|\Z)', analysis, re.S):
+        sections.append({'title': match.group(1).strip(' :'), 'content': match.group(2).strip()})
+    return sections
+
+def record_token_usage(kind, prompt, response_text, usage=None):
+    """Count fresh prompt, cached context and response tokens, estimating when the API reports none.
+
+    Returns the counts as {'prompt_tokens', 'cached_tokens', 'response_tokens'}.
+    """
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or estimate_tokens(prompt)
+    response_tokens = getattr(usage, 'candidates_token_count', 0) or estimate_tokens(response_text)
+    # Tokens served from a cached context are part of prompt_token_count
+    cached_tokens = getattr(usage, 'cached_content_token_count', 0) or 0
+    if cached_tokens:
+        LLM_TOKENS.inc(cached_tokens, kind=kind, direction='cached')
+    LLM_TOKENS.inc(prompt_tokens - cached_tokens, kind=kind, direction='prompt')
+    LLM_TOKENS.inc(response_tokens, kind=kind, direction='response')
+    return {'prompt_tokens': prompt_tokens - cached_tokens, 'cached_tokens': cached_tokens,
+            'response_tokens': response_tokens}
+
+def add_usage(total, counts):
+    """Add one model call's token counts to a running total"""
+    total['model_calls'] = total.get('model_calls', 0) + 1
+    for name, value in counts.items():
+        total[name] = total.get(name, 0) + value
+
+def cached_analysis(transcript):
+    """The transcript's structured analysis if it has already been produced"""
+    return response_cache.get(response_cache_key('analysis', transcript))
+
+def generate_analysis(transcript):
+    """Produce (or fetch) the structured analysis for a transcript"""
+    cache_key = response_cache_key('analysis', transcript)
+    cached = response_cache.get(cache_key)
+    CACHE_REQUESTS.inc(cache='responses', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        return cached
+    
+    prompt = build_analysis_prompt(transcript)
+    
+    # Generate comprehensive analysis
+    with span('analysis'):
+        response = llm.generate(GEMINI_MODEL, prompt)
+    record_token_usage('analysis', prompt, response.text, getattr(response, 'usage_metadata', None))
+    response_cache.set(cache_key, response.text)
+    return response.text
+
+def get_structured_analysis(session):
+    """Return (analysis, cached), sharing one model call per transcript.
+
+    Concurrent callers, including the eager job started after processing,
+    attach to the same in-flight analysis.
+    """
+    cached = cached_analysis(session.transcript)
+    if cached is not None:
+        return cached, True
+    
+    job, _ = analysis_queue.submit(f"analysis:{session.id}", generate_analysis, session.transcript)
+    job.wait(JOB_WAIT_TIMEOUT)
+    if isinstance(job.exception, llm.LLMUnavailable):
+        # Every waiter gets its own copy so each can report 503 + Retry-After
+        raise llm.LLMUnavailable(str(job.exception), job.exception.retry_after) from job.exception
+    if job.status != 'done':
+        raise RuntimeError(job.error or 'Analysis timed out')
+    return job.result, False
+
+def generate_answer(prompt, context, transcript, build_inline):
+    """(prompt, response) from the model, resending inline if the cached context fails"""
+    try:
+        return prompt, llm.generate(GEMINI_MODEL, prompt, context=context)
+    except llm.LLMUnavailable:
+        raise
+    except Exception as e:
+        if not context:
+            raise
+        # The provider may have dropped the context early; fall back to inline
+        print(f"Cached context failed, sending the transcript inline: {str(e)}")
+        context_cache.expire(transcript_id_for(transcript))
+        prompt = build_inline()
+        return prompt, llm.generate(GEMINI_MODEL, prompt)
+
+def get_ai_answer(question, transcript, index=None, analysis=None, window=None, usage=None):
+    """Get AI answer using Gemini AI with enhanced analysis.
+
+    Token counts of the model call, if one is made, are added to usage.
+    """
+    try:
+        # Identical questions about the same transcript skip the model call
+        cache_key = response_cache_key(answer_cache_kind(analysis, window), transcript, question)
+        cached = response_cache.get(cache_key)
+        CACHE_REQUESTS.inc(cache='responses', result='miss' if cached is None else 'hit')
+        if cached is not None:
+            return cached
+        
+        prompt, context = answer_request(question, transcript, index, analysis, window)
         
         # Generate response
-        response = model.generate_content(prompt)
+        with span('answer'):
+            prompt, response = generate_answer(
+                prompt, context, transcript,
+                lambda: build_answer_prompt(question, transcript, index, analysis, window)
+            )
+        counts = record_token_usage('answer', prompt, response.text, getattr(response, 'usage_metadata', None))
+        if usage is not None:
+            add_usage(usage, counts)
+        response_cache.set(cache_key, response.text)
         return response.text
+    except llm.LLMUnavailable:
+        # Overload is the caller's to report (503), not part of the answer
+        raise
     except Exception as e:
         return f"Error getting AI answer: {str(e)}"
 
+def get_batch_answers(questions, transcript, index=None, analysis=None):
+    """Answer several questions about one transcript, in one model call where possible.
+
+    Cached answers are reused and repeated questions asked once; the rest go
+    out in a single prompt. Questions the response does not answer under
+    their "### Answer N" heading are asked individually. Returns
+    ([{'question', 'answer', 'source'}], usage).
+    """
+    usage = {'model_calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'response_tokens': 0}
+    kind = answer_cache_kind(analysis)
+    results = []
+    pending = {}
+    for question in questions:
+        cache_key = response_cache_key(kind, transcript, question)
+        if cache_key in pending:
+            pending[cache_key].append(len(results))
+            results.append({'question': question, 'answer': None, 'source': 'batch'})
+            continue
+        cached = response_cache.get(cache_key)
+        CACHE_REQUESTS.inc(cache='responses', result='miss' if cached is None else 'hit')
+        if cached is None:
+            pending[cache_key] = [len(results)]
+        else:
+            BATCH_ANSWERS.inc(source='cache')
+        results.append({'question': question, 'answer': cached, 'source': 'cache'})
+    
+    def resolve(positions, answer, source):
+        for position in positions:
+            results[position].update(answer=answer, source=source)
+            BATCH_ANSWERS.inc(source=source)
+    
+    if len(pending) > 1:
+        batch = [results[positions[0]]['question'] for positions in pending.values()]
+        parsed = {}
+        try:
+            prompt, context = batch_request(batch, transcript, index, analysis)
+            with span('answer_batch'):
+                prompt, response = generate_answer(
+                    prompt, context, transcript,
+                    lambda: build_batch_prompt(batch, transcript, index, analysis)
+                )
+            add_usage(usage, record_token_usage('answer_batch', prompt, response.text,
+                                                getattr(response, 'usage_metadata', None)))
+            parsed = parse_batch_answers(response.text, len(batch))
+        except llm.LLMUnavailable:
+            raise
+        except Exception as e:
+            print(f"Batch answer failed, asking individually: {str(e)}")
+        
+        unanswered = {}
+        for number, (cache_key, positions) in enumerate(pending.items(), 1):
+            answer = parsed.get(number)
+            if answer is None:
+                unanswered[cache_key] = positions
+                continue
+            response_cache.set(cache_key, answer)
+            resolve(positions, answer, 'batch')
+        if unanswered:
+            print(f"Batch response answered {len(pending) - len(unanswered)}/{len(pending)} questions, "
+                  f"asking the rest individually")
+        pending = unanswered
+    
+    for positions in pending.values():
+        question = results[positions[0]]['question']
+        resolve(positions, get_ai_answer(question, transcript, index, analysis, usage=usage), 'individual')
+    return results, usage
+
+def llm_unavailable_response(error):
+    """503 telling the client when to retry a call the model scheduler could not make"""
+    response = jsonify({'error': str(error), 'code': 'llm_unavailable'})
+    if error.retry_after:
+        response.headers['Retry-After'] = str(int(error.retry_after))
+    return response, 503
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    response = make_response(render_template('index.html'))
+    # The page links fingerprinted assets, so it must be revalidated, not cached blind
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+_static_fingerprints = {}
+
+def static_fingerprint(filename):
+    """Short content hash of a static file, or None when it does not exist"""
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _static_fingerprints.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.sha256(f.read()).hexdigest()[:12])
+        _static_fingerprints[path] = cached
+    return cached[1]
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    """url_for('static', ...) links carry ?v=<content hash>, so a changed file gets a new URL"""
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        fingerprint = static_fingerprint(values['filename'])
+        if fingerprint:
+            values['v'] = fingerprint
+
+def payload_etag(video_id, *parts):
+    """Weak ETag for a transcript-derived payload: video ID, pipeline version and a content digest"""
+    digest = hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()[:16]
+    return f"{video_id or 'transcript'}-v{PIPELINE_VERSION}-{digest}"
+
+def conditional_json(payload, etag):
+    """JSON response with an ETag; a GET that already has this version gets 304"""
+    response = jsonify(payload)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+def transcript_etag(result):
+    """ETag of a pipeline result; transcript_id is already a hash of the transcript"""
+    return payload_etag(result.get('video_id'), result['transcript_id'])
+
+def index_transcript(video_id, transcript, transcript_id, title=None):
+    """Add a transcript to the search index; failures never fail the request"""
+    if search_index is None:
+        return
+    try:
+        search_index.add(video_id, transcript, transcript_id, title)
+    except Exception as e:
+        print(f"Could not index transcript for {video_id}: {str(e)}")
+
+def cached_video_result(video_id, record=True):
+    """A finished pipeline result for a video from the transcript cache, or None.
+
+    record=False skips the hit/miss metrics, for re-checks of a lookup the
+    request already counted.
+    """
+    cached = transcript_cache.get(transcript_cache_key(video_id), record=record)
+    if record:
+        CACHE_REQUESTS.inc(cache='transcripts', result='hit' if cached else 'miss')
+    if not cached:
+        return None
+    session = session_store.create(cached['transcript'], video_id, cached.get('segments'))
+    # Transcripts cached before the search index existed get indexed on their next hit
+    title = cached.get('title') or (metadata_cache.get(video_id) or {}).get('title') or cached.get('original_filename')
+    index_transcript(video_id, cached['transcript'], session.id, title)
+    return {'transcript': cached['transcript'], 'transcript_id': session.id,
+            'video_id': video_id, 'cached': True}
 
 @app.route('/process_video', methods=['POST'])
 def process_video():
@@ -247,114 +1211,590 @@ def process_video():
         if not video_id:
             return jsonify({'error': 'Invalid YouTube URL'}), 400
         
-        # Create temporary directory for audio
-        with tempfile.TemporaryDirectory() as temp_dir:
-            audio_path = os.path.join(temp_dir, 'audio.mp3')
-            
+        # Serve repeat requests straight from the transcript cache
+        cached = cached_video_result(video_id)
+        if cached:
+            return conditional_json(dict(cached, success=True), transcript_etag(cached))
+        
+        # Videos already known to be over the limits never reach the job queue
+        metadata = metadata_cache.get(video_id)
+        if metadata is not None:
+            try:
+                check_video_limits(metadata, select_audio_format(metadata, AUDIO_MODE))
+            except VideoRejected as e:
+                return jsonify({'error': str(e), 'code': VideoRejected.error_code, 'video_id': video_id}), 422
+        
+        # Queue the download + transcription; concurrent requests for the
+        # same video attach to the job that is already running
+        job, created = job_queue.submit(video_id, run_video_pipeline, video_url, video_id)
+        
+        # Callers that cannot poll may ask to block until the job finishes
+        if data.get('wait'):
+            local_job = job_queue.get_job(job.id)
+            if local_job and local_job.wait(JOB_WAIT_TIMEOUT):
+                if local_job.status == 'failed':
+                    return failed_job_response(local_job.error, local_job.error_code, job.id, video_id)
+                return conditional_json(dict(local_job.result, success=True, job_id=job.id),
+                                        transcript_etag(local_job.result))
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'video_id': video_id,
+            'deduplicated': not created,
+            'status_url': f'/jobs/{job.id}'
+        }), 202
+    
+    except Exception as e:
+        return jsonify({'error': f'Error processing video: {str(e)}'}), 500
+
+def run_video_pipeline(video_url, video_id, eager_analysis=True):
+    """Download and transcribe a video, caching the transcript (runs on the job pool).
+
+    eager_analysis=False never starts the structured analysis, even with
+    EAGER_ANALYSIS=1; batches use it so a playlist does not cost one full
+    analysis per video that nobody may ask about.
+    """
+    cache_key = transcript_cache_key(video_id)
+    
+    # Another worker may have finished this video while we were queued; the
+    # caller's own lookup already counted the miss
+    cached = cached_video_result(video_id, record=False)
+    if cached:
+        return cached
+    
+    # Work from the plain watch URL: links that also name a playlist would
+    # otherwise be extracted as the playlist
+    video_url = canonical_video_url(video_id)
+    
+    # Preflight: reject over-limit videos before downloading anything
+    try:
+        metadata, info = probe_video(video_url, video_id)
+    except Exception as e:
+        raise RuntimeError(f'Could not read video information: {str(e)}')
+    audio_format = select_audio_format(metadata, AUDIO_MODE)
+    check_video_limits(metadata, audio_format)
+    
+    audio_name = f"{AUDIO_MODE}{audio_extension(AUDIO_MODE, audio_format)}"
+    segments, fallback = None, False
+    # Audio already on disk is cheaper to transcribe than to stream again
+    stored = audio_store is not None and audio_store.has(video_id, audio_name)
+    if streaming_enabled() and not stored:
+        try:
+            segments, original_filename = stream_transcribe(video_url, video_id, info, audio_format)
+            if not segments:
+                segments = [{'start': 0.0, 'end': None, 'text': content_transcript(original_filename, metadata)}]
+                fallback = True
+        except Exception as e:
+            print(f"Streaming transcription failed, falling back to a full download: {str(e)}")
+            segments = None
+    
+    if segments is None:
+        def download(audio_path):
             # Download audio and get original filename
-            download_success, original_filename = download_audio(video_url, audio_path)
+            download_success, original_filename = download_audio(
+                video_url, audio_path, info=info, audio_format=audio_format
+            )
             
             # Check if audio file was created
             if not download_success or not os.path.exists(audio_path):
-                return jsonify({'error': 'Failed to download audio from video. Please try a different YouTube URL.'}), 500
-            
-            # Transcribe audio
-            transcript = transcribe_audio(audio_path, video_id, original_filename)
-            
-            return jsonify({
-                'success': True,
-                'transcript': transcript,
-                'video_id': video_id
-            })
+                raise RuntimeError('Failed to download audio from video. Please try a different YouTube URL.')
+            return original_filename
+        
+        if audio_store is not None:
+            with audio_store.checkout(video_id, audio_name, download) as (audio_path, original_filename):
+                if original_filename is None:
+                    # Stored by an earlier run; name it as download_audio would
+                    original_filename = f"{metadata.get('title') or 'audio'}{os.path.splitext(audio_path)[1]}"
+                segments, fallback = transcribe_audio_segments(audio_path, video_id, original_filename)
+        else:
+            # Create temporary directory for audio
+            with tempfile.TemporaryDirectory() as temp_dir:
+                audio_path = os.path.join(temp_dir, video_id + audio_extension(AUDIO_MODE, audio_format))
+                original_filename = download(audio_path)
+                
+                # Transcribe audio
+                segments, fallback = transcribe_audio_segments(audio_path, video_id, original_filename)
+    
+    transcript = join_segments(segments)
+    # The video's own title: original_filename carries the download's extension
+    # on the staged path but not when streaming
+    title = metadata.get('title') or original_filename
+    
+    # A stand-in for a failed transcription is only kept briefly, so the next
+    # request soon retries instead of serving it for the full TTL
+    if not fallback or TRANSCRIPT_FALLBACK_TTL:
+        transcript_cache.set(cache_key, {
+            'transcript': transcript,
+            'segments': segments,
+            'video_id': video_id,
+            'original_filename': original_filename,
+            'title': title,
+            'pipeline_version': PIPELINE_VERSION
+        }, ttl=TRANSCRIPT_FALLBACK_TTL if fallback else None)
+    
+    session = session_store.create(transcript, video_id, segments)
+    session.index  # build the retrieval index now, off the request path
+    index_transcript(video_id, transcript, session.id, title)
+    if EAGER_ANALYSIS and eager_analysis and gemini_api_key and not fallback:
+        analysis_queue.submit(f"analysis:{session.id}", generate_analysis, transcript)
+    return {'transcript': transcript, 'transcript_id': session.id,
+            'video_id': video_id, 'cached': False}
+
+def run_batch_item(video_url, video_id):
+    """run_video_pipeline for one video of a batch"""
+    return run_video_pipeline(video_url, video_id, eager_analysis=False)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a processing job; the transcript is included once it is done"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(dict(job, success=True))
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Return a finished job's result, or 202 while it is still running"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] == 'failed':
+        return failed_job_response(job['error'], job.get('error_code'), job_id, job.get('key'))
+    if job['status'] != 'done':
+        return jsonify({'success': True, 'job_id': job_id, 'status': job['status'],
+                        'progress': job.get('progress')}), 202
+    return conditional_json(dict(job['result'], success=True, job_id=job_id), transcript_etag(job['result']))
+
+@app.route('/transcripts/<video_id>', methods=['GET'])
+def get_transcript(video_id):
+    """A processed video's transcript; 404 until /process_video has produced it"""
+    cached = cached_video_result(video_id)
+    if cached is None:
+        return jsonify({'error': 'Transcript not found. Process the video first.', 'video_id': video_id}), 404
+    return conditional_json(dict(cached, success=True), transcript_etag(cached))
+
+@app.route('/process_batch', methods=['POST'])
+def process_batch():
+    """Process a list of video URLs and/or playlists in the background"""
+    try:
+        data = request.get_json() or {}
+        urls = data.get('urls') or []
+        if isinstance(urls, str):
+            urls = [urls]
+        if data.get('playlist_url'):
+            urls = [data['playlist_url']] + list(urls)
+        
+        if not urls:
+            return jsonify({'error': 'No video URLs provided'}), 400
+        
+        # Expand playlists and drop invalid URLs and repeated videos
+        items, invalid, seen = [], [], set()
+        duplicates = 0
+        for url in urls:
+            if not isinstance(url, str):
+                invalid.append({'url': url, 'error': 'Not a URL'})
+                continue
+            video_urls = [url]
+            if is_playlist_url(url):
+                try:
+                    video_urls = expand_playlist(url, MAX_BATCH_ITEMS)
+                except Exception as e:
+                    invalid.append({'url': url, 'error': f'Could not read playlist: {str(e)}'})
+                    continue
+            for video_url in video_urls:
+                video_id = extract_video_id(video_url)
+                if not video_id:
+                    invalid.append({'url': video_url, 'error': 'Invalid YouTube URL'})
+                elif video_id in seen:
+                    duplicates += 1
+                else:
+                    seen.add(video_id)
+                    items.append({'video_id': video_id, 'url': video_url})
+        
+        if not items:
+            return jsonify({'error': 'No valid YouTube URLs provided', 'invalid': invalid}), 400
+        
+        truncated = max(0, len(items) - MAX_BATCH_ITEMS)
+        batch = batch_runner.start(items[:MAX_BATCH_ITEMS], run_batch_item, lookup=cached_video_result)
+        
+        return jsonify({
+            'success': True,
+            'batch_id': batch.id,
+            'total': len(batch.items),
+            'duplicates': duplicates,
+            'truncated': truncated,
+            'invalid': invalid,
+            'status_url': f'/batches/{batch.id}'
+        }), 202
     
     except Exception as e:
-        return jsonify({'error': f'Error processing video: {str(e)}'}), 500
+        return jsonify({'error': f'Error processing batch: {str(e)}'}), 500
+
+@app.route('/batches/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    """Aggregate progress of a batch plus each video's status and transcript_id"""
+    batch = batch_runner.get(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(dict(batch, success=True))
+
+@app.route('/search', methods=['GET'])
+def search_transcripts():
+    """Ranked videos whose title or transcript match ?q=, with snippets"""
+    try:
+        if search_index is None:
+            return jsonify({'error': 'Transcript search is not enabled on this server'}), 503
+        
+        query = (request.args.get('q') or '').strip()
+        if not query:
+            return jsonify({'error': 'Query is required'}), 400
+        
+        try:
+            # SQLite reads a negative LIMIT as no limit at all
+            limit = max(1, min(int(request.args.get('limit', 20)), MAX_SEARCH_RESULTS))
+            offset = max(0, int(request.args.get('offset', 0)))
+        except ValueError:
+            return jsonify({'error': 'limit and offset must be integers'}), 400
+        with span('search'):
+            results = search_index.search(query, limit, offset)
+        return jsonify({
+            'success': True,
+            'query': query,
+            'results': results
+        })
+    
+    except Exception as e:
+        return jsonify({'error': f'Error searching transcripts: {str(e)}'}), 500
+
+def resolve_session(data):
+    """Find the transcript session for a request.
+
+    Accepts a transcript_id handle from process_video, or the raw transcript
+    for older clients (which registers a session so they can switch over).
+    Returns (session, error_response).
+    """
+    transcript_id = data.get('transcript_id')
+    transcript = data.get('transcript')
+    
+    if transcript_id:
+        session = session_store.get(transcript_id)
+        if session is not None:
+            return session, None
+        if not transcript:
+            return None, (jsonify({
+                'error': 'Transcript session expired. Please resend the transcript.',
+                'code': 'transcript_expired'
+            }), 410)
+    
+    if not transcript:
+        return None, None
+    return session_store.create(transcript), None
+
+def question_window(session, data, question):
+    """The part of the video a question is about, or None for the whole video.
+
+    Uses explicit start/end from the request (seconds or "M:SS"), otherwise a
+    time mentioned in the question itself. Transcripts without timestamps
+    always use the whole video. Raises ValueError for malformed times.
+    """
+    timeline = session.timeline
+    if not timeline.timed:
+        return None
+    
+    start, end = data.get('start'), data.get('end')
+    if start is None and end is None:
+        detected = detect_time_window(question, TIME_WINDOW_PADDING)
+        if detected is None:
+            return None
+        start, end = detected
+    start = parse_timestamp(start) if start is not None else 0.0
+    end = parse_timestamp(end) if end is not None else timeline.duration
+    if end <= start:
+        raise ValueError('end must be after start')
+    
+    text = timeline.excerpt(start, end)
+    if not text:
+        return None
+    return {'start': start, 'end': end, 'text': text}
 
 @app.route('/ask_question', methods=['POST'])
 def ask_question():
     try:
         data = request.get_json()
         question = data.get('question')
-        transcript = data.get('transcript')
+        session, error = resolve_session(data)
+        if error:
+            return error
         
-        if not question or not transcript:
+        if not question or not session:
             return jsonify({'error': 'Question and transcript are required'}), 400
         
+        try:
+            window = question_window(session, data, question)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid time range: {str(e)}'}), 400
+        
         # Get AI answer
-        answer = get_ai_answer(question, transcript)
+        analysis = None if window else cached_analysis(session.transcript)
+        try:
+            answer = get_ai_answer(question, session.transcript, session.index, analysis, window)
+        except llm.LLMUnavailable as e:
+            return llm_unavailable_response(e)
         
-        return jsonify({
+        result = {
             'success': True,
-            'answer': answer
-        })
+            'answer': answer,
+            'transcript_id': session.id
+        }
+        if window:
+            result['window'] = {'start': window['start'], 'end': window['end']}
+        return jsonify(result)
     
     except Exception as e:
         return jsonify({'error': f'Error processing question: {str(e)}'}), 500
 
-@app.route('/analyze_topics', methods=['POST'])
-def analyze_topics():
-    """Get detailed topic analysis and main points from video"""
+@app.route('/ask_batch', methods=['POST'])
+def ask_batch():
+    """Answer a list of questions about one transcript, in one model call where possible"""
     try:
         data = request.get_json()
-        transcript = data.get('transcript')
+        questions = data.get('questions')
+        session, error = resolve_session(data)
+        if error:
+            return error
         
-        if not transcript:
-            return jsonify({'error': 'Transcript is required'}), 400
+        if not isinstance(questions, list) or not questions or not session:
+            return jsonify({'error': 'A list of questions and a transcript are required'}), 400
+        questions = [question.strip() for question in questions if isinstance(question, str) and question.strip()]
+        if not questions:
+            return jsonify({'error': 'Questions must be non-empty strings'}), 400
+        if len(questions) > MAX_BATCH_QUESTIONS:
+            return jsonify({'error': f'At most {MAX_BATCH_QUESTIONS} questions per request'}), 400
         
-        # Initialize Gemini model
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        analysis = cached_analysis(session.transcript)
+        try:
+            answers, usage = get_batch_answers(questions, session.transcript, session.index, analysis)
+        except llm.LLMUnavailable as e:
+            return llm_unavailable_response(e)
         
-        # Special prompt for comprehensive topic analysis
-        prompt = f"""You are an expert content analyst. Provide a comprehensive analysis of this video transcript:
-
-Transcript: {transcript}
-
-Please provide a detailed analysis with clear bullet points:
-
-**📋 MAIN TOPICS COVERED:**
-• List all major topics and themes discussed
-• Identify the primary subject matter
-• Highlight key areas of focus
-• Break down main categories of content
-
-**🎯 KEY POINTS & INSIGHTS:**
-• Extract the most important points made
-• Identify critical information and facts
-• Highlight valuable insights and takeaways
-• List specific details and examples
+        return jsonify({
+            'success': True,
+            'answers': answers,
+            'usage': usage,
+            'transcript_id': session.id
+        })
+    
+    except Exception as e:
+        return jsonify({'error': f'Error processing questions: {str(e)}'}), 500
 
-**📚 DETAILED BREAKDOWN:**
-• Provide a thorough explanation of each major topic
-• Include specific details, examples, and explanations
-• Cover all significant content areas
-• Explain concepts step by step
+def session_timeline(data):
+    """Resolve a request's session and its timestamped segments.
 
-**💡 PRACTICAL APPLICATIONS:**
-• What can viewers learn or apply from this content?
-• Identify actionable information and lessons
-• Highlight practical value and benefits
-• List specific skills or knowledge gained
+    Returns (session, timeline, error_response).
+    """
+    session, error = resolve_session(data)
+    if error:
+        return None, None, error
+    if not session:
+        return None, None, (jsonify({'error': 'Transcript is required'}), 400)
+    timeline = session.timeline
+    if not timeline.timed:
+        return None, None, (jsonify({
+            'error': 'This transcript has no timestamps.',
+            'code': 'no_timestamps'
+        }), 422)
+    return session, timeline, None
 
-**📖 COMPREHENSIVE SUMMARY:**
-• Overall summary of the video content
-• Main message or purpose of the video
-• Key learning objectives achieved
-• Final takeaways and conclusions
+@app.route('/transcript_range', methods=['POST'])
+def transcript_range():
+    """Timestamped segments between start and end (seconds or "M:SS")"""
+    try:
+        data = request.get_json()
+        session, timeline, error = session_timeline(data)
+        if error:
+            return error
+        
+        try:
+            start = parse_timestamp(data.get('start', 0))
+            end = parse_timestamp(data['end']) if data.get('end') is not None else timeline.duration
+        except ValueError as e:
+            return jsonify({'error': f'Invalid time range: {str(e)}'}), 400
+        
+        segments = timeline.time_range(start, end)
+        return jsonify({
+            'success': True,
+            'transcript_id': session.id,
+            'start': start,
+            'end': end,
+            'segments': segments,
+            'text': ' '.join(segment['text'] for segment in segments)
+        })
+    
+    except Exception as e:
+        return jsonify({'error': f'Error reading transcript range: {str(e)}'}), 500
 
-Format with clear bullet points (•) for each item and structured sections for easy reading."""
+@app.route('/find_phrase', methods=['POST'])
+def find_phrase():
+    """Where in the video a phrase is said, as timestamps with snippets"""
+    try:
+        data = request.get_json()
+        phrase = (data.get('phrase') or '').strip()
+        session, timeline, error = session_timeline(data)
+        if error:
+            return error
         
-        # Generate comprehensive analysis
-        response = model.generate_content(prompt)
+        if not phrase:
+            return jsonify({'error': 'Phrase is required'}), 400
         
+        limit = min(int(data.get('limit', 20)), MAX_PHRASE_MATCHES)
+        matches = timeline.search(phrase, limit)
+        for match in matches:
+            match['timestamp'] = format_timestamp(match['start'])
         return jsonify({
             'success': True,
-            'analysis': response.text
+            'transcript_id': session.id,
+            'phrase': phrase,
+            'matches': matches
         })
     
+    except Exception as e:
+        return jsonify({'error': f'Error searching transcript: {str(e)}'}), 500
+
+@app.route('/analyze_topics', methods=['GET', 'POST'])
+def analyze_topics():
+    """Get detailed topic analysis and main points from video.
+
+    GET /analyze_topics?transcript_id=... is a cacheable fetch of the same thing.
+    """
+    try:
+        data = request.args if request.method == 'GET' else request.get_json()
+        session, error = resolve_session(data)
+        if error:
+            return error
+        
+        if not session:
+            return jsonify({'error': 'Transcript is required'}), 400
+        
+        try:
+            analysis, cached = get_structured_analysis(session)
+        except llm.LLMUnavailable as e:
+            return llm_unavailable_response(e)
+        
+        return conditional_json({
+            'success': True,
+            'analysis': analysis,
+            'sections': parse_analysis_sections(analysis),
+            'transcript_id': session.id,
+            'cached': cached
+        }, payload_etag(session.video_id, GEMINI_MODEL, PROMPT_TEMPLATE_VERSION, analysis))
+    
     except Exception as e:
         return jsonify({'error': f'Error analyzing topics: {str(e)}'}), 500
         return jsonify({'error': f'Error getting answer: {str(e)}'}), 500
 
+def sse_event(data, event=None):
+    """Format one server-sent event"""
+    message = f"event: {event}\n" if event else ''
+    return message + f"data: {json.dumps(data)}\n\n"
+
+def stream_model_response(cache_key, build_request, transcript_id, kind='answer'):
+    """Stream a model response as server-sent events.
+
+    build_request() returns (prompt, cached context name or None). Emits
+    `data: {"text": ...}` for each generated piece, then `event: done` (or
+    `event: error`). Cached responses are sent as a single piece; complete
+    streamed responses are added to the cache.
+    """
+    def generate():
+        cached = response_cache.get(cache_key)
+        CACHE_REQUESTS.inc(cache='responses', result='miss' if cached is None else 'hit')
+        if cached is not None:
+            yield sse_event({'text': cached})
+            yield sse_event({'cached': True, 'transcript_id': transcript_id}, event='done')
+            return
+        
+        context, pieces = None, []
+        try:
+            prompt, context = build_request()
+            with span(f'{kind}_stream'), llm.stream(GEMINI_MODEL, prompt, context) as response:
+                for chunk in response:
+                    text = chunk.text
+                    if text:
+                        pieces.append(text)
+                        yield sse_event({'text': text})
+            record_token_usage(kind, prompt, ''.join(pieces), getattr(response, 'usage_metadata', None))
+            response_cache.set(cache_key, ''.join(pieces))
+            yield sse_event({'cached': False, 'transcript_id': transcript_id}, event='done')
+        except llm.LLMUnavailable as e:
+            yield sse_event({'error': str(e), 'code': 'llm_unavailable'}, event='error')
+        except Exception as e:
+            if context and not pieces:
+                # Most likely an expired context; the next request sends the transcript inline
+                context_cache.expire(transcript_id)
+            yield sse_event({'error': str(e)}, event='error')
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/ask_question/stream', methods=['POST'])
+def ask_question_stream():
+    """Streaming variant of /ask_question (server-sent events)"""
+    try:
+        data = request.get_json()
+        question = data.get('question')
+        session, error = resolve_session(data)
+        if error:
+            return error
+        
+        if not question or not session:
+            return jsonify({'error': 'Question and transcript are required'}), 400
+        
+        try:
+            window = question_window(session, data, question)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid time range: {str(e)}'}), 400
+        
+        analysis = None if window else cached_analysis(session.transcript)
+        return stream_model_response(
+            response_cache_key(answer_cache_kind(analysis, window), session.transcript, question),
+            lambda: answer_request(question, session.transcript, session.index, analysis, window),
+            session.id
+        )
+    
+    except Exception as e:
+        return jsonify({'error': f'Error processing question: {str(e)}'}), 500
+
+@app.route('/analyze_topics/stream', methods=['POST'])
+def analyze_topics_stream():
+    """Streaming variant of /analyze_topics (server-sent events)"""
+    try:
+        data = request.get_json()
+        session, error = resolve_session(data)
+        if error:
+            return error
+        
+        if not session:
+            return jsonify({'error': 'Transcript is required'}), 400
+        
+        # Let an in-flight eager analysis finish rather than generating it twice
+        job = analysis_queue.inflight(f"analysis:{session.id}")
+        if job is not None:
+            job.wait(JOB_WAIT_TIMEOUT)
+        
+        return stream_model_response(
+            response_cache_key('analysis', session.transcript),
+            lambda: (build_analysis_prompt(session.transcript), None),
+            session.id,
+            kind='analysis'
+        )
+    
+    except Exception as e:
+        return jsonify({'error': f'Error analyzing topics: {str(e)}'}), 500
+
 @app.route('/test_download', methods=['POST'])
 def test_download():
     """Test endpoint to check if yt-dlp is working"""
@@ -363,17 +1803,136 @@ def test_download():
         test_url = data.get('url', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ')
         
         with tempfile.TemporaryDirectory() as temp_dir:
-            audio_path = os.path.join(temp_dir, 'test.mp3')
-            success = download_audio(test_url, audio_path)
+            audio_path = os.path.join(temp_dir, 'test' + AUDIO_MODES[AUDIO_MODE]['extensions'][0])
+            try:
+                success, _ = download_audio(test_url, audio_path)
+                error_class = None
+            except DownloadFailed as e:
+                success, error_class = False, e.error_class
             
             return jsonify({
                 'success': success,
                 'file_exists': os.path.exists(audio_path),
+                'error_class': error_class,
                 'url': test_url
             })
     
     except Exception as e:
         return jsonify({'error': f'Test failed: {str(e)}'}), 500
 
+def is_admin_request():
+    """Check the admin token header against ADMIN_TOKEN"""
+    return bool(ADMIN_TOKEN) and request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+
+@app.route('/admin/cache', methods=['GET', 'DELETE'])
+def admin_cache():
+    """Show transcript cache stats, or clear the whole cache"""
+    if not is_admin_request():
+        return jsonify({'error': 'Admin token required'}), 403
+    
+    if request.method == 'DELETE':
+        removed = transcript_cache.clear()
+        return jsonify({'success': True, 'removed': removed})
+    
+    return jsonify({
+        'success': True,
+        'transcripts': transcript_cache.stats(),
+        'jobs': job_queue.stats(),
+        'sessions': session_store.stats()
+    })
+
+@app.route('/admin/stats', methods=['GET'])
+def admin_stats():
+    """Cache, job, session and prompt-size statistics for this worker"""
+    if not is_admin_request():
+        return jsonify({'error': 'Admin token required'}), 403
+    
+    return jsonify({
+        'success': True,
+        'transcripts': transcript_cache.stats(),
+        'metadata': metadata_cache.stats(),
+        'downloads': download_stats.stats(),
+        'jobs': job_queue.stats(),
+        'batches': batch_runner.stats(),
+        'analysis_jobs': analysis_queue.stats(),
+        'sessions': session_store.stats(),
+        'retrieval': retrieval_stats.stats(),
+        'responses': response_cache.stats(),
+        'models': llm.stats(),
+        'contexts': context_cache.stats() if context_cache is not None else None,
+        'audio': audio_store.stats() if audio_store is not None else None,
+        'search': search_index.stats() if search_index is not None else None,
+        'compression': compressor.stats() if compressor is not None else None,
+        'startup': STARTUP_STATS
+    })
+
+@app.route('/admin/cache/<video_id>', methods=['DELETE'])
+def admin_invalidate_video(video_id):
+    """Drop every cached transcript for a video, across pipeline versions, its metadata, audio and search entry"""
+    if not is_admin_request():
+        return jsonify({'error': 'Admin token required'}), 403
+    
+    removed = transcript_cache.delete_prefix(f"{video_id}:")
+    metadata_cache.delete(video_id)
+    if audio_store is not None:
+        audio_store.remove(video_id)
+    if search_index is not None:
+        search_index.remove(video_id)
+    return jsonify({'success': True, 'video_id': video_id, 'removed': removed})
+
+# Startup timing: module import, and latency of the first request served
+STARTUP_STATS = {'import_seconds': round(time.perf_counter() - _import_started, 4)}
+_first_request_lock = threading.Lock()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.timing_header = TIMING_HEADER or request.headers.get('X-Timing') == '1'
+    if g.timing_header:
+        metrics.start_request_timing()
+    else:
+        metrics.request_timings()  # drop spans left by a request that errored out
+
+@app.after_request
+def record_first_request(response):
+    if 'first_request_seconds' not in STARTUP_STATS:
+        with _first_request_lock:
+            if 'first_request_seconds' not in STARTUP_STATS:
+                STARTUP_STATS['first_request_seconds'] = round(time.perf_counter() - g.request_started, 4)
+                STARTUP_STATS['first_request_path'] = request.path
+    return response
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    if g.get('timing_header'):
+        response.headers['Server-Timing'] = metrics.server_timing_header(metrics.request_timings(), elapsed)
+    return response
+
+@app.after_request
+def cache_static_assets(response):
+    """Fingerprinted static URLs never change, so browsers may keep them for a year"""
+    if request.endpoint == 'static':
+        filename = (request.view_args or {}).get('filename')
+        if filename and request.args.get('v') == static_fingerprint(filename):
+            response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.after_request
+def compress_response(response):
+    # Registered last so it runs first; request timing then includes compression
+    if compressor is not None:
+        compressor.apply(response, request.accept_encodings)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text-format metrics for this worker process"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001) 
\ No newline at end of file
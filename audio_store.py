@@ -0,0 +1,255 @@
+"""
+Persistent store for downloaded audio.
+
+Audio used to be downloaded into a temporary directory that disappeared with
+the request, so a transcription retry, a settings change or a worker crash
+meant downloading the whole file again. AudioStore keeps one file per video
+and audio mode under a directory shared by every worker on the host:
+
+    <root>/<video_id>.<name>            finished artifacts
+    <root>/<video_id>.<name>.lock       per-artifact lock files
+    <root>/partial/<video_id>.<name>/   downloads in progress
+
+A download runs in its partial directory and the result is moved into place
+with an atomic rename, so readers never see a half-written file. The partial
+directory survives a crash, letting yt-dlp resume its .part file next time.
+An exclusive flock() around the download makes concurrent workers wait for
+one download instead of racing. Readers of a stored file only ever take a
+shared lock, so they never wait on each other, and eviction (least recently
+used first, once the store is over its quota) never deletes a file that is in
+use.
+"""
+
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No flock() on this platform: concurrent downloads of a video are not shared
+    fcntl = None
+
+
+class AudioStore:
+    """Downloaded audio keyed by (video ID, format name), shared across processes"""
+
+    def __init__(self, root, max_bytes=2 * 1024 * 1024 * 1024, lock_timeout=600,
+                 stale_seconds=24 * 3600, poll_interval=0.2):
+        self.root = root
+        self.partial_root = os.path.join(root, 'partial')
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        self.stale_seconds = stale_seconds
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'resumed': 0, 'waited': 0, 'evicted': 0,
+                          'evicted_bytes': 0}
+        os.makedirs(self.partial_root, exist_ok=True)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def path(self, video_id, name):
+        """Where the finished artifact for (video_id, name) lives"""
+        # Video IDs come from URLs; never let one climb out of the store
+        safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', video_id)
+        return os.path.join(self.root, f"{safe_id}.{name}")
+
+    def has(self, video_id, name):
+        return os.path.exists(self.path(video_id, name))
+
+    def _acquire(self, fd, mode, give_up=None):
+        """flock() fd, polling so a gevent worker keeps serving while it waits.
+
+        Returns whether it had to wait, or None without the lock if give_up()
+        became true first.
+        """
+        if fcntl is None:
+            return False
+        deadline = time.monotonic() + self.lock_timeout
+        waited = False
+        while True:
+            try:
+                fcntl.flock(fd, mode | fcntl.LOCK_NB)
+                return waited
+            except BlockingIOError:
+                if give_up is not None and give_up():
+                    return None
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for {self.lock_timeout}s on an audio download")
+                waited = True
+                time.sleep(self.poll_interval)
+
+    @contextmanager
+    def checkout(self, video_id, name, download):
+        """Yield (path, result) for an artifact, downloading it first if needed.
+
+        download(target) must write the file at target, a path inside the
+        artifact's partial directory, and may return a value that is passed
+        back as result (None when the artifact was already stored). The file
+        is protected from eviction until the with block ends.
+        """
+        final = self.path(video_id, name)
+        fd = os.open(final + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while True:
+                # Readers share the lock, so a stored file never waits on
+                # another reader; only a download in progress holds it alone
+                if self._acquire(fd, fcntl.LOCK_SH if fcntl else 0):
+                    self._count('waited')
+                result = None
+                if os.path.exists(final):
+                    self._count('hits')
+                    # mtime is the LRU clock
+                    os.utime(final)
+                    break
+
+                # Missing: download under the exclusive lock. Converting the
+                # lock is not atomic, so another worker may store the file
+                # first; then read it under a shared lock instead.
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                waited = self._acquire(fd, fcntl.LOCK_EX if fcntl else 0,
+                                       give_up=lambda: os.path.exists(final))
+                if waited is not False:
+                    self._count('waited')
+                if waited is None:
+                    continue
+                if os.path.exists(final):
+                    self._count('hits')
+                    os.utime(final)
+                else:
+                    result = self._download(final, download)
+                # Eviction needs the file exclusively; check it survived the
+                # switch back to a shared lock
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_SH)
+                if os.path.exists(final):
+                    break
+            yield final, result
+        finally:
+            os.close(fd)
+
+    def _download(self, final, download):
+        """Run download into the partial directory and move the result into place"""
+        staging = os.path.join(self.partial_root, os.path.basename(final))
+        if os.path.isdir(staging) and os.listdir(staging):
+            self._count('resumed')
+        os.makedirs(staging, exist_ok=True)
+        target = os.path.join(staging, os.path.basename(final))
+        # A finished-looking target left by a crash may be truncated output
+        if os.path.exists(target):
+            os.remove(target)
+        self._count('misses')
+
+        result = download(target)
+        os.replace(target, final)
+        shutil.rmtree(staging, ignore_errors=True)
+        self.enforce_quota(keep=final)
+        return result
+
+    def _try_exclusive(self, path):
+        """Open and exclusively lock path's lock file without waiting; None if busy"""
+        fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+        return fd
+
+    def _entries(self):
+        """(mtime, bytes, path) for finished artifacts and (..., dir) for partial downloads"""
+        artifacts, partials = [], []
+        # Other workers add and remove files while this runs
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.endswith('.lock'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                artifacts.append((stat.st_mtime, stat.st_size, entry.path))
+        for entry in os.scandir(self.partial_root):
+            if entry.is_dir():
+                try:
+                    size, mtime = 0, entry.stat().st_mtime
+                    for child in os.scandir(entry.path):
+                        stat = child.stat()
+                        size += stat.st_size
+                        mtime = max(mtime, stat.st_mtime)
+                except FileNotFoundError:
+                    continue
+                partials.append((mtime, size, entry.path))
+        return artifacts, partials
+
+    def enforce_quota(self, keep=None):
+        """Drop abandoned partial downloads, then least recently used artifacts over max_bytes"""
+        artifacts, partials = self._entries()
+        total = sum(size for _, size, _ in artifacts) + sum(size for _, size, _ in partials)
+
+        now = time.time()
+        for mtime, size, path in partials:
+            if now - mtime < self.stale_seconds:
+                continue
+            fd = self._try_exclusive(os.path.join(self.root, os.path.basename(path)))
+            if fd is None:
+                continue
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+            finally:
+                os.close(fd)
+
+        if not self.max_bytes or total <= self.max_bytes:
+            return
+        for mtime, size, path in sorted(artifacts):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            fd = self._try_exclusive(path)
+            if fd is None:
+                continue
+            # Lock files stay: a waiter may already hold this one open
+            try:
+                os.remove(path)
+                total -= size
+                self._count('evicted')
+                self._count('evicted_bytes', size)
+            except FileNotFoundError:
+                pass
+            finally:
+                os.close(fd)
+
+    def remove(self, video_id):
+        """Delete every stored artifact of a video that is not in use; returns how many"""
+        prefix = os.path.basename(self.path(video_id, ''))
+        removed = 0
+        for entry in os.scandir(self.root):
+            if not entry.is_file() or not entry.name.startswith(prefix) or entry.name.endswith('.lock'):
+                continue
+            fd = self._try_exclusive(entry.path)
+            if fd is None:
+                continue
+            try:
+                os.remove(entry.path)
+                removed += 1
+            finally:
+                os.close(fd)
+        return removed
+
+    def stats(self):
+        artifacts, partials = self._entries()
+        with self._lock:
+            return dict(self._counters,
+                        artifacts=len(artifacts),
+                        bytes=sum(size for _, size, _ in artifacts),
+                        partial_downloads=len(partials),
+                        partial_bytes=sum(size for _, size, _ in partials),
+                        max_bytes=self.max_bytes)
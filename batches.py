@@ -0,0 +1,146 @@
+"""
+Batch processing of many videos at once.
+
+A batch is an ordered list of videos run through the shared JobQueue. All
+batches share `concurrency` feeder threads, so batches together never occupy
+more than that many job workers and interactive requests keep the rest. An
+item whose job outlives `wait_timeout` is marked failed and frees its thread.
+Each item keeps its own status, result and error, the batch reports aggregate
+progress, and its state is mirrored to a DiskCache so a poll that lands on a
+different gunicorn worker can still see it.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from jobs import QUEUED, RUNNING, DONE, FAILED
+
+
+class Batch:
+    """A set of videos processed together"""
+
+    def __init__(self, items):
+        self.id = uuid.uuid4().hex
+        self.items = [dict(item, status=QUEUED) for item in items]
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return all(item['status'] in (DONE, FAILED) for item in self.items)
+
+    def update(self, index, **fields):
+        with self._lock:
+            self.items[index].update(fields)
+            if self.finished and self.finished_at is None:
+                self.finished_at = time.time()
+
+    def to_dict(self):
+        with self._lock:
+            counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+            for item in self.items:
+                counts[item['status']] += 1
+            total = len(self.items)
+            return {
+                'batch_id': self.id,
+                'status': DONE if self.finished else RUNNING,
+                'total': total,
+                'counts': counts,
+                'progress': round((counts[DONE] + counts[FAILED]) / total, 3) if total else 1.0,
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+                'items': [dict(item) for item in self.items],
+            }
+
+
+class BatchRunner:
+    """Feed batch items into a JobQueue, at most concurrency at a time across batches"""
+
+    def __init__(self, job_queue, concurrency=2, store=None, result_ttl=3600, wait_timeout=None):
+        self.job_queue = job_queue
+        self.concurrency = concurrency
+        self.wait_timeout = wait_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='askvid-batch')
+        self.store = store
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._persist_lock = threading.Lock()
+        self._batches = {}
+        self._counters = {'batches': 0, 'items': 0, 'completed': 0, 'failed': 0}
+
+    def start(self, items, fn, lookup=None):
+        """Process items ({'video_id', 'url'} dicts) in the background.
+
+        Each item runs as fn(url, video_id) on the job queue, de-duplicated
+        by video ID against every other job. lookup(video_id) may return a
+        finished result (e.g. from the transcript cache) to skip the job.
+        """
+        batch = Batch(items)
+        with self._lock:
+            self._prune()
+            self._batches[batch.id] = batch
+            self._counters['batches'] += 1
+            self._counters['items'] += len(items)
+        self._persist(batch)
+
+        for index in range(len(batch.items)):
+            self._executor.submit(self._run_item, batch, index, fn, lookup)
+        return batch
+
+    def _run_item(self, batch, index, fn, lookup):
+        item = batch.items[index]
+        try:
+            result = lookup(item['video_id']) if lookup else None
+            if result is None:
+                job, _ = self.job_queue.submit(item['video_id'], fn, item['url'], item['video_id'])
+                batch.update(index, status=RUNNING, job_id=job.id)
+                self._persist(batch)
+                if not job.wait(self.wait_timeout):
+                    # The job keeps running; only this batch stops waiting for it
+                    raise TimeoutError(f"Timed out after {self.wait_timeout}s waiting for the video to process")
+                if job.status == FAILED:
+                    raise RuntimeError(job.error)
+                result = job.result
+            batch.update(index, status=DONE, transcript_id=result.get('transcript_id'),
+                         cached=result.get('cached', False))
+            outcome = 'completed'
+        except Exception as e:
+            batch.update(index, status=FAILED, error=str(e))
+            outcome = 'failed'
+        with self._lock:
+            self._counters[outcome] += 1
+        self._persist(batch)
+
+    def _persist(self, batch):
+        if self.store is not None:
+            try:
+                # Snapshot and write together so an older snapshot never lands last
+                with self._persist_lock:
+                    self.store.set(batch.id, batch.to_dict(), ttl=self.result_ttl)
+            except Exception as e:
+                print(f"Could not persist batch {batch.id}: {str(e)}")
+
+    def _prune(self):
+        """Forget finished batches older than result_ttl (caller holds the lock)"""
+        cutoff = time.time() - self.result_ttl
+        stale = [batch_id for batch_id, batch in self._batches.items()
+                 if batch.finished_at is not None and batch.finished_at < cutoff]
+        for batch_id in stale:
+            del self._batches[batch_id]
+
+    def get(self, batch_id):
+        """Return a batch's status dict, checking the shared store on a local miss"""
+        batch = self._batches.get(batch_id)
+        if batch is not None:
+            return batch.to_dict()
+        if self.store is not None:
+            return self.store.get(batch_id)
+        return None
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for batch in self._batches.values() if not batch.finished)
+            return dict(self._counters, running=running, concurrency=self.concurrency)
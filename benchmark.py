@@ -0,0 +1,758 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the AskVid pipeline.
+
+Runs entirely offline against synthetic inputs so results can be compared run
+to run. Usage:
+
+    python benchmark.py audio --minutes 5 --repeat 3
+    python benchmark.py startup --repeat 5
+    python benchmark.py stream --minutes 10 --readrate 20
+    python benchmark.py load --requests 100 --concurrency 8
+    python benchmark.py load --target app_demo --workers 2
+    python benchmark.py capacity --concurrency 8 32 128
+    python benchmark.py context --tokens 10000 50000 200000
+    python benchmark.py search --transcripts 10000
+    python benchmark.py classify --titles 50000
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+# FFmpeg encoders yt-dlp's FFmpegExtractAudio uses for each codec
+ENCODERS = {
+    'mp3': 'libmp3lame',
+    'opus': 'libopus',
+}
+
+
+def child_cpu_seconds():
+    """User + system CPU time consumed by finished child processes"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def make_source_audio(path, minutes):
+    """Write a synthetic YouTube-like stream: 48 kHz stereo Opus in WebM at 128 kbps"""
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'sine=frequency=220:sample_rate=48000:duration={minutes * 60}',
+        '-f', 'lavfi', '-i', f'anoisesrc=color=pink:amplitude=0.2:sample_rate=48000:duration={minutes * 60}',
+        '-filter_complex', 'amix=inputs=2,aformat=channel_layouts=stereo',
+        '-c:a', 'libopus', '-b:a', '128k', path
+    ], check=True)
+
+
+def transcode_command(source, output, settings):
+    """The FFmpeg command yt-dlp runs for an audio mode"""
+    return [
+        'ffmpeg', '-y', '-loglevel', 'error', '-i', source, '-vn',
+        '-acodec', ENCODERS[settings['codec']], '-b:a', f"{settings['quality']}k",
+        *settings['ffmpeg_args'], output
+    ]
+
+
+def run_audio_mode(source, work_dir, mode, settings):
+    """Produce one mode's output from source; returns (wall seconds, cpu seconds, bytes)"""
+    output = os.path.join(work_dir, f'{mode}{settings["extensions"][0]}')
+    cpu_before = child_cpu_seconds()
+    wall_start = time.perf_counter()
+
+    if settings['codec']:
+        subprocess.run(transcode_command(source, output, settings), check=True)
+    else:
+        # Native mode keeps the downloaded stream as-is
+        shutil.copyfile(source, output)
+
+    wall = time.perf_counter() - wall_start
+    cpu = child_cpu_seconds() - cpu_before
+    size = os.path.getsize(output)
+    os.remove(output)
+    return wall, cpu, size
+
+
+def bench_audio(args):
+    """Compare CPU and wall time per minute of audio across AUDIO_MODES"""
+    from app import AUDIO_MODES
+
+    if not shutil.which('ffmpeg'):
+        print("❌ ffmpeg not found on PATH")
+        return 1
+
+    modes = args.modes or list(AUDIO_MODES)
+    with tempfile.TemporaryDirectory() as work_dir:
+        source = os.path.join(work_dir, 'source.webm')
+        print(f"🎵 Generating {args.minutes} min of synthetic source audio...")
+        make_source_audio(source, args.minutes)
+
+        print(f"\n{'mode':<8} {'wall s/min':>11} {'cpu s/min':>10} {'output KB/min':>14}")
+        for mode in modes:
+            walls, cpus, sizes = [], [], []
+            for _ in range(args.repeat):
+                wall, cpu, size = run_audio_mode(source, work_dir, mode, AUDIO_MODES[mode])
+                walls.append(wall)
+                cpus.append(cpu)
+                sizes.append(size)
+            print(f"{mode:<8} {min(walls) / args.minutes:>11.3f} {min(cpus) / args.minutes:>10.3f} "
+                  f"{sizes[0] / 1024 / args.minutes:>14.1f}")
+    return 0
+
+
+# Runs in a fresh interpreter so every measurement is a cold start
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/')
+first_request = time.perf_counter()
+client.get('/')
+second_request = time.perf_counter()
+import llm
+llm.get_model(app.GEMINI_MODEL)
+model_ready = time.perf_counter()
+llm.get_model(app.GEMINI_MODEL)
+model_reused = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'first_request': first_request - imported,
+    'second_request': second_request - first_request,
+    'first_model': model_ready - second_request,
+    'reused_model': model_reused - model_ready,
+    'modules': len(sys.modules),
+}))
+"""
+
+
+def bench_startup(args):
+    """Cold-start cost: app import, first request, first and reused model lookup"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = dict(os.environ, ASKVID_CACHE_DIR=cache_dir, GEMINI_API_KEY=os.getenv('GEMINI_API_KEY', 'benchmark'))
+            output = subprocess.run(
+                [sys.executable, '-c', STARTUP_PROBE], cwd=here, env=env,
+                capture_output=True, text=True, check=True
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"\n{'stage':<16} {'best ms':>9} {'median ms':>10}")
+    for stage in ('import', 'first_request', 'second_request', 'first_model', 'reused_model'):
+        values = sorted(run[stage] * 1000 for run in runs)
+        print(f"{stage:<16} {values[0]:>9.1f} {values[len(values) // 2]:>10.1f}")
+    print(f"{'modules loaded':<16} {runs[0]['modules']:>9}")
+    return 0
+
+
+def make_speech_like_audio(path, minutes):
+    """Write Opus audio of tone bursts separated by pauses, so chunking has silences to cut on"""
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'sine=frequency=300:sample_rate=48000:duration={minutes * 60}',
+        '-af', "volume=enable='lt(mod(t,5),1)':volume=0",
+        '-c:a', 'libopus', '-b:a', '64k', path
+    ], check=True)
+
+
+def decode_command(source, readrate):
+    """pcm_stream_command, optionally throttled to readrate x realtime to mimic a download"""
+    from transcription import pcm_stream_command
+
+    command = pcm_stream_command(source)
+    if readrate:
+        command[command.index('-i'):command.index('-i')] = ['-readrate', str(readrate)]
+    return command
+
+
+def run_staged(engine, source, work_dir, readrate):
+    """Decode everything to disk first, then transcribe; returns (first segment s, total s)"""
+    from pydub import AudioSegment
+    from transcription import SAMPLE_RATE
+
+    started = time.perf_counter()
+    pcm_path = os.path.join(work_dir, 'staged.pcm')
+    with open(pcm_path, 'wb') as output:
+        subprocess.run(decode_command(source, readrate), stdout=output, check=True)
+    with open(pcm_path, 'rb') as pcm:
+        audio = AudioSegment(data=pcm.read(), sample_width=2, frame_rate=SAMPLE_RATE, channels=1)
+    engine.transcribe(audio)
+    total = time.perf_counter() - started
+    os.remove(pcm_path)
+    return total, total
+
+
+def run_streaming(engine, source, readrate):
+    """Transcribe from the decoder's pipe; returns (first segment s, total s)"""
+    started = time.perf_counter()
+    first = []
+    process = subprocess.Popen(decode_command(source, readrate), stdout=subprocess.PIPE)
+    engine.transcribe_stream(process.stdout, on_segment=lambda segment: first.append(time.perf_counter()))
+    process.wait()
+    total = time.perf_counter() - started
+    return (first[0] - started if first else total), total
+
+
+def bench_stream(args):
+    """Time to first segment, total time and peak Python memory: staged vs streaming"""
+    import tracemalloc
+    from transcription import OfflineEngine
+
+    if not shutil.which('ffmpeg'):
+        print("❌ ffmpeg not found on PATH")
+        return 1
+
+    engine = OfflineEngine(latency=args.latency, max_workers=args.workers)
+    with tempfile.TemporaryDirectory() as work_dir:
+        source = os.path.join(work_dir, 'source.webm')
+        print(f"🎵 Generating {args.minutes} min of synthetic speech-like audio...")
+        make_speech_like_audio(source, args.minutes)
+
+        print(f"\n{'pipeline':<10} {'first segment s':>16} {'total s':>9} {'peak MB':>9}")
+        for name in ('staged', 'streaming'):
+            tracemalloc.start()
+            if name == 'staged':
+                first, total = run_staged(engine, source, work_dir, args.readrate)
+            else:
+                first, total = run_streaming(engine, source, args.readrate)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<10} {first:>16.2f} {total:>9.2f} {peak / 1024 / 1024:>9.1f}")
+    return 0
+
+
+# Serves the app (with stand-in backends) on a fixed port in a child process
+LOAD_SERVER = """
+import sys
+from werkzeug.serving import make_server
+import standins
+app = standins.create_app(sys.argv[1])
+make_server('127.0.0.1', int(sys.argv[2]), app, threaded=True).serve_forever()
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, port, env, gunicorn=False):
+    """Start the target app: gunicorn when asked, for --workers N or gevent; else one werkzeug process"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    if args.worker_class == 'gevent':
+        command = [
+            sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_async.py', f'standins:create_app("{args.target}")',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+            '--worker-connections', str(args.worker_connections), '--timeout', '600',
+        ]
+    elif gunicorn or args.workers > 1:
+        command = [
+            sys.executable, '-m', 'gunicorn', f'standins:create_app("{args.target}")',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+            '--worker-class', 'gthread', '--threads', str(args.threads), '--timeout', '600',
+        ]
+    else:
+        command = [sys.executable, '-c', LOAD_SERVER, args.target, str(port)]
+    server = subprocess.Popen(command, cwd=here, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1)
+            return server
+        except Exception:
+            if server.poll() is not None:
+                raise RuntimeError(f'{args.target} server exited with code {server.returncode}')
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f'{args.target} server did not start within 60 s')
+
+
+def worker_pids(server):
+    """The server process, or gunicorn's worker processes"""
+    try:
+        with open(f'/proc/{server.pid}/task/{server.pid}/children') as children:
+            pids = [int(pid) for pid in children.read().split()]
+    except OSError:
+        pids = []
+    return pids or [server.pid]
+
+
+def rss_mb(pid):
+    """Resident memory of a process in MB (Linux only; None elsewhere)"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def post_json(base_url, path, payload):
+    """POST JSON; returns (status, body, seconds)"""
+    request = urllib.request.Request(
+        base_url + path, data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=600) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read()
+    seconds = time.perf_counter() - started
+    try:
+        return status, json.loads(body or b'{}'), seconds
+    except ValueError:
+        return status, {}, seconds
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an unsorted list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def run_phase(name, payloads, base_url, path, concurrency):
+    """Send payloads concurrently; returns a result row for the report"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda payload: post_json(base_url, path, payload), payloads))
+    wall = time.perf_counter() - started
+
+    latencies = [seconds for _, _, seconds in results]
+    errors = sum(1 for status, _, _ in results if status >= 400)
+    return {
+        'phase': name,
+        'requests': len(results),
+        'errors': errors,
+        'rps': len(results) / wall if wall else 0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+def bench_load(args):
+    """Concurrent load against the app with stand-in yt-dlp, speech and Gemini backends"""
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(
+            os.environ,
+            ASKVID_CACHE_DIR=cache_dir,
+            GEMINI_API_KEY='standin',
+            TRANSCRIPTION_ENGINE='offline',
+            OFFLINE_TRANSCRIBE_LATENCY=str(args.speech_latency),
+            STANDIN_DOWNLOAD_LATENCY=str(args.download_latency),
+            STANDIN_LLM_LATENCY=str(args.llm_latency),
+            STANDIN_AUDIO_SECONDS=str(args.audio_seconds),
+        )
+        env.update(item.split('=', 1) for item in args.env)
+
+        print(f"🚀 Starting {args.target} on port {port} ({args.workers} worker(s))...")
+        server = start_server(args, port, env)
+        try:
+            rows = []
+            videos = [f'https://www.youtube.com/watch?v=load{i:07d}' for i in range(args.videos)]
+            process_payloads = [{'video_url': videos[i % len(videos)], 'wait': True}
+                                for i in range(args.requests)]
+            rows.append(run_phase('process_video', process_payloads, base_url, '/process_video', args.concurrency))
+
+            # Questions and analyses go against the transcripts processed above
+            handles = []
+            for video in videos:
+                status, body, _ = post_json(base_url, '/process_video', {'video_url': video, 'wait': True})
+                if status < 400:
+                    handles.append({'transcript_id': body.get('transcript_id'),
+                                    'transcript': body.get('transcript')})
+            if not handles:
+                print("❌ No video could be processed; check the server")
+                return 1
+
+            ask_payloads = [dict(handles[i % len(handles)],
+                                 question=f'What is point {i % args.distinct_questions} about?')
+                            for i in range(args.requests)]
+            rows.append(run_phase('ask_question', ask_payloads, base_url, '/ask_question', args.concurrency))
+
+            if args.target == 'app':
+                analyze_payloads = [handles[i % len(handles)] for i in range(args.requests)]
+                rows.append(run_phase('analyze_topics', analyze_payloads, base_url, '/analyze_topics',
+                                      args.concurrency))
+
+            memory = [rss_mb(pid) for pid in worker_pids(server)]
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    print(f"\n{'phase':<16} {'reqs':>6} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in rows:
+        print(f"{row['phase']:<16} {row['requests']:>6} {row['errors']:>7} {row['rps']:>8.1f} "
+              f"{row['p50'] * 1000:>9.1f} {row['p95'] * 1000:>9.1f} {row['p99'] * 1000:>9.1f}")
+    known = [mb for mb in memory if mb is not None]
+    if known:
+        print(f"\nmemory per worker: {', '.join(f'{mb:.0f} MB' for mb in known)}")
+    if args.json:
+        print(json.dumps({'phases': rows, 'memory_mb': memory}))
+    return 0
+
+
+def zipf_weights(size):
+    """Cumulative 1/rank weights: a few very common words and a long tail of rare ones"""
+    total, cumulative = 0.0, []
+    for rank in range(size):
+        total += 1 / (rank + 1)
+        cumulative.append(total)
+    return cumulative
+
+
+def synthetic_transcript(rng, vocabulary, cum_weights, words):
+    return ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=words))
+
+
+def bench_search(args):
+    """Indexing throughput and query latency of the transcript search index"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from search import TranscriptSearch, fts5_available
+
+    if not fts5_available():
+        print("❌ This Python's sqlite3 was built without FTS5")
+        return 1
+
+    rng = random.Random(7)
+    vocabulary = [f'w{i}' for i in range(args.vocabulary)]
+    # Real words at known frequencies so queries have predictable hit counts
+    vocabulary[:4] = ['lecture', 'today', 'students', 'example']
+    vocabulary[500:503] = ['photosynthesis', 'mitochondria', 'chlorophyll']
+    vocabulary[-1] = 'zeitgeist'
+    cum_weights = zipf_weights(len(vocabulary))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        index = TranscriptSearch(os.path.join(work_dir, 'search.sqlite3'))
+        print(f"📚 Indexing {args.transcripts} synthetic transcripts of {args.words} words...")
+        started = time.perf_counter()
+        for i in range(args.transcripts):
+            text = synthetic_transcript(rng, vocabulary, cum_weights, args.words)
+            index.add(f'video{i:06d}', text, hashlib.sha256(text.encode()).hexdigest()[:32],
+                      title=f'Synthetic lecture {i}')
+        index_seconds = time.perf_counter() - started
+        index.optimize()
+        size_mb = sum(os.path.getsize(os.path.join(work_dir, name)) for name in os.listdir(work_dir)) / 1e6
+
+        queries = {
+            'common word': 'lecture',
+            'mid-frequency word': 'photosynthesis',
+            'two words': 'mitochondria chlorophyll',
+            'rare word': 'zeitgeist',
+            'prefix': 'photosyn',
+            'no match': 'xylophone',
+        }
+        rows = []
+        for name, query in queries.items():
+            latencies = []
+            for _ in range(args.repeat):
+                query_started = time.perf_counter()
+                results = index.search(query, limit=20)
+                latencies.append(time.perf_counter() - query_started)
+            rows.append((name, query, len(results), percentile(latencies, 0.5), percentile(latencies, 0.95)))
+
+        # Incremental update: re-index one changed transcript, then an unchanged one
+        text = synthetic_transcript(rng, vocabulary, cum_weights, args.words)
+        update_started = time.perf_counter()
+        index.add('video000000', text, hashlib.sha256(text.encode()).hexdigest()[:32])
+        update_seconds = time.perf_counter() - update_started
+        unchanged_started = time.perf_counter()
+        index.add('video000000', text, hashlib.sha256(text.encode()).hexdigest()[:32])
+        unchanged_seconds = time.perf_counter() - unchanged_started
+
+    print(f"\nindexed {args.transcripts} transcripts in {index_seconds:.1f} s "
+          f"({args.transcripts / index_seconds:.0f}/s), index size {size_mb:.0f} MB")
+    print(f"re-index one changed transcript: {update_seconds * 1000:.1f} ms, "
+          f"unchanged: {unchanged_seconds * 1000:.2f} ms")
+    print(f"\n{'query':<20} {'text':<26} {'hits':>5} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, query, hits, p50, p95 in rows:
+        print(f"{name:<20} {query:<26} {hits:>5} {p50 * 1000:>9.2f} {p95 * 1000:>9.2f}")
+    return 0
+
+
+def bench_classify(args):
+    """Content classification: compiled single-pass matcher vs per-keyword substring scans"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from classifier import ContentClassifier
+
+    with open(args.rules, encoding='utf-8') as f:
+        rules = json.load(f)
+    rng = random.Random(11)
+    # Grow the rule set to see how each approach scales with keyword count
+    for i in range(args.extra_keywords):
+        rng.choice(rules['categories'])['keywords'].append(f'keyword{i}')
+    classifier = ContentClassifier(rules)
+    categories = classifier.categories
+
+    def chain(title):
+        """The if/elif keyword chain the classifier replaced: first category with any hit"""
+        lower = title.lower()
+        for category in categories:
+            if any(word in lower for word in category['keywords']):
+                return category
+        return None
+
+    def scan(title, description, tags):
+        """Weighted scoring with one substring scan per keyword and field"""
+        fields = {'title': title.lower(), 'description': description.lower(), 'tags': ' | '.join(tags).lower()}
+        best, best_score = None, 0
+        for category in categories:
+            score = sum(classifier.weights.get(field, 0) * sum(1 for word in category['keywords'] if word in text)
+                        for field, text in fields.items())
+            if score > best_score and score >= classifier.min_score:
+                best, best_score = category, score
+        return best
+
+    keywords = sorted({word for category in categories for word in category['keywords']})
+    filler = [f'w{i}' for i in range(5000)]
+    cum_weights = zipf_weights(len(filler))
+
+    def text(words, keyword_rate):
+        return ' '.join(rng.choice(keywords) if rng.random() < keyword_rate
+                        else rng.choices(filler, cum_weights=cum_weights)[0] for _ in range(words))
+
+    print(f"🏷️  Generating {args.titles} synthetic videos ({len(keywords)} keywords, "
+          f"{args.description_words}-word descriptions)...")
+    videos = [(text(rng.randint(3, 12), 0.1), text(args.description_words, 0.01),
+               text(rng.randint(0, 8), 0.1).split()) for _ in range(args.titles)]
+
+    def timed(fn):
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    rows = [
+        ('title, keyword chain', timed(lambda: [chain(title) for title, _, _ in videos])),
+        ('title, compiled', timed(lambda: [classifier.classify(title) for title, _, _ in videos])),
+        ('weighted, keyword scans', timed(lambda: [scan(*video) for video in videos])),
+        ('weighted, compiled', timed(lambda: [classifier.classify(*video) for video in videos])),
+    ]
+    print(f"\n{'classifier':<26} {'total s':>8} {'us/video':>9}")
+    for name, seconds in rows:
+        print(f"{name:<26} {seconds:>8.3f} {seconds * 1e6 / len(videos):>9.1f}")
+    return 0
+
+
+def bench_capacity(args):
+    """Concurrent /ask_question capacity of one worker process, threaded vs gevent"""
+    rows = []
+    memory = {}
+    for worker_class in args.worker_classes:
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        server_args = argparse.Namespace(target='app', workers=1, threads=args.threads,
+                                         worker_class=worker_class,
+                                         worker_connections=args.worker_connections)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = dict(
+                os.environ,
+                ASKVID_CACHE_DIR=cache_dir,
+                GEMINI_API_KEY='standin',
+                TRANSCRIPTION_ENGINE='offline',
+                OFFLINE_TRANSCRIBE_LATENCY='0',
+                STANDIN_DOWNLOAD_LATENCY='0',
+                STANDIN_AUDIO_SECONDS='10',
+                STANDIN_LLM_LATENCY=str(args.llm_latency),
+                EAGER_ANALYSIS='0',
+                # Measure the worker, not the outbound scheduler's cap
+                LLM_MAX_CONCURRENT='0',
+            )
+            print(f"🚀 Starting one {worker_class} worker on port {port}...")
+            server = start_server(server_args, port, env, gunicorn=True)
+            try:
+                status, body, _ = post_json(base_url, '/process_video', {
+                    'video_url': 'https://www.youtube.com/watch?v=capacity001', 'wait': True})
+                if status >= 400:
+                    print(f"❌ Could not process the test video: {body}")
+                    return 1
+                for concurrency in args.concurrency:
+                    # Distinct questions so every request waits on the model
+                    payloads = [{'transcript_id': body['transcript_id'],
+                                 'question': f'{worker_class} {concurrency} question {i}?'}
+                                for i in range(concurrency * args.rounds)]
+                    row = run_phase(worker_class, payloads, base_url, '/ask_question', concurrency)
+                    rows.append(dict(row, concurrency=concurrency))
+                memory[worker_class] = rss_mb(worker_pids(server)[0])
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    print(f"\nmodel latency {args.llm_latency:.2f} s; gthread workers have {args.threads} threads")
+    print(f"\n{'worker':<8} {'clients':>8} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for row in rows:
+        print(f"{row['phase']:<8} {row['concurrency']:>8} {row['errors']:>7} {row['rps']:>8.1f} "
+              f"{row['p50'] * 1000:>9.1f} {row['p95'] * 1000:>9.1f}")
+    known = {name: mb for name, mb in memory.items() if mb is not None}
+    if known:
+        print(f"\nmemory per worker: {', '.join(f'{name} {mb:.0f} MB' for name, mb in known.items())}")
+    if args.json:
+        print(json.dumps({'rows': rows, 'memory_mb': memory}))
+    return 0
+
+
+def bench_context(args):
+    """Per-question prompt tokens and latency with and without cached transcript context"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    cache_dir = tempfile.mkdtemp(prefix='askvid-bench-')
+    os.environ.update(
+        ASKVID_CACHE_DIR=cache_dir,
+        GEMINI_API_KEY='standin',
+        EAGER_ANALYSIS='0',
+        LLM_CACHE_DISK='0',
+        CONTEXT_CACHE_MIN_TOKENS='1000',
+        STANDIN_LLM_LATENCY=str(args.llm_latency),
+        STANDIN_LLM_SECONDS_PER_1K_TOKENS=str(args.seconds_per_1k),
+    )
+    import standins
+    standins.install()
+    import app as askvid
+
+    context_cache = askvid.context_cache
+    client = askvid.app.test_client()
+    rng = random.Random(11)
+    vocabulary = [f'word{i}' for i in range(5000)]
+    cum_weights = zipf_weights(len(vocabulary))
+    rows = []
+    try:
+        for tokens in args.tokens:
+            # ~5 characters (4/3 tokens) per synthetic word
+            transcript = synthetic_transcript(rng, vocabulary, cum_weights, tokens * 3 // 4)
+            transcript_id = askvid.session_store.create(transcript).id
+            for mode in ('inline', 'context'):
+                askvid.context_cache = context_cache if mode == 'context' else None
+                before = askvid.LLM_TOKENS.value(kind='answer', direction='prompt')
+                latencies = []
+                for i in range(args.questions):
+                    started = time.perf_counter()
+                    response = client.post('/ask_question', json={
+                        'transcript_id': transcript_id, 'question': f'{mode} question {i} about word{i}?'})
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        print(f"❌ {mode} question failed: {response.get_json()}")
+                        return 1
+                sent = askvid.LLM_TOKENS.value(kind='answer', direction='prompt') - before
+                rows.append((tokens, mode, sent / args.questions, latencies[0], sum(latencies[1:]) / max(1, len(latencies) - 1)))
+    finally:
+        askvid.context_cache = context_cache
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(f"\nstand-in model: {args.llm_latency:.2f} s per call + {args.seconds_per_1k:.3f} s per 1k uncached prompt tokens")
+    print(f"\n{'transcript':>10} {'mode':<8} {'prompt tokens/question':>23} {'first ms':>9} {'follow-up ms':>13}")
+    for tokens, mode, per_question, first, follow_up in rows:
+        print(f"{tokens:>10} {mode:<8} {per_question:>23.0f} {first * 1000:>9.1f} {follow_up * 1000:>13.1f}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AskVid benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    audio = subparsers.add_parser('audio', help='audio transcode cost per AUDIO_MODE')
+    audio.add_argument('--minutes', type=float, default=5, help='length of synthetic audio')
+    audio.add_argument('--repeat', type=int, default=3, help='runs per mode (best is reported)')
+    audio.add_argument('--modes', nargs='*', help='subset of AUDIO_MODES to run')
+    audio.set_defaults(func=bench_audio)
+
+    startup = subparsers.add_parser('startup', help='worker boot and first-request latency')
+    startup.add_argument('--repeat', type=int, default=5, help='cold starts to measure')
+    startup.set_defaults(func=bench_startup)
+
+    stream = subparsers.add_parser('stream', help='staged vs streaming transcription pipeline')
+    stream.add_argument('--minutes', type=float, default=10, help='length of synthetic audio')
+    stream.add_argument('--readrate', type=float, default=0,
+                        help='throttle decoding to this multiple of realtime to mimic a download (0 = unthrottled)')
+    stream.add_argument('--latency', type=float, default=0.5, help='simulated recognition seconds per chunk')
+    stream.add_argument('--workers', type=int, default=4, help='chunks transcribed in parallel')
+    stream.set_defaults(func=bench_stream)
+
+    load = subparsers.add_parser('load', help='concurrent load with stand-in yt-dlp, speech and Gemini')
+    load.add_argument('--target', choices=('app', 'app_demo'), default='app', help='module to serve')
+    load.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+    load.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    load.add_argument('--videos', type=int, default=20, help='distinct videos requested')
+    load.add_argument('--distinct-questions', type=int, default=20, help='distinct questions asked')
+    load.add_argument('--workers', type=int, default=1, help='gunicorn workers (1 = single werkzeug process)')
+    load.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    load.add_argument('--worker-class', choices=('gthread', 'gevent'), default='gthread',
+                      help='gunicorn worker class (gevent uses gunicorn_async.py)')
+    load.add_argument('--worker-connections', type=int, default=1000, help='greenlets per gevent worker')
+    load.add_argument('--download-latency', type=float, default=0.5, help='stand-in seconds per download')
+    load.add_argument('--speech-latency', type=float, default=0.2, help='offline engine seconds per chunk')
+    load.add_argument('--llm-latency', type=float, default=1.0, help='stand-in seconds per model call')
+    load.add_argument('--audio-seconds', type=float, default=120, help='length of the synthetic audio')
+    load.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                      help='extra environment for the server (repeatable)')
+    load.add_argument('--json', action='store_true', help='also print the results as JSON')
+    load.set_defaults(func=bench_load)
+
+    capacity = subparsers.add_parser('capacity', help='requests in flight per worker: gthread vs gevent')
+    capacity.add_argument('--worker-classes', nargs='*', default=['gthread', 'gevent'],
+                          choices=('gthread', 'gevent'), help='worker classes to compare')
+    capacity.add_argument('--concurrency', type=int, nargs='*', default=[8, 32, 128],
+                          help='concurrent clients per step')
+    capacity.add_argument('--rounds', type=int, default=4, help='requests per client per step')
+    capacity.add_argument('--threads', type=int, default=8, help='threads per gthread worker')
+    capacity.add_argument('--worker-connections', type=int, default=1000, help='greenlets per gevent worker')
+    capacity.add_argument('--llm-latency', type=float, default=1.0, help='stand-in seconds per model call')
+    capacity.add_argument('--json', action='store_true', help='also print the results as JSON')
+    capacity.set_defaults(func=bench_capacity)
+
+    context = subparsers.add_parser('context', help='follow-up questions with and without cached context')
+    context.add_argument('--tokens', type=int, nargs='*', default=[10000, 50000, 200000],
+                         help='transcript lengths in tokens')
+    context.add_argument('--questions', type=int, default=6, help='questions per transcript')
+    context.add_argument('--llm-latency', type=float, default=0.2, help='stand-in seconds per model call')
+    context.add_argument('--seconds-per-1k', type=float, default=0.02,
+                         help='stand-in seconds per 1k uncached prompt tokens')
+    context.set_defaults(func=bench_context)
+
+    search = subparsers.add_parser('search', help='transcript search indexing and query latency')
+    search.add_argument('--transcripts', type=int, default=10000, help='synthetic transcripts to index')
+    search.add_argument('--words', type=int, default=1500, help='words per transcript')
+    search.add_argument('--vocabulary', type=int, default=20000, help='distinct words')
+    search.add_argument('--repeat', type=int, default=50, help='runs per query')
+    search.set_defaults(func=bench_search)
+
+    classify = subparsers.add_parser('classify', help='content classifier matching cost')
+    classify.add_argument('--titles', type=int, default=50000, help='synthetic videos to classify')
+    classify.add_argument('--description-words', type=int, default=200, help='words per description')
+    classify.add_argument('--rules', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          'content_rules.json'))
+    classify.add_argument('--extra-keywords', type=int, default=0, help='synthetic keywords added to the rules')
+    classify.add_argument('--repeat', type=int, default=3, help='runs per classifier (best is kept)')
+    classify.set_defaults(func=bench_classify)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+"""
+Caches shared by the AskVid pipeline.
+
+DiskCache is an on-disk cache shared by every gunicorn worker on the host.
+
+Entries live in a single SQLite database (WAL mode) so concurrent workers can
+read and write without stepping on each other. Each cache instance owns a
+namespace inside that database, is bounded by a byte budget and evicts the
+least recently used entries first. Hit/miss/eviction counters are stored in
+the same database so they reflect all workers, not just the current process.
+
+MemoryCache is a per-process LRU for objects that are too expensive to
+re-serialise on every request; it is usually layered over a DiskCache.
+TieredCache does that layering for plain JSON values.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def connection_local():
+    """Storage for per-thread database connections.
+
+    Under gevent the patched threading.local is per greenlet, which would open
+    (and leak) a connection for every request. Greenlets on one OS thread can
+    share a connection, since an SQLite call never yields part-way through.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return threading.local()
+    return monkey.get_original('threading', 'local')()
+
+
+class DiskCache:
+    """SQLite-backed key/value cache with LRU + TTL eviction.
+
+    With sliding=True every hit pushes the entry's expiry out by ttl again,
+    so ttl becomes an idle timeout rather than a maximum age. Hits refresh an
+    entry at most once per touch_interval (a tenth of ttl by default), which
+    is as precise as LRU order and idle expiry need to be.
+    """
+
+    def __init__(self, path, namespace, max_bytes=256 * 1024 * 1024, ttl=None, sliding=False,
+                 touch_interval=None):
+        self.path = path
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sliding = sliding
+        # A hit only writes last_access/expires_at back once they are this
+        # stale, so most hits are plain reads that never take the write lock
+        if touch_interval is None:
+            touch_interval = ttl * 0.1 if ttl else 60
+        self.touch_interval = touch_interval
+        self._local = connection_local()
+        # Hits between writes are counted here and flushed with the next one
+        self._pending_hits = 0
+        self._hits_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS entries_lru ON entries (namespace, last_access)'
+        )
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS counters (
+                namespace TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (namespace, name)
+            )
+        """)
+
+    def _bump(self, conn, name, amount=1):
+        conn.execute(
+            'INSERT INTO counters (namespace, name, value) VALUES (?, ?, ?) '
+            'ON CONFLICT (namespace, name) DO UPDATE SET value = value + excluded.value',
+            (self.namespace, name, amount)
+        )
+
+    def _flush_hits(self, conn, extra=0):
+        """Write hits counted since the last flush (plus extra) to the counters table"""
+        with self._hits_lock:
+            hits, self._pending_hits = self._pending_hits + extra, 0
+        if hits:
+            self._bump(conn, 'hits', hits)
+
+    def get(self, key, record=True):
+        """Return the cached value for key, or None on a miss.
+
+        record=False leaves the hit/miss counters alone, for re-checks of a
+        key whose lookup was already counted.
+        """
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            'SELECT value, last_access, expires_at FROM entries WHERE namespace = ? AND key = ?',
+            (self.namespace, key)
+        ).fetchone()
+
+        if row is None:
+            if record:
+                self._bump(conn, 'misses')
+            return None
+
+        value, last_access, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            conn.execute(
+                'DELETE FROM entries WHERE namespace = ? AND key = ?',
+                (self.namespace, key)
+            )
+            self._bump(conn, 'expired')
+            if record:
+                self._bump(conn, 'misses')
+            return None
+
+        if now - last_access >= self.touch_interval:
+            if self.sliding and self.ttl:
+                expires_at = now + self.ttl
+            conn.execute(
+                'UPDATE entries SET last_access = ?, expires_at = ? WHERE namespace = ? AND key = ?',
+                (now, expires_at, self.namespace, key)
+            )
+            self._flush_hits(conn, 1 if record else 0)
+        elif record:
+            with self._hits_lock:
+                self._pending_hits += 1
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        """Store a JSON-serialisable value and evict entries over budget"""
+        payload = json.dumps(value)
+        size = len(payload.encode('utf-8'))
+        if size > self.max_bytes:
+            return False
+
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries '
+                '(namespace, key, value, size, created_at, last_access, expires_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.namespace, key, payload, size, now, now, expires_at)
+            )
+            self._bump(conn, 'writes')
+            self._flush_hits(conn)
+            self._evict(conn, now)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def touch(self, key, ttl=None):
+        """Restart an entry's expiry without reading it; False if it is gone"""
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        conn = self._connect()
+        updated = conn.execute(
+            'UPDATE entries SET last_access = ?, expires_at = ? WHERE namespace = ? AND key = ? '
+            'AND (expires_at IS NULL OR expires_at > ?)',
+            (now, now + ttl if ttl else None, self.namespace, key, now)
+        ).rowcount
+        return bool(updated)
+
+    def _evict(self, conn, now):
+        """Drop expired entries, then least recently used ones over budget"""
+        expired = conn.execute(
+            'DELETE FROM entries WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?',
+            (self.namespace, now)
+        ).rowcount
+        if expired:
+            self._bump(conn, 'expired', expired)
+
+        total = conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries WHERE namespace = ?',
+            (self.namespace,)
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        rows = conn.execute(
+            'SELECT key, size FROM entries WHERE namespace = ? ORDER BY last_access ASC',
+            (self.namespace,)
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute(
+                'DELETE FROM entries WHERE namespace = ? AND key = ?',
+                (self.namespace, key)
+            )
+            total -= size
+            evicted += 1
+        if evicted:
+            self._bump(conn, 'evictions', evicted)
+
+    def delete(self, key):
+        """Remove one entry; returns True if it existed"""
+        conn = self._connect()
+        deleted = conn.execute(
+            'DELETE FROM entries WHERE namespace = ? AND key = ?',
+            (self.namespace, key)
+        ).rowcount
+        if deleted:
+            self._bump(conn, 'invalidations', deleted)
+        return bool(deleted)
+
+    def delete_prefix(self, prefix):
+        """Remove every entry whose key starts with prefix"""
+        conn = self._connect()
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        deleted = conn.execute(
+            "DELETE FROM entries WHERE namespace = ? AND key LIKE ? ESCAPE '\\'",
+            (self.namespace, escaped + '%')
+        ).rowcount
+        if deleted:
+            self._bump(conn, 'invalidations', deleted)
+        return deleted
+
+    def clear(self):
+        """Remove every entry in this namespace"""
+        conn = self._connect()
+        deleted = conn.execute(
+            'DELETE FROM entries WHERE namespace = ?', (self.namespace,)
+        ).rowcount
+        if deleted:
+            self._bump(conn, 'invalidations', deleted)
+        return deleted
+
+    def stats(self):
+        """Return counters and current size for this namespace"""
+        conn = self._connect()
+        self._flush_hits(conn)
+        counters = dict(conn.execute(
+            'SELECT name, value FROM counters WHERE namespace = ?', (self.namespace,)
+        ).fetchall())
+        entries, total = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE namespace = ?',
+            (self.namespace,)
+        ).fetchone()
+
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        lookups = hits + misses
+        return {
+            'namespace': self.namespace,
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'writes': counters.get('writes', 0),
+            'evictions': counters.get('evictions', 0),
+            'expired': counters.get('expired', 0),
+            'invalidations': counters.get('invalidations', 0),
+        }
+
+
+class MemoryCache:
+    """In-process LRU cache bounded by total entry size, with idle expiry"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, key):
+        """Return the value for key and refresh its expiry, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+
+            value, size, last_access = entry
+            now = time.time()
+            if self.ttl and now - last_access > self.ttl:
+                self._remove(key)
+                self._counters['expired'] += 1
+                self._counters['misses'] += 1
+                return None
+
+            self._entries[key] = (value, size, now)
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return value
+
+    def set(self, key, value, size):
+        """Store value, accounting it as size bytes against the budget"""
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.time())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._counters['evictions'] += 1
+        return True
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                return True
+            return False
+
+    def clear(self):
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            return removed
+
+    def stats(self):
+        with self._lock:
+            hits = self._counters['hits']
+            lookups = hits + self._counters['misses']
+            return dict(
+                self._counters,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                ttl=self.ttl,
+                hit_rate=round(hits / lookups, 4) if lookups else 0.0,
+            )
+
+
+class TieredCache:
+    """Per-process MemoryCache in front of an optional shared DiskCache"""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+
+        value = self.disk.get(key) if self.disk is not None else None
+        if value is None:
+            self._count('misses')
+            return None
+
+        self._count('disk_hits')
+        self.memory.set(key, value, len(json.dumps(value)))
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value, len(json.dumps(value)))
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        removed = self.memory.clear()
+        if self.disk is not None:
+            removed = max(removed, self.disk.clear())
+        return removed
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        hits = counters['memory_hits'] + counters['disk_hits']
+        lookups = hits + counters['misses']
+        stats = dict(counters, hit_rate=round(hits / lookups, 4) if lookups else 0.0)
+        stats['memory'] = self.memory.stats()
+        if self.disk is not None:
+            stats['disk'] = self.disk.stats()
+        return stats
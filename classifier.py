@@ -0,0 +1,146 @@
+"""
+Rule-based content classification for videos without a speech transcript.
+
+Categories, their keywords and the description produced for each come from a
+JSON rules file (content_rules.json), so new keywords need no code change.
+Every keyword of every category is compiled into one regular expression,
+shaped as a trie so the regex engine branches on one character at a time
+instead of trying each keyword in turn. A single scan per field finds which
+keywords occur anywhere in it, with the same substring semantics as `word in
+text`. Categories are scored by the weight of the field (title, tags,
+description) each keyword was found in.
+"""
+
+import hashlib
+import json
+import re
+
+
+def trie_pattern(words):
+    """A regex matching any of words, longest first, built as a character trie"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # A word ending here is only taken when no longer word continues
+        return f"(?:{body})?" if '' in node else body
+
+    return emit(trie)
+
+
+class ContentClassifier:
+    """Pick a category and its description for a video from title, tags and description"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        # Identifies the rule set, e.g. for cache keys of its output
+        self.version = hashlib.sha256(json.dumps(rules, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+        self.weights = rules.get('fields', {'title': 1})
+        self.min_score = rules.get('min_score', 0)
+        self.categories = rules['categories']
+        self._names = [category['name'] for category in self.categories]
+
+        words = set()
+        # keyword -> names of the categories it scores for
+        self._owners = {}
+        for category in self.categories:
+            category['keywords'] = [word.lower() for word in category['keywords']]
+            words.update(category['keywords'])
+            for word in category['keywords']:
+                self._owners.setdefault(word, []).append(category['name'])
+            for variant in category.get('variants', []):
+                for key in ('any', 'all'):
+                    variant[key] = [word.lower() for word in variant.get(key, [])]
+                    words.update(variant[key])
+        words.discard('')
+
+        # One scan finds the longest keyword at each match position; matches
+        # do not overlap, so what a match hides is worked out up front
+        self._pattern = re.compile(trie_pattern(words)) if words else None
+        # Keywords inside a longer one occur wherever it does
+        self._implied = {
+            word: frozenset(other for other in words if other in word)
+            for word in words
+        }
+        # Keywords that can start inside a match and run past its end
+        # ("songame" hides "game" behind "song"), with how far they overlap it
+        self._straddling = {
+            word: tuple(
+                (other, size) for other in sorted(words)
+                for size in range(1, min(len(word), len(other) - 1) + 1)
+                if word.endswith(other[:size])
+            )
+            for word in words
+        }
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def keywords_in(self, text):
+        """Every keyword that occurs in text, case-insensitively"""
+        if not text or self._pattern is None:
+            return frozenset()
+        text = text.lower()
+        found = set()
+        for match in self._pattern.finditer(text):
+            word = match.group()
+            found |= self._implied[word]
+            end = match.end()
+            for other, size in self._straddling[word]:
+                if text.startswith(other, end - size):
+                    found |= self._implied[other]
+        return found
+
+    def scores(self, title=None, description=None, tags=None):
+        """{category name: weighted keyword score} and the keywords found in the title"""
+        scores = dict.fromkeys(self._names, 0)
+        title_words = self.keywords_in(title)
+        for field, words in (('title', title_words),
+                             ('description', self.keywords_in(description)),
+                             ('tags', self.keywords_in(' | '.join(tags)) if tags else ())):
+            weight = self.weights.get(field, 0)
+            for word in words:
+                for name in self._owners.get(word, ()):
+                    scores[name] += weight
+        return scores, title_words
+
+    def classify(self, title=None, description=None, tags=None):
+        """The best-scoring category dict, or None when nothing reaches min_score.
+
+        Ties go to the category listed first in the rules.
+        """
+        return self._best(self.scores(title, description, tags)[0])
+
+    def _best(self, scores):
+        best = None
+        for category in self.categories:
+            score = scores[category['name']]
+            if score > 0 and score >= self.min_score and (best is None or score > scores[best['name']]):
+                best = category
+        return best
+
+    def describe(self, title=None, description=None, tags=None):
+        """The content description for a video; variants of a category are matched on the title"""
+        if not title:
+            return self.rules['untitled']
+        scores, title_words = self.scores(title, description, tags)
+        category = self._best(scores)
+        if category is None:
+            return self.rules['default'].format(title=title)
+        for variant in category.get('variants', []):
+            if variant['any'] and not any(word in title_words for word in variant['any']):
+                continue
+            if variant['all'] and not all(word in title_words for word in variant['all']):
+                continue
+            return variant['transcript'].format(title=title)
+        return category['transcript'].format(title=title)
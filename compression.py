@@ -0,0 +1,107 @@
+"""
+HTTP response compression.
+
+Transcripts, analyses and the static assets are text and shrink 3-5x
+compressed, which matters most on slow mobile connections. Compressor picks brotli or gzip
+from the request's Accept-Encoding (honouring q-values and the server's
+preference for brotli), and compresses bodies of compressible types over a
+size threshold. Streams (server-sent events) are left alone so each event is
+delivered as soon as it is generated. Compressed copies of files that carry a
+strong ETag (static assets) are kept, so each is compressed once per worker.
+"""
+
+import gzip
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+
+class Compressor:
+    """Negotiate and apply Content-Encoding for Flask responses"""
+
+    def __init__(self, min_bytes=1024, gzip_level=6, brotli_quality=5, cache_entries=64):
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_entries = cache_entries
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'skipped_small': 0, 'cache_hits': 0}
+
+    def negotiate(self, accept_encodings):
+        """The encoding to use for a request's Accept-Encoding, or None"""
+        return accept_encodings.best_match(self.encodings)
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level)
+
+    def _cached_compress(self, data, encoding, etag):
+        """Compress data, reusing the result for a strong ETag seen before"""
+        if not etag:
+            return self.compress(data, encoding)
+        key = (etag, encoding)
+        with self._lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+                self._counters['cache_hits'] += 1
+                return body
+        body = self.compress(data, encoding)
+        with self._lock:
+            self._cache[key] = body
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return body
+
+    def apply(self, response, accept_encodings):
+        """Compress a response in place when it is worth it and the client accepts it"""
+        if (response.status_code != 200 or (response.is_streamed and not response.direct_passthrough)
+                or 'Content-Encoding' in response.headers or 'Content-Range' in response.headers
+                or not response.mimetype.startswith(COMPRESSIBLE_TYPES)
+                or response.mimetype == 'text/event-stream'):
+            return response
+
+        # Caches must keep the encodings apart even when this one is not compressed
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate(accept_encodings)
+        if encoding is None:
+            return response
+
+        # send_file responses hand the file straight to the server; read it here
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < self.min_bytes:
+            with self._lock:
+                self._counters['skipped_small'] += 1
+            return response
+
+        etag, weak = response.get_etag()
+        body = self._cached_compress(data, encoding, None if weak else etag)
+        if len(body) >= len(data):
+            return response
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            # The bytes differ from the identity encoding, so the validator is weak
+            response.set_etag(etag, weak=True)
+        with self._lock:
+            self._counters['responses'] += 1
+            self._counters['bytes_in'] += len(data)
+            self._counters['bytes_out'] += len(body)
+        return response
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return dict(counters, encodings=self.encodings, min_bytes=self.min_bytes,
+                    ratio=round(counters['bytes_in'] / counters['bytes_out'], 2) if counters['bytes_out'] else None)
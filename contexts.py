@@ -0,0 +1,113 @@
+"""
+Per-transcript model context caching.
+
+A user typically asks several questions about the same video, and each one
+used to re-send the transcript. ContextCache registers the transcript and the
+answer instructions with the provider once (Gemini CachedContent) so later
+questions send only the question and reference the cached context by name.
+
+Handles are shared between workers through a DiskCache. The provider-side
+expiry follows session inactivity: a use pushes it out again once less than
+half the TTL remains, so an abandoned transcript's context expires on its
+own. Transcripts the provider refuses to cache (too short, unsupported
+model) are remembered for refusal_ttl so they are not retried on every
+question; other failures (rate limits, a full queue, network errors) are
+retried by the next question.
+"""
+
+import threading
+import time
+
+
+# Provider errors that will not go away by asking again
+REFUSAL_PATTERNS = ('too small', 'min_total_token_count', 'not supported', 'unsupported',
+                    'not found for api version')
+
+
+def is_refusal(error):
+    """True for errors that mean the provider will never cache this context"""
+    text = f"{type(error).__name__} {error}".lower()
+    return any(pattern in text for pattern in REFUSAL_PATTERNS)
+
+
+class ContextCache:
+    """Map transcript handles to provider-side cached contexts"""
+
+    def __init__(self, backend, store, model, ttl=3600, min_tokens=32768, refusal_ttl=600):
+        """backend provides create_context(model, system_instruction, contents, ttl)
+        returning a name, touch_context(name, ttl) and delete_context(name), as
+        the llm module does; store is a DiskCache for the handles.
+        """
+        self.backend = backend
+        self.store = store
+        self.model = model
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.refusal_ttl = refusal_ttl
+        self._lock = threading.Lock()
+        self._counters = {'created': 0, 'reused': 0, 'refreshed': 0, 'skipped': 0,
+                          'failed': 0, 'expired': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key, system_instruction, contents, tokens):
+        """The cached context name for key, creating it if needed; None to send inline"""
+        if tokens < self.min_tokens:
+            self._count('skipped')
+            return None
+
+        now = time.time()
+        entry = self.store.get(key)
+        if entry is not None and entry['name'] is None:
+            self._count('skipped')
+            return None
+        # Leave a margin so a context never expires between lookup and use
+        if entry is not None and entry['expires_at'] > now + 60:
+            if entry['expires_at'] - now < self.ttl / 2:
+                try:
+                    self.backend.touch_context(entry['name'], self.ttl)
+                    entry['expires_at'] = now + self.ttl
+                    self.store.set(key, entry, ttl=self.ttl)
+                    self._count('refreshed')
+                except Exception as e:
+                    print(f"Could not extend cached context {entry['name']}: {str(e)}")
+                    self.store.delete(key)
+                    entry = None
+            if entry is not None:
+                self._count('reused')
+                return entry['name']
+
+        try:
+            name = self.backend.create_context(self.model, system_instruction, contents, self.ttl)
+            self._count('created')
+        except Exception as e:
+            print(f"Context caching unavailable for {key}, sending the transcript inline: {str(e)}")
+            self._count('failed')
+            if is_refusal(e):
+                self.store.set(key, {'name': None, 'expires_at': now + self.refusal_ttl},
+                               ttl=self.refusal_ttl)
+            return None
+        self.store.set(key, {'name': name, 'expires_at': now + self.ttl}, ttl=self.ttl)
+        return name
+
+    def expire(self, key):
+        """Forget a context the provider no longer has (e.g. it expired early)"""
+        self.store.delete(key)
+        self._count('expired')
+
+    def delete(self, key):
+        """Delete a transcript's cached context from the provider"""
+        entry = self.store.get(key)
+        self.store.delete(key)
+        if entry and entry['name']:
+            try:
+                self.backend.delete_context(entry['name'])
+            except Exception as e:
+                print(f"Could not delete cached context {entry['name']}: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, ttl=self.ttl, refusal_ttl=self.refusal_ttl,
+                        min_tokens=self.min_tokens, model=self.model)
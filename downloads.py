@@ -0,0 +1,174 @@
+"""
+Download strategy engine.
+
+Instead of re-running yt-dlp from scratch after every failure, each failed
+attempt is classified and the engine either retries the same strategy after a
+bounded exponential backoff, moves on to the strategy that addresses the
+failure, or gives up straight away when nothing can help (private, removed or
+geo-blocked videos). Latency and outcome of every attempt are recorded.
+"""
+
+import threading
+import time
+
+
+FORBIDDEN = 'forbidden'
+GEO_BLOCKED = 'geo_blocked'
+UNAVAILABLE = 'unavailable'
+FORMAT_UNAVAILABLE = 'format_unavailable'
+POSTPROCESS = 'postprocess'
+TRANSIENT = 'transient'
+NO_OUTPUT = 'no_output'
+UNKNOWN = 'unknown'
+
+# Checked in order against the lowercased error message
+ERROR_PATTERNS = [
+    (GEO_BLOCKED, ('available in your country', 'geo restrict', 'geo-restrict',
+                   'georestrict', 'blocked it in your country')),
+    (UNAVAILABLE, ('private video', 'video unavailable', 'has been removed', 'sign in to confirm',
+                   'members-only', 'this video is not available', 'account associated with this video',
+                   'unsupported url', 'is not a valid url')),
+    (FORMAT_UNAVAILABLE, ('requested format is not available', 'format is not available',
+                          'no video formats found')),
+    (FORBIDDEN, ('http error 403', 'forbidden')),
+    (POSTPROCESS, ('postprocessing', 'ffmpeg', 'ffprobe', 'audio conversion failed')),
+    (TRANSIENT, ('timed out', 'timeout', 'connection', 'temporary failure', 'http error 429',
+                 'http error 5', 'incomplete', 'network is unreachable')),
+]
+
+# Failures no other strategy can fix
+FAIL_FAST = {GEO_BLOCKED, UNAVAILABLE}
+# Failures worth retrying with the same strategy (403s with a fresh extraction)
+RETRY_SAME = {FORBIDDEN, TRANSIENT}
+
+MESSAGES = {
+    GEO_BLOCKED: "This video is not available in the server's region.",
+    UNAVAILABLE: 'This video is private, removed or requires sign-in.',
+}
+DEFAULT_MESSAGE = 'Failed to download audio from video. Please try a different YouTube URL.'
+
+
+def classify_error(error):
+    """Map a yt-dlp/FFmpeg exception to one of the error classes above"""
+    if 'GeoRestricted' in type(error).__name__:
+        return GEO_BLOCKED
+    message = str(error).lower()
+    for error_class, patterns in ERROR_PATTERNS:
+        if any(pattern in message for pattern in patterns):
+            return error_class
+    return UNKNOWN
+
+
+class DownloadFailed(Exception):
+    """Every applicable strategy failed; error_class says why the last one did"""
+
+    def __init__(self, error_class, detail=None):
+        super().__init__(MESSAGES.get(error_class, DEFAULT_MESSAGE))
+        self.error_class = error_class
+        self.detail = detail
+
+
+class DownloadStats:
+    """Per-strategy attempt latency and outcome counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._strategies = {}
+        self._errors = {}
+        self._counters = {'downloads': 0, 'succeeded': 0, 'failed': 0, 'attempts': 0,
+                          'backoff_seconds': 0.0}
+
+    def record_attempt(self, strategy, seconds, error_class=None):
+        with self._lock:
+            entry = self._strategies.setdefault(
+                strategy, {'attempts': 0, 'successes': 0, 'failures': 0, 'seconds': 0.0}
+            )
+            entry['attempts'] += 1
+            entry['seconds'] += seconds
+            entry['successes' if error_class is None else 'failures'] += 1
+            self._counters['attempts'] += 1
+            if error_class is not None:
+                self._errors[error_class] = self._errors.get(error_class, 0) + 1
+
+    def record_download(self, succeeded, backoff_seconds):
+        with self._lock:
+            self._counters['downloads'] += 1
+            self._counters['succeeded' if succeeded else 'failed'] += 1
+            self._counters['backoff_seconds'] += backoff_seconds
+
+    def stats(self):
+        with self._lock:
+            strategies = {
+                name: dict(entry, seconds=round(entry['seconds'], 3),
+                           avg_seconds=round(entry['seconds'] / entry['attempts'], 3))
+                for name, entry in self._strategies.items()
+            }
+            return dict(self._counters, backoff_seconds=round(self._counters['backoff_seconds'], 3),
+                        errors=dict(self._errors), strategies=strategies)
+
+
+def run_strategies(strategies, attempt, max_attempts=4, max_retries=2, backoff_base=0.5,
+                   backoff_max=4.0, stats=None, on_attempt=None, sleep=time.sleep):
+    """Work through strategies until attempt(strategy, refresh) returns a result.
+
+    strategies are dicts with at least 'name' and 'postprocess'. attempt
+    raises on failure (or returns None when nothing was written); refresh is
+    True when the previous failure suggests the extracted info is stale.
+    on_attempt(strategy_name, seconds, error_class) is called after every
+    attempt. Raises DownloadFailed when the strategies or max_attempts run out.
+    """
+    index = 0
+    attempts = 0
+    retries = 0
+    refresh = False
+    backoff_total = 0.0
+    last_class, last_detail = UNKNOWN, None
+
+    while index < len(strategies) and attempts < max_attempts:
+        strategy = strategies[index]
+        attempts += 1
+        started = time.perf_counter()
+        try:
+            result = attempt(strategy, refresh)
+            error_class = None if result else NO_OUTPUT
+            detail = None if result else 'no audio file was written'
+        except Exception as e:
+            result = None
+            error_class = classify_error(e)
+            detail = str(e)
+        seconds = time.perf_counter() - started
+        if stats is not None:
+            stats.record_attempt(strategy['name'], seconds, error_class)
+        if on_attempt is not None:
+            on_attempt(strategy['name'], seconds, error_class)
+
+        if error_class is None:
+            if stats is not None:
+                stats.record_download(True, backoff_total)
+            return result
+
+        print(f"Download attempt {attempts} ({strategy['name']}) failed [{error_class}]: {detail}")
+        last_class, last_detail = error_class, detail
+        refresh = False
+
+        if error_class in FAIL_FAST:
+            break
+        if error_class in RETRY_SAME and retries < max_retries:
+            retries += 1
+            refresh = error_class == FORBIDDEN
+            delay = min(backoff_max, backoff_base * 2 ** (retries - 1))
+            backoff_total += delay
+            sleep(delay)
+            continue
+
+        retries = 0
+        if error_class == POSTPROCESS:
+            # Skip straight to the first strategy that does not transcode
+            index = next((i for i in range(index + 1, len(strategies))
+                          if not strategies[i]['postprocess']), len(strategies))
+        else:
+            index += 1
+
+    if stats is not None:
+        stats.record_download(False, backoff_total)
+    raise DownloadFailed(last_class, last_detail)
@@ -0,0 +1,34 @@
+"""
+Gunicorn configuration for the async (gevent) serving mode.
+
+    gunicorn -c gunicorn_async.py app:app
+
+Each worker runs requests as greenlets on one event loop. Sockets, sleeps,
+locks and subprocess pipes are monkey-patched to yield instead of block, so
+a request waiting on Gemini, yt-dlp or FFmpeg costs a greenlet, not a thread,
+and a single worker can hold hundreds of them. CPU-bound work (the offline
+transcription engine) still runs one piece at a time per worker; keep the
+threaded workers from the Procfile for that.
+
+Settings come from the environment; command-line flags override them.
+"""
+
+import os
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'gevent'
+# Concurrent requests (greenlets) per worker
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+keepalive = 5
+
+
+def post_worker_init(worker):
+    """Let gRPC clients (Cloud Speech) cooperate with gevent instead of blocking the worker"""
+    try:
+        from grpc.experimental import gevent as grpc_gevent
+    except ImportError:
+        return
+    grpc_gevent.init_gevent()
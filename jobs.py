@@ -0,0 +1,172 @@
+"""
+Background job queue for long-running video processing.
+
+Jobs run on a bounded thread pool inside each worker process. Submissions are
+de-duplicated by key (the video ID), so a second request for a video that is
+already being processed attaches to the in-flight job instead of starting
+another download. Job state is optionally mirrored to a DiskCache so a status
+poll that lands on a different gunicorn worker can still see it.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Job:
+    """A single unit of work and its outcome"""
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        # The exception itself, for callers in this process; only error is persisted
+        self.exception = None
+        # Machine-readable reason for a failure, from the exception's error_code
+        self.error_code = None
+        self.progress = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def wait(self, timeout=None):
+        """Block until the job finishes; returns False on timeout"""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        data = {
+            'job_id': self.id,
+            'key': self.key,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.progress is not None and not self.finished:
+            data['progress'] = self.progress
+        if self.status == DONE:
+            data['result'] = self.result
+        if self.status == FAILED:
+            data['error'] = self.error
+            if self.error_code:
+                data['error_code'] = self.error_code
+        return data
+
+
+class JobQueue:
+    """Bounded worker pool with per-key de-duplication"""
+
+    def __init__(self, max_workers=2, result_ttl=3600, store=None):
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='askvid-job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._inflight = {}
+        self._counters = {'submitted': 0, 'deduplicated': 0, 'completed': 0, 'failed': 0}
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) unless a job for key is already in flight.
+
+        Returns (job, created) where created is False when the caller was
+        attached to an existing job.
+        """
+        with self._lock:
+            self._prune()
+            existing = self._inflight.get(key)
+            if existing is not None:
+                self._counters['deduplicated'] += 1
+                return existing, False
+
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            self._counters['submitted'] += 1
+
+        self._persist(job)
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job, True
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._persist(job)
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            print(f"Job {job.id} ({job.key}) failed: {str(e)}")
+            job.error = str(e)
+            job.exception = e
+            job.error_code = getattr(e, 'error_code', None)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+                self._counters['completed' if job.status == DONE else 'failed'] += 1
+            self._persist(job)
+            job._done.set()
+
+    def report_progress(self, key, progress):
+        """Attach a progress dict to the in-flight job for key, if there is one"""
+        job = self.inflight(key)
+        if job is not None:
+            job.progress = progress
+            self._persist(job)
+
+    def _persist(self, job):
+        if self.store is not None:
+            try:
+                self.store.set(job.id, job.to_dict(), ttl=self.result_ttl)
+            except Exception as e:
+                print(f"Could not persist job {job.id}: {str(e)}")
+
+    def _prune(self):
+        """Forget finished jobs older than result_ttl (caller holds the lock)"""
+        cutoff = time.time() - self.result_ttl
+        stale = [job_id for job_id, job in self._jobs.items()
+                 if job.finished and job.finished_at < cutoff]
+        for job_id in stale:
+            del self._jobs[job_id]
+
+    def inflight(self, key):
+        """Return the queued or running job for key in this process, if any"""
+        with self._lock:
+            return self._inflight.get(key)
+
+    def get(self, job_id):
+        """Return a job's status dict, checking the shared store on a local miss"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.store is not None:
+            return self.store.get(job_id)
+        return None
+
+    def get_job(self, job_id):
+        """Return the local Job object (only for jobs submitted in this process)"""
+        return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job.status == QUEUED)
+            running = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+            return dict(self._counters, queued=queued, running=running,
+                        max_workers=self.max_workers)
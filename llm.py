@@ -0,0 +1,369 @@
+"""
+Shared Gemini client registry and outbound call scheduler.
+
+The google.generativeai SDK is imported and configured on first use rather
+than at import time, and one GenerativeModel per model name is reused across
+requests and threads instead of being constructed for every call.
+
+Every model call goes through one Scheduler per process. It caps how many
+calls run at once, paces them with a token bucket, retries rate-limit errors
+with jittered exponential backoff, and lets identical prompts that are in
+flight at the same time share one call. A burst therefore waits in the queue
+(up to queue_timeout) rather than failing at the provider.
+"""
+
+import datetime
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import metrics
+
+
+_lock = threading.Lock()
+_api_key = None
+_transport = None
+_genai = None
+_models = {}
+# Models bound to cached contexts (see contexts.py), most recently used last
+_context_models = OrderedDict()
+MAX_CONTEXT_MODELS = 256
+_stats = {'models_created': 0, 'lookups': 0}
+
+
+def configure(api_key, transport=None):
+    """Remember the API key (and SDK transport); the SDK is configured lazily on first use"""
+    global _api_key, _transport, _genai
+    with _lock:
+        _api_key = api_key
+        _transport = transport
+        _genai = None
+        _models.clear()
+        _context_models.clear()
+
+
+def genai():
+    """The google.generativeai module, imported and configured on first use"""
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as module
+                if _api_key:
+                    options = {'transport': _transport} if _transport else {}
+                    module.configure(api_key=_api_key, **options)
+                _genai = module
+    return _genai
+
+
+def get_model(name):
+    """Return the shared GenerativeModel for name, creating it on first use"""
+    _stats['lookups'] += 1
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    sdk = genai()
+    with _lock:
+        model = _models.get(name)
+        if model is None:
+            model = sdk.GenerativeModel(name)
+            _models[name] = model
+            _stats['models_created'] += 1
+    return model
+
+
+QUEUE_DEPTH = metrics.REGISTRY.gauge(
+    'askvid_llm_queue_depth', 'Model calls waiting for a concurrency slot or rate-limit token')
+IN_FLIGHT = metrics.REGISTRY.gauge('askvid_llm_in_flight', 'Model calls currently running')
+QUEUE_WAIT_SECONDS = metrics.REGISTRY.histogram(
+    'askvid_llm_queue_wait_seconds', 'Time model calls spent queued before running')
+RETRIES = metrics.REGISTRY.counter('askvid_llm_retries_total', 'Model calls retried after a rate-limit error')
+COALESCED = metrics.REGISTRY.counter(
+    'askvid_llm_coalesced_total', 'Model calls answered by an identical call already in flight')
+
+RATE_LIMIT_PATTERNS = ('429', 'resourceexhausted', 'resource exhausted', 'rate limit', 'quota',
+                       'too many requests')
+
+
+def is_rate_limited(error):
+    """True for provider errors that ask the caller to slow down (HTTP 429, quota)"""
+    text = f"{type(error).__name__} {error}".lower()
+    return any(pattern in text for pattern in RATE_LIMIT_PATTERNS)
+
+
+class LLMUnavailable(Exception):
+    """The model could not be called: the queue wait ran out, or it stayed rate-limited"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """rate_per_minute calls on average, in bursts of up to burst"""
+
+    def __init__(self, rate_per_minute, burst=None, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, rate_per_minute // 10))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, timeout=None):
+        """Take a token; returns the seconds to wait before using it, or None if over timeout"""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if timeout is not None and wait > timeout:
+                return None
+            # Tokens may go negative: later callers queue behind this reservation
+            self.tokens -= 1
+            return wait
+
+
+class Scheduler:
+    """Concurrency cap, rate limit, retries and coalescing for model calls"""
+
+    def __init__(self, max_concurrent=4, rate_per_minute=0, burst=None, max_retries=3,
+                 backoff_base=1.0, backoff_max=30.0, queue_timeout=60.0, sleep=time.sleep):
+        self.max_concurrent = max_concurrent
+        self.rate_per_minute = rate_per_minute
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self.sleep = sleep
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        self._bucket = TokenBucket(rate_per_minute, burst) if rate_per_minute > 0 else None
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._queued = 0
+        self._running = 0
+        self._counters = {'calls': 0, 'coalesced': 0, 'retries': 0, 'rate_limited': 0,
+                          'rejected': 0, 'queue_seconds': 0.0}
+
+    def _acquire(self):
+        """Wait for a concurrency slot and a rate-limit token"""
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        with self._lock:
+            self._queued += 1
+        QUEUE_DEPTH.inc()
+        try:
+            if self._slots is not None and not self._slots.acquire(timeout=self.queue_timeout):
+                self._reject()
+            if self._bucket is not None:
+                wait = self._bucket.reserve(max(0.0, deadline - time.monotonic()))
+                if wait is None:
+                    if self._slots is not None:
+                        self._slots.release()
+                    self._reject()
+                if wait:
+                    try:
+                        self.sleep(wait)
+                    except BaseException:
+                        # Interrupted (e.g. GreenletExit): give the slot back
+                        if self._slots is not None:
+                            self._slots.release()
+                        raise
+        finally:
+            with self._lock:
+                self._queued -= 1
+            QUEUE_DEPTH.dec()
+
+        waited = time.monotonic() - started
+        QUEUE_WAIT_SECONDS.observe(waited)
+        IN_FLIGHT.inc()
+        with self._lock:
+            self._running += 1
+            self._counters['calls'] += 1
+            self._counters['queue_seconds'] += waited
+
+    def _reject(self):
+        with self._lock:
+            self._counters['rejected'] += 1
+        raise LLMUnavailable('Too many model requests are queued. Please try again shortly.',
+                             retry_after=self.queue_timeout)
+
+    def _release(self):
+        IN_FLIGHT.dec()
+        with self._lock:
+            self._running -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def _call(self, fn, hold=False):
+        """fn() under a slot, retrying rate-limit errors; with hold the slot is kept on success"""
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                self._release()
+                if not is_rate_limited(e):
+                    raise
+                with self._lock:
+                    self._counters['rate_limited'] += 1
+                if attempt == self.max_retries:
+                    raise LLMUnavailable('The model is rate-limited. Please try again shortly.',
+                                         retry_after=self.backoff_max) from e
+                # Equal jitter: at least half the exponential delay, so retries stay spread out
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                delay = delay / 2 + random.uniform(0, delay / 2)
+                print(f"Model rate-limited, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s: {str(e)}")
+                RETRIES.inc()
+                with self._lock:
+                    self._counters['retries'] += 1
+                self.sleep(delay)
+                continue
+            except BaseException:
+                self._release()
+                raise
+            if not hold:
+                self._release()
+            return result
+
+    def run(self, fn, key=None):
+        """Run fn() as one model call.
+
+        Callers passing the same key while a call for it is in flight wait for
+        that call and share its result (or exception) instead of making their own.
+        """
+        if key is None:
+            return self._call(fn)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self._counters['coalesced'] += 1
+        if not leader:
+            COALESCED.inc()
+            return future.result()
+
+        try:
+            result = self._call(fn)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # The leader was interrupted (GreenletExit, KeyboardInterrupt); its
+            # followers must not wait forever, nor inherit the interrupt
+            future.set_exception(LLMUnavailable('The model call was interrupted. Please try again.'))
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    @contextmanager
+    def streaming(self, fn):
+        """Run fn() (a streamed response) and keep its slot until the block exits"""
+        response = self._call(fn, hold=True)
+        try:
+            yield response
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, queue_seconds=round(self._counters['queue_seconds'], 3),
+                        queued=self._queued, in_flight=self._running,
+                        max_concurrent=self.max_concurrent, rate_per_minute=self.rate_per_minute)
+
+
+_scheduler = Scheduler()
+
+
+def configure_scheduler(**options):
+    """Replace the shared scheduler (see Scheduler for the options)"""
+    global _scheduler
+    _scheduler = Scheduler(**options)
+
+
+def context_model(context):
+    """The shared GenerativeModel bound to a cached context, created on first use"""
+    _stats['lookups'] += 1
+    with _lock:
+        model = _context_models.get(context)
+        if model is not None:
+            _context_models.move_to_end(context)
+            return model
+
+    model = genai().GenerativeModel.from_cached_content(cached_content=context)
+    with _lock:
+        _context_models[context] = model
+        _stats['models_created'] += 1
+        while len(_context_models) > MAX_CONTEXT_MODELS:
+            _context_models.popitem(last=False)
+    return model
+
+
+def _model_for(name, context):
+    return context_model(context) if context else get_model(name)
+
+
+def generate(name, prompt, context=None):
+    """generate_content on the shared model through the scheduler.
+
+    With context (a cached context name) the prompt is sent on top of that
+    cached context. Identical prompts to the same model and context that
+    overlap in time share one call.
+    """
+    model = _model_for(name, context)
+    key = hashlib.sha256(f"{name}\x1f{context}\x1f{prompt}".encode('utf-8')).hexdigest()
+    return _scheduler.run(lambda: model.generate_content(prompt), key)
+
+
+def stream(name, prompt, context=None):
+    """Context manager yielding a streamed response; the scheduler slot is held until exit"""
+    model = _model_for(name, context)
+    return _scheduler.streaming(lambda: model.generate_content(prompt, stream=True))
+
+
+def caching():
+    """The SDK's context caching module"""
+    genai()
+    from google.generativeai import caching as module
+    return module
+
+
+def create_context(name, system_instruction, contents, ttl):
+    """Register cached context with the provider; returns its resource name.
+
+    Concurrent requests to cache the same context share one call.
+    """
+    key = hashlib.sha256(f"context\x1f{name}\x1f{system_instruction}\x1f{contents}".encode('utf-8')).hexdigest()
+    cached = _scheduler.run(lambda: caching().CachedContent.create(
+        model=name, system_instruction=system_instruction, contents=[contents],
+        ttl=datetime.timedelta(seconds=ttl)
+    ), key)
+    return cached.name
+
+
+def touch_context(context, ttl):
+    """Push a cached context's expiry ttl seconds into the future"""
+    caching().CachedContent.get(name=context).update(ttl=datetime.timedelta(seconds=ttl))
+
+
+def delete_context(context):
+    with _lock:
+        _context_models.pop(context, None)
+    caching().CachedContent.get(name=context).delete()
+
+
+def stats():
+    with _lock:
+        return dict(_stats, models=sorted(_models), context_models=len(_context_models),
+                    scheduler=_scheduler.stats())
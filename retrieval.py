@@ -0,0 +1,177 @@
+"""
+Retrieval for question answering over long transcripts.
+
+The transcript is cut into overlapping word windows and indexed with BM25, so
+each question only sends the most relevant chunks to the model instead of the
+whole transcript. Short transcripts that already fit the token budget are sent
+as-is.
+"""
+
+import math
+import re
+import threading
+from collections import Counter
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can did do does for from had has have how i if in
+into is it its me my no not of on or so than that the their them then there
+these they this to was we were what when where which who why will with would
+you your about video tell explain says said
+""".split())
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def chunk_transcript(transcript, window_words=180, overlap_words=40):
+    """Split a transcript into overlapping windows of words"""
+    words = transcript.split()
+    if not words:
+        return []
+
+    step = max(1, window_words - overlap_words)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append({
+            'index': len(chunks),
+            'start_word': start,
+            'text': ' '.join(words[start:start + window_words]),
+        })
+        if start + window_words >= len(words):
+            break
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over transcript chunks"""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(chunk['text'])) for chunk in chunks]
+        self.lengths = [sum(freqs.values()) for freqs in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+
+        doc_freqs = Counter()
+        for freqs in self.term_freqs:
+            doc_freqs.update(freqs.keys())
+        total = len(chunks)
+        self.idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+    def search(self, query, k=5):
+        """Return [(score, chunk_index)] for the k best-matching chunks"""
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        if not terms:
+            return []
+
+        scores = []
+        for index, freqs in enumerate(self.term_freqs):
+            length_norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+            score = 0.0
+            for term in terms:
+                tf = freqs.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + length_norm)
+            if score > 0:
+                scores.append((score, index))
+
+        scores.sort(reverse=True)
+        return scores[:k]
+
+
+class TranscriptIndex:
+    """Chunks and BM25 index for one transcript"""
+
+    def __init__(self, transcript, window_words=180, overlap_words=40):
+        self.transcript = transcript
+        self.full_tokens = estimate_tokens(transcript)
+        self.chunks = chunk_transcript(transcript, window_words, overlap_words)
+        self.bm25 = BM25Index(self.chunks)
+
+    def select(self, question, token_budget=3000, top_k=6):
+        """Pick the context to send for a question.
+
+        Returns (context, report). The whole transcript is used when it fits
+        the budget. Otherwise the top-k BM25 chunks that fit are returned in
+        transcript order; questions with no matching terms (e.g. "summarize
+        this") get chunks spread evenly across the video instead.
+        """
+        if self.full_tokens <= token_budget or not self.chunks:
+            return self.transcript, {
+                'strategy': 'full',
+                'full_tokens': self.full_tokens,
+                'context_tokens': self.full_tokens,
+                'chunks_used': len(self.chunks),
+                'chunks_total': len(self.chunks),
+            }
+
+        ranked = [index for _, index in self.bm25.search(question, k=top_k)]
+        strategy = 'bm25'
+        if not ranked:
+            strategy = 'spread'
+            count = min(top_k, len(self.chunks))
+            stride = len(self.chunks) / count
+            ranked = sorted({int(i * stride) for i in range(count)})
+
+        chosen = []
+        used_tokens = 0
+        for index in ranked:
+            tokens = estimate_tokens(self.chunks[index]['text'])
+            if chosen and used_tokens + tokens > token_budget:
+                continue
+            chosen.append(index)
+            used_tokens += tokens
+
+        chosen.sort()
+        context = '\n...\n'.join(self.chunks[index]['text'] for index in chosen)
+        return context, {
+            'strategy': strategy,
+            'full_tokens': self.full_tokens,
+            'context_tokens': estimate_tokens(context),
+            'chunks_used': len(chosen),
+            'chunks_total': len(self.chunks),
+        }
+
+
+class RetrievalStats:
+    """Running totals of prompt size before and after retrieval"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retrieved = 0
+        self.full_tokens = 0
+        self.context_tokens = 0
+
+    def record(self, report):
+        with self._lock:
+            self.requests += 1
+            if report['strategy'] != 'full':
+                self.retrieved += 1
+            self.full_tokens += report['full_tokens']
+            self.context_tokens += report['context_tokens']
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retrieved': self.retrieved,
+                'full_tokens': self.full_tokens,
+                'context_tokens': self.context_tokens,
+                'avg_full_tokens': round(self.full_tokens / self.requests, 1) if self.requests else 0,
+                'avg_context_tokens': round(self.context_tokens / self.requests, 1) if self.requests else 0,
+                'token_reduction': round(1 - self.context_tokens / self.full_tokens, 4) if self.full_tokens else 0.0,
+            }
@@ -0,0 +1,204 @@
+"""
+Full-text search across every processed transcript.
+
+TranscriptSearch keeps an SQLite FTS5 index, one document per video, in its
+own database next to the cache so it outlives cache eviction. Documents are
+updated incrementally: re-adding a video replaces its row only when the
+transcript actually changed. Queries are ranked with BM25 (title matches
+weigh more than transcript matches) and return a highlighted snippet.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from cache import connection_local
+
+
+# BM25 column weights: video_id (unindexed), title, transcript
+TITLE_WEIGHT = 4.0
+TRANSCRIPT_WEIGHT = 1.0
+
+
+def fts5_available():
+    """True when the sqlite3 module was built with FTS5"""
+    try:
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE VIRTUAL TABLE probe USING fts5(text)')
+        conn.close()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def build_match_query(query):
+    """Turn free text into an FTS5 query: every word must appear, the last as a prefix.
+
+    Words are quoted so user input never reaches the FTS5 query syntax
+    (operators, column filters, unbalanced quotes).
+    """
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words[:-1]]
+    terms.append(f'"{words[-1]}"*')
+    return ' '.join(terms)
+
+
+class TranscriptSearch:
+    """Persistent inverted index of transcripts keyed by video ID"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = connection_local()
+        self._lock = threading.Lock()
+        self._counters = {'queries': 0, 'query_seconds': 0.0, 'indexed': 0, 'unchanged': 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                video_id TEXT PRIMARY KEY,
+                doc_id INTEGER NOT NULL,
+                transcript_id TEXT NOT NULL,
+                title TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute('CREATE INDEX IF NOT EXISTS documents_doc ON documents (doc_id)')
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS transcripts USING fts5(
+                video_id UNINDEXED, title, transcript,
+                tokenize = 'porter unicode61 remove_diacritics 2'
+            )
+        """)
+
+    def _unchanged(self, row, transcript_id, title):
+        return row is not None and row[1] == transcript_id and (title is None or row[2] == title)
+
+    def add(self, video_id, transcript, transcript_id, title=None):
+        """Index (or re-index) a video's transcript; returns False when it was unchanged"""
+        conn = self._connect()
+        select = 'SELECT doc_id, transcript_id, title FROM documents WHERE video_id = ?'
+        # Every cache hit re-adds its video, so the common case skips the write lock
+        if self._unchanged(conn.execute(select, (video_id,)).fetchone(), transcript_id, title):
+            with self._lock:
+                self._counters['unchanged'] += 1
+            return False
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Read again under the write lock: a concurrent add may have
+            # replaced the row, and its FTS row is the one to delete
+            row = conn.execute(select, (video_id,)).fetchone()
+            if self._unchanged(row, transcript_id, title):
+                conn.execute('COMMIT')
+                with self._lock:
+                    self._counters['unchanged'] += 1
+                return False
+            # video_id is not indexed inside FTS5, so rows are addressed by rowid
+            if row is not None:
+                conn.execute('DELETE FROM transcripts WHERE rowid = ?', (row[0],))
+            doc_id = conn.execute(
+                'INSERT INTO transcripts (video_id, title, transcript) VALUES (?, ?, ?)',
+                (video_id, title or '', transcript)
+            ).lastrowid
+            conn.execute(
+                'INSERT OR REPLACE INTO documents (video_id, doc_id, transcript_id, title, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (video_id, doc_id, transcript_id, title, time.time())
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        with self._lock:
+            self._counters['indexed'] += 1
+        return True
+
+    def remove(self, video_id):
+        """Drop a video from the index; returns True if it was there"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT doc_id FROM documents WHERE video_id = ?', (video_id,)).fetchone()
+            if row is not None:
+                conn.execute('DELETE FROM transcripts WHERE rowid = ?', (row[0],))
+                conn.execute('DELETE FROM documents WHERE video_id = ?', (video_id,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return row is not None
+
+    def search(self, query, limit=20, offset=0):
+        """Ranked matches as [{'video_id', 'title', 'transcript_id', 'score', 'snippet'}]"""
+        match = build_match_query(query)
+        if match is None:
+            return []
+
+        started = time.perf_counter()
+        conn = self._connect()
+        # Rank first, then build snippets for the returned page only; computing
+        # snippet() for every match dominates queries on common words
+        ranked = conn.execute(f"""
+            SELECT rowid, bm25(transcripts, 0.0, {TITLE_WEIGHT}, {TRANSCRIPT_WEIGHT}) AS score
+            FROM transcripts WHERE transcripts MATCH ?
+            ORDER BY score LIMIT ? OFFSET ?
+        """, (match, limit, offset)).fetchall()
+        details = {}
+        if ranked:
+            placeholders = ','.join('?' * len(ranked))
+            details = {row[0]: row[1:] for row in conn.execute(f"""
+                SELECT t.rowid, d.video_id, d.title, d.transcript_id,
+                       snippet(transcripts, 2, '[', ']', '…', 16)
+                FROM transcripts t JOIN documents d ON d.doc_id = t.rowid
+                WHERE transcripts MATCH ? AND t.rowid IN ({placeholders})
+            """, [match] + [rowid for rowid, _ in ranked])}
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self._counters['queries'] += 1
+            self._counters['query_seconds'] += seconds
+
+        # bm25() is lower-is-better; report it negated so higher means more relevant
+        results = []
+        for rowid, score in ranked:
+            # A row re-indexed between the two queries no longer has a document
+            if rowid not in details:
+                continue
+            video_id, title, transcript_id, snippet = details[rowid]
+            results.append({'video_id': video_id, 'title': title, 'transcript_id': transcript_id,
+                            'score': round(-score, 4), 'snippet': snippet})
+        return results
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def optimize(self):
+        """Merge the index's b-trees; worth running after a large bulk load"""
+        self._connect().execute("INSERT INTO transcripts (transcripts) VALUES ('optimize')")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        queries = counters['queries']
+        return dict(counters, documents=len(self),
+                    query_seconds=round(counters['query_seconds'], 4),
+                    avg_query_ms=round(counters['query_seconds'] * 1000 / queries, 3) if queries else 0.0)
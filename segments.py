@@ -0,0 +1,153 @@
+"""
+Timestamped transcript segments with a seekable index.
+
+SegmentIndex keeps segment start/end times and text offsets in flat arrays
+over a single joined text, so a time range or the segment at an offset is
+found by binary search instead of scanning the transcript. A running maximum
+of end times makes the start-sorted arrays usable as an interval index even
+when segments overlap.
+"""
+
+import math
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+
+from transcription import format_timestamp
+
+
+TIMESTAMP_PATTERN = re.compile(r'^(?:(\d+):)?(\d{1,2}):(\d{2}(?:\.\d+)?)$')
+
+
+def parse_timestamp(value):
+    """Seconds from a number or an "M:SS" / "H:MM:SS" string; raises ValueError"""
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        text = str(value).strip()
+        match = TIMESTAMP_PATTERN.match(text)
+        if match:
+            hours, minutes, secs = match.groups()
+            seconds = int(hours or 0) * 3600 + int(minutes) * 60 + float(secs)
+        else:
+            seconds = float(text)
+    if not math.isfinite(seconds):
+        raise ValueError(f"Timestamp is not a finite number: {value}")
+    if seconds < 0:
+        raise ValueError(f"Negative timestamp: {value}")
+    return seconds
+
+
+def detect_time_window(question, padding=60):
+    """(start, end) for questions like "around minute 12" or "between 5:00 and 7:30"
+
+    A single point in time is widened by padding seconds on each side.
+    Returns None when the question names no time.
+    """
+    stamps = re.findall(r'\b(\d{1,2}:\d{2}(?::\d{2})?)\b', question)
+    if len(stamps) >= 2:
+        start, end = sorted(parse_timestamp(stamp) for stamp in stamps[:2])
+        return start, end
+    if stamps:
+        point = parse_timestamp(stamps[0])
+        return max(0.0, point - padding), point + padding
+
+    minutes = re.findall(r'\bminutes?\s+(\d+(?:\.\d+)?)(?:\s*(?:-|to|and)\s*(\d+(?:\.\d+)?))?', question, re.I)
+    if minutes:
+        first, second = minutes[0]
+        if second:
+            return float(first) * 60, float(second) * 60
+        point = float(first) * 60
+        return max(0.0, point - padding), point + padding
+    return None
+
+
+class SegmentIndex:
+    """Array-backed [{'start', 'end', 'text'}] segments with time and text lookups"""
+
+    def __init__(self, segments):
+        segments = sorted(
+            (segment for segment in segments or [] if segment.get('text', '').strip()),
+            key=lambda segment: segment.get('start') or 0.0
+        )
+        self.starts = array('d')
+        self.ends = array('d')
+        self.offsets = array('q')
+        self._max_ends = array('d')
+        self.timed = any(segment.get('end') is not None for segment in segments)
+
+        texts = []
+        offset = 0
+        max_end = 0.0
+        for segment in segments:
+            start = float(segment.get('start') or 0.0)
+            # Untimed segments (content analysis) are treated as instants
+            end = float(segment['end']) if segment.get('end') is not None else start
+            text = segment['text'].strip()
+            self.starts.append(start)
+            self.ends.append(end)
+            self.offsets.append(offset)
+            max_end = max(max_end, end)
+            self._max_ends.append(max_end)
+            texts.append(text)
+            offset += len(text) + 1
+
+        self.text = ' '.join(texts)
+        self._lower = self.text.lower()
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def duration(self):
+        return self._max_ends[-1] if len(self) else 0.0
+
+    def segment_text(self, i):
+        end = self.offsets[i + 1] - 1 if i + 1 < len(self) else len(self.text)
+        return self.text[self.offsets[i]:end]
+
+    def segment(self, i):
+        return {'start': self.starts[i], 'end': self.ends[i], 'text': self.segment_text(i)}
+
+    def overlapping(self, start, end):
+        """Indices of segments that overlap [start, end), in time order"""
+        # Segments from lo onwards may end after start; those before hi begin before end
+        lo = bisect_right(self._max_ends, start)
+        hi = bisect_left(self.starts, end)
+        return [i for i in range(lo, hi) if self.ends[i] > start or self.starts[i] >= start]
+
+    def at_offset(self, offset):
+        """Index of the segment containing a character offset of self.text"""
+        return max(0, bisect_right(self.offsets, offset) - 1)
+
+    def time_range(self, start, end):
+        """Segments overlapping [start, end)"""
+        return [self.segment(i) for i in self.overlapping(start, end)]
+
+    def excerpt(self, start, end):
+        """The text of [start, end) with a timestamp before each segment"""
+        return '\n'.join(
+            f"[{format_timestamp(self.starts[i])}] {self.segment_text(i)}"
+            for i in self.overlapping(start, end)
+        )
+
+    def search(self, phrase, limit=20, context_chars=80):
+        """Case-insensitive phrase matches as [{'start', 'end', 'offset', 'snippet'}]"""
+        needle = ' '.join(phrase.lower().split())
+        matches = []
+        if not needle:
+            return matches
+
+        position = self._lower.find(needle)
+        while position != -1 and len(matches) < limit:
+            i = self.at_offset(position)
+            left = max(0, position - context_chars)
+            right = min(len(self.text), position + len(needle) + context_chars)
+            matches.append({
+                'start': self.starts[i],
+                'end': self.ends[i],
+                'offset': position,
+                'snippet': ('…' if left else '') + self.text[left:right] + ('…' if right < len(self.text) else ''),
+            })
+            position = self._lower.find(needle, position + len(needle))
+        return matches
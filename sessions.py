@@ -0,0 +1,149 @@
+"""
+Server-side transcript sessions.
+
+process_video hands the browser a short transcript_id instead of making it
+post the whole transcript back with every question. Sessions are kept in a
+per-process LRU (bounded by transcript size, expiring after a period of
+inactivity) backed by the shared DiskCache, so a request that lands on a
+different gunicorn worker can still resolve the handle.
+"""
+
+import hashlib
+import threading
+import time
+
+from cache import MemoryCache
+from retrieval import TranscriptIndex
+from segments import SegmentIndex
+
+
+def transcript_id_for(transcript):
+    """Content-addressed handle: the same transcript always gets the same id"""
+    return hashlib.sha256(transcript.encode('utf-8')).hexdigest()[:32]
+
+
+class TranscriptSession:
+    """A transcript plus everything derived from it while it is in use"""
+
+    def __init__(self, transcript_id, transcript, video_id=None, segments=None, index_options=None):
+        self.id = transcript_id
+        self.transcript = transcript
+        self.video_id = video_id
+        self.segments = segments or []
+        self.created_at = time.time()
+        # When this process last pushed out the session's expiry on disk
+        self.touched_at = self.created_at
+        self.index_options = index_options or {}
+        self._index = None
+        self._timeline = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        # Transcript text plus roughly twice that again for the retrieval index
+        return 3 * len(self.transcript.encode('utf-8'))
+
+    @property
+    def index(self):
+        """Retrieval index over the transcript, built on first use"""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = TranscriptIndex(self.transcript, **self.index_options)
+        return self._index
+
+    @property
+    def timeline(self):
+        """Seekable index over the timestamped segments, built on first use"""
+        if self._timeline is None:
+            with self._lock:
+                if self._timeline is None:
+                    self._timeline = SegmentIndex(self.segments)
+        return self._timeline
+
+    def upgrade(self, video_id=None, segments=None):
+        """Fill in a video ID or segments the session lacks; True if anything changed"""
+        changed = False
+        with self._lock:
+            if video_id and not self.video_id:
+                self.video_id = video_id
+                changed = True
+            if segments and not self.segments:
+                self.segments = segments
+                self._timeline = None
+                changed = True
+        return changed
+
+    def to_dict(self):
+        return {
+            'transcript': self.transcript,
+            'video_id': self.video_id,
+            'segments': self.segments,
+        }
+
+
+class SessionStore:
+    """Resolve transcript handles from memory, falling back to shared disk"""
+
+    def __init__(self, disk, max_bytes=64 * 1024 * 1024, ttl=3600, index_options=None):
+        self.disk = disk
+        self.ttl = ttl
+        self.index_options = index_options or {}
+        self.memory = MemoryCache(max_bytes=max_bytes, ttl=ttl)
+
+    def create(self, transcript, video_id=None, segments=None):
+        """Register a transcript and return its session (reusing an existing one)"""
+        transcript_id = transcript_id_for(transcript)
+        session = self.memory.get(transcript_id)
+        if session is not None:
+            # The same text may first arrive without its video, e.g. from /ask
+            if session.upgrade(video_id, segments):
+                self._persist(session)
+            else:
+                self._touch(session)
+            return session
+
+        session = TranscriptSession(transcript_id, transcript, video_id, segments, self.index_options)
+        self.memory.set(transcript_id, session, session.size)
+        self._persist(session)
+        return session
+
+    def get(self, transcript_id):
+        """Return the session for a handle, or None if it expired"""
+        session = self.memory.get(transcript_id)
+        if session is not None:
+            self._touch(session)
+            return session
+
+        data = self.disk.get(transcript_id)
+        if data is None:
+            return None
+
+        session = TranscriptSession(
+            transcript_id, data['transcript'], data.get('video_id'), data.get('segments'),
+            self.index_options
+        )
+        self.disk.touch(transcript_id, ttl=self.ttl)
+        self.memory.set(transcript_id, session, session.size)
+        return session
+
+    def _persist(self, session):
+        self.disk.set(session.id, session.to_dict(), ttl=self.ttl)
+        session.touched_at = time.time()
+
+    def _touch(self, session):
+        """Keep the disk copy alive while the session is used from memory.
+
+        Memory hits would otherwise let the shared entry expire under a
+        session that is in constant use; refreshing once half the TTL has
+        passed keeps most hits free of disk writes.
+        """
+        if not self.ttl or time.time() - session.touched_at < self.ttl / 2:
+            return
+        if not self.disk.touch(session.id, ttl=self.ttl):
+            # Evicted or expired on disk; other workers need it back
+            self._persist(session)
+        session.touched_at = time.time()
+
+    def stats(self):
+        return {'memory': self.memory.stats(), 'disk': self.disk.stats()}
@@ -0,0 +1,261 @@
+"""
+Offline stand-ins for yt-dlp and the Gemini SDK, used by the benchmarks.
+
+install() registers fake `yt_dlp` and `google.generativeai` modules before
+the app is imported, so the whole pipeline (preflight, download, streaming or
+staged transcription, model calls) runs without network access, with
+configurable latencies. Speech recognition uses the app's own offline engine.
+Settings come from the environment so every gunicorn worker picks them up:
+
+    STANDIN_DOWNLOAD_LATENCY   seconds per download (default 0.5)
+    STANDIN_LLM_LATENCY        seconds per model call (default 1.0)
+    STANDIN_AUDIO_SECONDS      length of the synthetic audio (default 120)
+    STANDIN_LLM_MAX_CONCURRENT model calls the "provider" accepts at once; more
+                               fail with a 429 like a rate limit (default 0, no limit)
+    STANDIN_LLM_SECONDS_PER_1K_TOKENS
+                               extra latency per 1,000 uncached prompt tokens (default 0)
+
+The model stand-in also implements context caching (CachedContent and
+GenerativeModel.from_cached_content), kept in memory per process.
+
+Serve with `gunicorn 'standins:create_app("app")'` (or "app_demo").
+"""
+
+import importlib
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import types
+import wave
+
+
+_lock = threading.Lock()
+_audio_path = None
+
+
+def synthetic_audio(seconds):
+    """A 16 kHz mono WAV of 4 s tone bursts separated by 1 s pauses"""
+    global _audio_path
+    with _lock:
+        if _audio_path is None or not os.path.exists(_audio_path):
+            rate = 16000
+            period = 40  # 400 Hz
+            wave_cycle = b''.join(
+                struct.pack('<h', int(8000 * (1 if i < period // 2 else -1))) for i in range(period)
+            )
+            pattern = wave_cycle * (4 * rate // period) + b'\x00\x00' * rate
+            repeats, remainder = divmod(int(seconds), 5)
+            frames = pattern * repeats + pattern[:remainder * rate * 2]
+
+            handle, path = tempfile.mkstemp(prefix='askvid-standin-', suffix='.wav')
+            os.close(handle)
+            with wave.open(path, 'wb') as output:
+                output.setnchannels(1)
+                output.setsampwidth(2)
+                output.setframerate(rate)
+                output.writeframes(frames)
+            _audio_path = path
+    return _audio_path
+
+
+class YoutubeDL:
+    """Answers extract_info from a template and 'downloads' the synthetic audio"""
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def _info(self, url):
+        match = re.search(r'(?:v=|youtu\.be/|/shorts/|/embed/)([\w-]+)', url)
+        video_id = match.group(1) if match else 'standin'
+        seconds = float(os.getenv('STANDIN_AUDIO_SECONDS', '120'))
+        return {
+            '_type': 'video',
+            'id': video_id,
+            'title': f'Synthetic lecture {video_id}',
+            'duration': seconds,
+            'description': 'A synthetic video used for load testing.',
+            'tags': ['tutorial', 'lecture'],
+            'formats': [{
+                'format_id': '250', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none', 'abr': 64,
+                'filesize': int(seconds * 8000), 'protocol': 'https',
+                'url': synthetic_audio(seconds),
+            }],
+        }
+
+    def extract_info(self, url, download=True, process=True, **kwargs):
+        if self.params.get('extract_flat'):
+            return {'_type': 'playlist', 'entries': [{'id': f'standin{i}'} for i in range(10)]}
+        info = self._info(url)
+        if not process:
+            return info
+        return self.process_ie_result(info, download)
+
+    def process_ie_result(self, info, download=True, **kwargs):
+        selected = dict(info)
+        selected.update({key: value for key, value in info['formats'][0].items() if key != 'format_id'})
+        selected['format_id'] = info['formats'][0]['format_id']
+        if download:
+            time.sleep(float(os.getenv('STANDIN_DOWNLOAD_LATENCY', '0.5')))
+            extension = selected['ext']
+            for postprocessor in self.params.get('postprocessors') or []:
+                if postprocessor.get('key') == 'FFmpegExtractAudio':
+                    extension = postprocessor.get('preferredcodec') or extension
+            template = self.params.get('outtmpl') or '%(title)s.%(ext)s'
+            if isinstance(template, dict):
+                template = template.get('default')
+            shutil.copyfile(selected['url'], template % dict(selected, ext=extension))
+        return selected
+
+    def download(self, urls):
+        for url in urls:
+            self.extract_info(url, download=True)
+        return 0
+
+
+class _Usage:
+    def __init__(self, prompt, text, cached_tokens=0):
+        self.prompt_token_count = len(prompt) // 4 + cached_tokens
+        self.cached_content_token_count = cached_tokens
+        self.candidates_token_count = len(text) // 4
+
+
+class CachedContent:
+    """In-memory stand-in for the provider's context cache"""
+
+    _contents = {}
+
+    def __init__(self, name, model, tokens, expire_time):
+        self.name = name
+        self.model = model
+        self.tokens = tokens
+        self.expire_time = expire_time
+
+    @classmethod
+    def create(cls, model, system_instruction=None, contents=None, ttl=None, **kwargs):
+        text = (system_instruction or '') + ''.join(contents or [])
+        cached = cls(f'cachedContents/standin-{len(cls._contents)}-{os.getpid()}', model,
+                     len(text) // 4, time.time() + ttl.total_seconds())
+        with _lock:
+            cls._contents[cached.name] = cached
+        return cached
+
+    @classmethod
+    def get(cls, name):
+        cached = cls._contents.get(name)
+        if cached is None or cached.expire_time < time.time():
+            raise Exception(f'404 CachedContent not found (or permission denied): {name}')
+        return cached
+
+    def update(self, ttl=None, **kwargs):
+        self.expire_time = time.time() + ttl.total_seconds()
+
+    def delete(self):
+        with _lock:
+            self._contents.pop(self.name, None)
+
+
+class _Response:
+    def __init__(self, prompt, text, chunks=1, cached_tokens=0):
+        self.text = text
+        self.usage_metadata = _Usage(prompt, text, cached_tokens)
+        self._chunks = chunks
+
+    def __iter__(self):
+        # Streamed responses spread the latency across their pieces
+        latency = float(os.getenv('STANDIN_LLM_LATENCY', '1.0'))
+        size = max(1, len(self.text) // self._chunks)
+        for start in range(0, len(self.text), size):
+            time.sleep(latency / self._chunks)
+            yield types.SimpleNamespace(text=self.text[start:start + size])
+
+
+_llm_active = [0]
+
+
+class GenerativeModel:
+    """Returns a canned, analysis-shaped response after a fixed latency"""
+
+    def __init__(self, model_name=None, **kwargs):
+        self.model_name = model_name
+        self._cached_content = None
+
+    @classmethod
+    def from_cached_content(cls, cached_content, **kwargs):
+        if isinstance(cached_content, str):
+            cached_content = CachedContent.get(cached_content)
+        model = cls(cached_content.model)
+        model._cached_content = cached_content.name
+        return model
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        limit = int(os.getenv('STANDIN_LLM_MAX_CONCURRENT', '0'))
+        with _lock:
+            if limit and _llm_active[0] >= limit:
+                raise Exception('429 Resource has been exhausted (e.g. check quota).')
+            _llm_active[0] += 1
+        try:
+            return self._generate(prompt, stream)
+        finally:
+            with _lock:
+                _llm_active[0] -= 1
+
+    def _generate(self, prompt, stream):
+        cached_tokens = CachedContent.get(self._cached_content).tokens if self._cached_content else 0
+        # Uncached prompt tokens cost time in proportion to their number
+        input_latency = float(os.getenv('STANDIN_LLM_SECONDS_PER_1K_TOKENS', '0')) * (len(prompt) // 4) / 1000
+        text = (
+            "**📋 MAIN TOPICS COVERED:**\n• Synthetic topic one\n• Synthetic topic two\n\n"
+            "**🎯 KEY POINTS & INSIGHTS:**\n• A stand-in response for load testing\n\n"
+            f"**📖 COMPREHENSIVE SUMMARY:**\n• The prompt was {len(prompt)} characters long."
+        )
+        # Batched questions get one "### Answer N" section each, as instructed
+        batch = re.search(r'Answer each of the following (\d+) questions', prompt)
+        if batch:
+            text = '\n\n'.join(f"### Answer {number}\n{text}" for number in range(1, int(batch.group(1)) + 1))
+        time.sleep(input_latency)
+        if stream:
+            return _Response(prompt, text, chunks=5, cached_tokens=cached_tokens)
+        time.sleep(float(os.getenv('STANDIN_LLM_LATENCY', '1.0')))
+        return _Response(prompt, text, cached_tokens=cached_tokens)
+
+
+def install():
+    """Register the stand-in modules; call before importing the app"""
+    yt_dlp = types.ModuleType('yt_dlp')
+    yt_dlp.YoutubeDL = YoutubeDL
+
+    genai = types.ModuleType('google.generativeai')
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = GenerativeModel
+    caching = types.ModuleType('google.generativeai.caching')
+    caching.CachedContent = CachedContent
+    genai.caching = caching
+
+    try:
+        import google
+    except ImportError:
+        google = sys.modules['google'] = types.ModuleType('google')
+        google.__path__ = []
+    google.generativeai = genai
+    sys.modules['yt_dlp'] = yt_dlp
+    sys.modules['google.generativeai'] = genai
+    sys.modules['google.generativeai.caching'] = caching
+
+
+def create_app(module='app'):
+    """Install the stand-ins and return the Flask app from module"""
+    install()
+    os.environ.setdefault('GEMINI_API_KEY', 'standin')
+    os.environ.setdefault('TRANSCRIPTION_ENGINE', 'offline')
+    return importlib.import_module(module).app
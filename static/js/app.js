@@ -1,6 +1,8 @@
 // Global variables
 let currentTranscript = '';
+let currentTranscriptId = null;
 let isTranscriptVisible = false;
+const JOB_POLL_INTERVAL_MS = 2000;
 
 // DOM elements
 const videoUrlInput = document.getElementById('videoUrl');
@@ -70,10 +72,16 @@ async function processVideo() {
             body: JSON.stringify({ video_url: videoUrl })
         });
         
-        const data = await response.json();
+        let data = await response.json();
+        
+        // Long videos are processed in the background; poll until the job finishes
+        if (response.status === 202 && data.job_id) {
+            data = await waitForJob(data.job_id);
+        }
         
         if (data.success) {
             currentTranscript = data.transcript;
+            currentTranscriptId = data.transcript_id || null;
             showQASection();
             showTranscriptSection();
             showSuccess('Video processed successfully! You can now ask questions.');
@@ -88,6 +96,105 @@ async function processVideo() {
     }
 }
 
+// Poll a processing job until it is done or failed
+async function waitForJob(jobId) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+        
+        const response = await fetch(`/jobs/${jobId}/result`);
+        const data = await response.json();
+        
+        if (response.status !== 202) {
+            return data;
+        }
+        
+        // Streaming transcription publishes the transcript as it grows
+        if (data.progress && data.progress.partial_transcript) {
+            currentTranscript = data.progress.partial_transcript;
+            transcriptText.textContent = currentTranscript;
+            showTranscriptSection();
+        }
+    }
+}
+
+// POST to a streaming endpoint and read its server-sent events, calling
+// onText with the accumulated text as each piece arrives. Uses the
+// server-side session handle, resending the full transcript only if the
+// session has expired.
+async function streamWithTranscript(url, payload, onText) {
+    const post = (body) => fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(body)
+    });
+    
+    let response = null;
+    if (currentTranscriptId) {
+        response = await post({ ...payload, transcript_id: currentTranscriptId });
+        if (response.status === 410) {
+            response = null;
+        }
+    }
+    if (!response) {
+        response = await post({ ...payload, transcript: currentTranscript });
+    }
+    
+    // Validation errors come back as plain JSON before any streaming starts
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!contentType.startsWith('text/event-stream')) {
+        return await response.json();
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const event = parseSseEvent(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+            
+            if (event.type === 'error') {
+                return { error: event.data.error };
+            }
+            if (event.type === 'done') {
+                if (event.data.transcript_id) {
+                    currentTranscriptId = event.data.transcript_id;
+                }
+                return { success: true, text: text };
+            }
+            text += event.data.text;
+            onText(text);
+        }
+    }
+    
+    return text ? { success: true, text: text } : { error: 'Stream ended unexpectedly' };
+}
+
+// Parse one server-sent event block into { type, data }
+function parseSseEvent(raw) {
+    let type = 'message';
+    let data = '';
+    raw.split('\n').forEach(line => {
+        if (line.startsWith('event: ')) {
+            type = line.slice(7);
+        } else if (line.startsWith('data: ')) {
+            data += line.slice(6);
+        }
+    });
+    return { type: type, data: data ? JSON.parse(data) : {} };
+}
+
 // Ask question function
 async function askQuestion() {
     const question = questionInput.value.trim();
@@ -108,21 +215,10 @@ async function askQuestion() {
     hideError();
     
     try {
-        const response = await fetch('/ask_question', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ 
-                question: question,
-                transcript: currentTranscript 
-            })
-        });
-        
-        const data = await response.json();
+        const data = await streamWithTranscript('/ask_question/stream', { question: question }, showPartialAnswer);
         
         if (data.success) {
-            showAnswer(data.answer);
+            showAnswer(data.text);
         } else {
             showError(data.error || 'Failed to get answer');
         }
@@ -147,20 +243,10 @@ async function analyzeTopics() {
     hideError();
     
     try {
-        const response = await fetch('/analyze_topics', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ 
-                transcript: currentTranscript 
-            })
-        });
-        
-        const data = await response.json();
+        const data = await streamWithTranscript('/analyze_topics/stream', {}, showPartialAnswer);
         
         if (data.success) {
-            showAnswer(data.analysis);
+            showAnswer(data.text);
         } else {
             showError(data.error || 'Failed to analyze topics');
         }
@@ -216,6 +302,13 @@ function showAnswer(answer) {
     answerContainer.classList.add('fade-in');
 }
 
+// Show a partially streamed answer as plain text
+function showPartialAnswer(text) {
+    questionLoading.classList.add('hidden');
+    answerText.textContent = text;
+    answerContainer.classList.remove('hidden');
+}
+
 // Format analysis answer with proper HTML structure
 function formatAnalysisAnswer(answer) {
     // Convert markdown-style formatting to HTML
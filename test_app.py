@@ -4,16 +4,27 @@ Simple test script to verify AskVid app can start without errors.
 This doesn't test the full functionality but ensures basic setup is correct.
 """
 
+import atexit
 import os
+import shutil
 import sys
+import tempfile
 from unittest.mock import patch
 
+# Importing app opens its caches, search index and audio store; keep them
+# away from a real deployment's state and from earlier test runs
+TEST_CACHE_DIR = tempfile.mkdtemp(prefix='askvid-test-')
+os.environ['ASKVID_CACHE_DIR'] = TEST_CACHE_DIR
+for name in ('SEARCH_DB', 'AUDIO_STORE_DIR'):
+    os.environ.pop(name, None)
+atexit.register(shutil.rmtree, TEST_CACHE_DIR, ignore_errors=True)
+
 def test_imports():
     """Test that all required modules can be imported."""
     try:
         import flask
         import requests
-        import openai
+        import google.generativeai
         import yt_dlp
         import pydub
         from dotenv import load_dotenv
@@ -26,8 +37,8 @@ def test_imports():
 def test_flask_app():
     """Test that Flask app can be created."""
     try:
-        # Mock OpenAI API key for testing
-        with patch.dict(os.environ, {'OPENAI_API_KEY': 'test_key'}):
+        # Mock Gemini API key for testing
+        with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
             from app import app
             print("✅ Flask app created successfully")
             return True
@@ -55,6 +66,1074 @@ def test_templates_exist():
         print("✅ All required files exist")
         return True
 
+def test_transcript_cache():
+    """Test that the disk cache stores, evicts and invalidates entries."""
+    from cache import DiskCache
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = DiskCache(os.path.join(temp_dir, 'cache.sqlite3'), 'test', max_bytes=200,
+                          touch_interval=0)
+        
+        assert cache.get('abc:v1') is None
+        cache.set('abc:v1', {'transcript': 'x' * 60})
+        cache.set('def:v1', {'transcript': 'y' * 60})
+        assert cache.get('abc:v1')['transcript'] == 'x' * 60
+        
+        # Third entry pushes us over budget; def:v1 is least recently used
+        cache.set('ghi:v1', {'transcript': 'z' * 60})
+        assert cache.get('def:v1') is None
+        assert cache.get('abc:v1') is not None
+        
+        assert cache.delete_prefix('abc:') == 1
+        stats = cache.stats()
+        assert stats['evictions'] == 1
+        assert stats['invalidations'] == 1
+        assert stats['hits'] == 2
+        
+        # Hits within touch_interval are reads only; counters still add up
+        throttled = DiskCache(os.path.join(temp_dir, 'cache.sqlite3'), 'throttled', ttl=3600)
+        throttled.set('k', {'v': 1})
+        conn = throttled._connect()
+        before = conn.total_changes
+        for _ in range(5):
+            assert throttled.get('k') == {'v': 1}
+        assert conn.total_changes == before
+        assert throttled.get('k', record=False) == {'v': 1}
+        assert throttled.get('missing', record=False) is None
+        stats = throttled.stats()
+        assert stats['hits'] == 5 and stats['misses'] == 0
+    
+    print("✅ Transcript cache works")
+    return True
+
+def test_response_cache():
+    """Test response cache hits, expiry, key changes and that errors are not cached."""
+    import time
+    import uuid
+    from cache import DiskCache, MemoryCache, TieredCache
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
+        import app
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        disk = DiskCache(os.path.join(temp_dir, 'cache.sqlite3'), 'responses', ttl=0.2)
+        tiered = TieredCache(MemoryCache(ttl=0.2), disk)
+        assert tiered.get('k') is None
+        tiered.set('k', 'answer')
+        assert tiered.get('k') == 'answer'
+        
+        # Another worker only has the disk copy, which refills its memory tier
+        other = TieredCache(MemoryCache(ttl=0.2), disk)
+        assert other.get('k') == 'answer' and other.get('k') == 'answer'
+        assert other.stats()['disk_hits'] == 1 and other.stats()['memory_hits'] == 1
+        
+        time.sleep(0.3)
+        assert tiered.get('k') is None
+        assert tiered.stats()['misses'] == 2 and disk.stats()['expired'] == 1
+    
+    # Anything that changes the prompt changes the key; question spelling does not
+    transcript = f"Response cache transcript {uuid.uuid4()}"
+    key = app.response_cache_key('answer', transcript, 'What is this?')
+    assert app.response_cache_key('answer', transcript, '  what IS this ') == key
+    assert app.response_cache_key(app.answer_cache_kind('analysis'), transcript, 'What is this?') != key
+    assert app.response_cache_key('analysis', transcript) != app.response_cache_key('answer', transcript)
+    with patch.object(app, 'RETRIEVAL_TOKEN_BUDGET', app.RETRIEVAL_TOKEN_BUDGET + 1):
+        assert app.response_cache_key('answer', transcript, 'What is this?') != key
+    
+    class Response:
+        text = 'Cached answer.'
+    
+    calls = []
+    def failing(model, prompt, context=None):
+        calls.append(prompt)
+        raise Exception('500 Internal error')
+    def working(model, prompt, context=None):
+        calls.append(prompt)
+        return Response()
+    
+    with patch.object(app, 'answer_context', lambda t: None):
+        with patch.object(app.llm, 'generate', failing):
+            assert app.get_ai_answer('What is this?', transcript).startswith('Error getting AI answer')
+            try:
+                app.generate_analysis(transcript)
+                assert False, 'expected the model error'
+            except Exception as e:
+                assert '500' in str(e)
+        assert app.response_cache.get(key) is None
+        assert app.cached_analysis(transcript) is None
+        
+        with patch.object(app.llm, 'generate', working):
+            assert app.get_ai_answer('What is this?', transcript) == 'Cached answer.'
+            assert app.get_ai_answer('what is this', transcript) == 'Cached answer.'
+        assert len(calls) == 3
+    
+    print("✅ Response cache works")
+    return True
+
+def test_job_queue():
+    """Test that concurrent jobs for the same key are de-duplicated."""
+    import threading
+    from jobs import JobQueue
+    
+    release = threading.Event()
+    calls = []
+    
+    def work(video_id):
+        calls.append(video_id)
+        release.wait(5)
+        return {'video_id': video_id}
+    
+    queue = JobQueue(max_workers=2)
+    first, created = queue.submit('abc', work, 'abc')
+    second, created_again = queue.submit('abc', work, 'abc')
+    assert created and not created_again
+    assert first is second
+    
+    release.set()
+    assert first.wait(5)
+    assert queue.get(first.id)['result'] == {'video_id': 'abc'}
+    assert calls == ['abc']
+    assert queue.stats()['deduplicated'] == 1
+    
+    print("✅ Job queue de-duplicates in-flight work")
+    return True
+
+def test_offline_transcription():
+    """Test that the offline engine splits audio on silence and keeps timestamps."""
+    from pydub import AudioSegment
+    from pydub.generators import Sine
+    from transcription import OfflineEngine
+    
+    speech = Sine(300).to_audio_segment(duration=8000, volume=-10)
+    audio = (speech + AudioSegment.silent(duration=1000)) * 4
+    
+    engine = OfflineEngine(max_workers=4, max_chunk_ms=20000)
+    segments = engine.transcribe(audio)
+    
+    assert len(segments) == 2
+    assert segments[0]['start'] == 0.0
+    assert segments[0]['end'] == segments[1]['start']
+    assert segments[-1]['end'] == len(audio) / 1000
+    # Chunks are cut in the middle of a silence, never mid-speech
+    assert 17.0 < segments[0]['end'] < 18.0
+    
+    # Raw PCM streamed through a pipe is chunked the same way as it arrives
+    import io
+    seen = []
+    pcm = engine.load(audio).raw_data
+    streamed = engine.transcribe_stream(io.BytesIO(pcm), on_segment=seen.append, max_pending=1)
+    assert streamed == seen and len(streamed) == 2
+    assert 17.0 < streamed[0]['end'] < 18.0
+    assert streamed[-1]['end'] == len(audio) / 1000
+    
+    print("✅ Offline transcription engine works")
+    return True
+
+def test_transcription_fallback():
+    """Test that a failed transcription's stand-in is only cached briefly."""
+    import time
+    import uuid
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
+        import app
+    
+    class Failing:
+        name = 'failing'
+        def transcribe(self, audio_path):
+            raise Exception('503 Service unavailable')
+    
+    def download(url, audio_path, info=None, audio_format=None):
+        with open(audio_path, 'wb') as f:
+            f.write(b'audio')
+        return True, 'Fallback title.opus'
+    
+    video_id = uuid.uuid4().hex[:11]
+    metadata = {'id': video_id, 'title': 'Fallback title', 'duration': 60, 'audio_formats': []}
+    with patch.object(app, 'probe_video', lambda url, vid: (metadata, None)), \
+            patch.object(app, 'download_audio', download), \
+            patch.object(app, 'streaming_enabled', lambda: False), \
+            patch.object(app, 'get_transcription_engine', lambda: Failing()):
+        result = app.run_video_pipeline(f'https://www.youtube.com/watch?v={video_id}', video_id)
+        _, fallback = app.transcribe_audio_segments(__file__, video_id, 'Fallback title.opus')
+        assert fallback
+    assert 'Fallback title' in result['transcript']
+    if app.search_index is not None:
+        # Indexed under the video title, not the downloaded file's name
+        assert app.search_index.search('fallback')[0]['title'] == 'Fallback title'
+    
+    conn = app.transcript_cache._connect()
+    expires_at = conn.execute(
+        'SELECT expires_at FROM entries WHERE namespace = ? AND key = ?',
+        ('transcripts', app.transcript_cache_key(video_id))
+    ).fetchone()[0]
+    assert expires_at <= time.time() + app.TRANSCRIPT_FALLBACK_TTL
+    
+    # Content analysis as the configured engine is the real result, not a stand-in
+    with patch.object(app, 'get_transcription_engine', lambda: None):
+        assert not app.transcribe_audio_segments(__file__, video_id, 'Fallback title.opus')[1]
+    
+    print("✅ Transcription fallback works")
+    return True
+
+def test_transcript_sessions():
+    """Test that transcript handles resolve from memory and from disk."""
+    from cache import DiskCache
+    from sessions import SessionStore
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        disk = DiskCache(os.path.join(temp_dir, 'cache.sqlite3'), 'sessions', sliding=True)
+        store = SessionStore(disk, max_bytes=300, ttl=60)
+        
+        session = store.create('a' * 60, video_id='abc')
+        assert store.create('a' * 60).id == session.id
+        assert store.get(session.id) is session
+        
+        # Over the memory budget: the first session falls back to disk
+        other = store.create('b' * 60)
+        assert store.memory.stats()['evictions'] == 1
+        restored = store.get(session.id)
+        assert restored.transcript == 'a' * 60 and restored.video_id == 'abc'
+        assert store.get(other.id).transcript == 'b' * 60
+        assert store.get('missing') is None
+        
+        # A later create with the video's segments upgrades the cached session
+        plain = store.create('c' * 60)
+        segments = [{'start': 0.0, 'end': 1.0, 'text': 'c'}]
+        assert store.create('c' * 60, video_id='cvid', segments=segments) is plain
+        assert plain.video_id == 'cvid' and plain.segments == segments
+        assert disk.get(plain.id)['segments'] == segments
+        
+        # Memory hits push out the disk expiry once half the TTL has passed
+        expiry = lambda: disk._connect().execute(
+            'SELECT expires_at FROM entries WHERE namespace = ? AND key = ?', ('sessions', plain.id)
+        ).fetchone()[0]
+        before = expiry()
+        store.get(plain.id)
+        assert expiry() == before
+        plain.touched_at -= 31
+        store.get(plain.id)
+        assert expiry() > before and plain.touched_at > before - 60
+    
+    print("✅ Transcript sessions work")
+    return True
+
+def test_retrieval_context():
+    """Test that long transcripts are cut down to relevant chunks."""
+    from retrieval import TranscriptIndex
+    
+    filler = ' '.join(['filler words about nothing in particular'] * 400)
+    transcript = f"{filler} the mitochondria is the powerhouse of the cell {filler}"
+    index = TranscriptIndex(transcript, window_words=100, overlap_words=20)
+    
+    context, report = index.select('What is the mitochondria?', token_budget=500, top_k=3)
+    assert report['strategy'] == 'bm25'
+    assert 'mitochondria' in context
+    assert report['context_tokens'] <= 500 < report['full_tokens']
+    
+    context, report = index.select('Summarize this', token_budget=600, top_k=3)
+    assert report['strategy'] == 'spread' and report['chunks_used'] == 3
+    
+    short = TranscriptIndex('A short transcript.')
+    assert short.select('anything')[1]['strategy'] == 'full'
+    
+    print("✅ Retrieval context selection works")
+    return True
+
+def test_streaming_responses():
+    """Test the server-sent event streams, their caching and aborted streams."""
+    import json
+    import uuid
+    from contextlib import contextmanager
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
+        import app
+    
+    class Chunk:
+        def __init__(self, text):
+            self.text = text
+    
+    pieces = ['Streamed ', 'answer', '.']
+    fail_after = {'count': None}
+    @contextmanager
+    def stream(model, prompt, context=None):
+        def chunks():
+            for number, text in enumerate(pieces):
+                if number == fail_after['count']:
+                    raise Exception('connection reset')
+                yield Chunk(text)
+        yield chunks()
+    
+    def events(response):
+        parsed = []
+        for block in response.get_data(as_text=True).split('\n\n'):
+            if block:
+                lines = dict(line.split(': ', 1) for line in block.split('\n'))
+                parsed.append((lines.get('event', 'message'), json.loads(lines['data'])))
+        return parsed
+    
+    client = app.app.test_client()
+    transcript = f"Streaming test transcript {uuid.uuid4()}"
+    body = {'transcript': transcript, 'question': 'What is streamed?'}
+    key = app.response_cache_key('answer', transcript, 'What is streamed?')
+    with patch.object(app.llm, 'stream', stream), patch.object(app, 'answer_context', lambda t: None), \
+            patch.object(app, 'cached_analysis', lambda t: None):
+        # A model error part-way through ends in an error event and caches nothing
+        fail_after['count'] = 1
+        response = client.post('/ask_question/stream', json=body)
+        assert response.mimetype == 'text/event-stream'
+        assert [name for name, _ in events(response)] == ['message', 'error']
+        assert app.response_cache.get(key) is None
+        
+        # A client that disconnects early leaves nothing in the cache either
+        fail_after['count'] = None
+        response = client.post('/ask_question/stream', json=body, buffered=False)
+        next(iter(response.response))
+        response.close()
+        assert app.response_cache.get(key) is None
+        
+        # Deltas in order, then done; the full text is cached for the next request
+        stream_events = events(client.post('/ask_question/stream', json=body))
+        assert [name for name, _ in stream_events] == ['message'] * 3 + ['done']
+        assert ''.join(data['text'] for _, data in stream_events[:-1]) == 'Streamed answer.'
+        assert stream_events[-1][1]['cached'] is False
+        assert app.response_cache.get(key) == 'Streamed answer.'
+        
+        replay = events(client.post('/ask_question/stream', json=body))
+        assert replay == [('message', {'text': 'Streamed answer.'}),
+                          ('done', {'cached': True, 'transcript_id': stream_events[-1][1]['transcript_id']})]
+    
+    # The analysis stream fills the cache the structured analysis is served from
+    with patch.object(app.llm, 'stream', stream):
+        analysis_events = events(client.post('/analyze_topics/stream', json={'transcript': transcript}))
+    assert [name for name, _ in analysis_events] == ['message'] * 3 + ['done']
+    assert app.cached_analysis(transcript) == 'Streamed answer.'
+    
+    print("✅ Streaming responses work")
+    return True
+
+def test_analysis_reuse():
+    """Test that one transcript gets one structured analysis, however many ask for it."""
+    import threading
+    import time
+    import uuid
+    from concurrent.futures import ThreadPoolExecutor
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
+        import app
+    
+    class Response:
+        text = '**MAIN TOPICS:**\n• Reuse'
+    
+    calls = []
+    lock = threading.Lock()
+    def generate(model, prompt, context=None):
+        with lock:
+            calls.append(prompt)
+        time.sleep(0.2)
+        return Response()
+    
+    with patch.object(app.llm, 'generate', generate):
+        session = app.session_store.create(f"Analysis reuse transcript {uuid.uuid4()}")
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda i: app.get_structured_analysis(session), range(4)))
+        assert len(calls) == 1
+        assert {analysis for analysis, _ in results} == {Response.text}
+        assert app.get_structured_analysis(session) == (Response.text, True)
+        
+        # The eager job started after processing serves a later /analyze_topics
+        eager = app.session_store.create(f"Eager analysis transcript {uuid.uuid4()}")
+        app.analysis_queue.submit(f"analysis:{eager.id}", app.generate_analysis, eager.transcript)
+        response = app.app.test_client().post('/analyze_topics', json={'transcript_id': eager.id})
+        assert response.status_code == 200
+        assert response.get_json()['analysis'] == Response.text
+        assert len(calls) == 2
+    
+    # An overloaded model reaches the client as 503 with Retry-After, not 500
+    def overloaded(model, prompt, context=None):
+        raise app.llm.LLMUnavailable('Model queue is full', retry_after=7)
+    with patch.object(app.llm, 'generate', overloaded):
+        busy = app.session_store.create(f"Overloaded analysis transcript {uuid.uuid4()}")
+        response = app.app.test_client().post('/analyze_topics', json={'transcript_id': busy.id})
+        assert response.status_code == 503 and response.headers['Retry-After'] == '7'
+        assert response.get_json()['code'] == 'llm_unavailable'
+    
+    print("✅ Analysis reuse works")
+    return True
+
+def test_video_preflight():
+    """Test format selection and limits from yt-dlp metadata."""
+    import app
+    
+    info = {
+        'id': 'abc123', 'title': 'Test', 'duration': 600,
+        'formats': [
+            {'format_id': '251', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none', 'abr': 130},
+            {'format_id': '250', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none', 'abr': 64},
+            {'format_id': '249', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none', 'abr': 40},
+            {'format_id': '18', 'ext': 'mp4', 'acodec': 'mp4a', 'vcodec': 'avc1', 'tbr': 500},
+        ],
+    }
+    metadata = app.summarize_video_info(info)
+    assert [f['format_id'] for f in metadata['audio_formats']] == ['251', '250', '249']
+    
+    # Links that also name a playlist come back as a stub; it is followed to the video
+    class YDL:
+        def __init__(self):
+            self.urls = []
+        def extract_info(self, url, download=False, process=True, ie_key=None):
+            self.urls.append(url)
+            if 'list=' in url:
+                return {'_type': 'url', 'url': app.canonical_video_url('abc123'), 'ie_key': 'Youtube'}
+            return info
+    ydl = YDL()
+    assert app.extract_video_info(ydl, 'https://youtu.be/abc123?list=PL1') is info
+    assert ydl.urls[-1] == 'https://www.youtube.com/watch?v=abc123'
+    try:
+        app.extract_video_info(type('Playlist', (), {'extract_info': lambda *a, **k: {'_type': 'playlist'}})(), 'x')
+        assert False, 'expected a playlist to be refused'
+    except RuntimeError:
+        pass
+    
+    audio_format = app.select_audio_format(metadata, 'speech')
+    assert audio_format['format_id'] == '250'
+    app.check_video_limits(metadata, audio_format)
+    
+    for rejected in (dict(metadata, duration=3 * 3600), dict(metadata, is_live=True)):
+        try:
+            app.check_video_limits(rejected, audio_format)
+            assert False, 'expected VideoRejected'
+        except app.VideoRejected:
+            pass
+    
+    # A rejection inside the job reads the same as one caught at submission
+    import uuid
+    video_id = uuid.uuid4().hex[:11]
+    too_long = dict(metadata, id=video_id, duration=3 * 3600)
+    with patch.object(app, 'probe_video', lambda url, vid: (too_long, None)):
+        job, _ = app.job_queue.submit(video_id, app.run_video_pipeline, app.canonical_video_url(video_id), video_id)
+        assert job.wait(5) and job.status == 'failed'
+    response = app.app.test_client().get(f'/jobs/{job.id}/result')
+    assert response.status_code == 422
+    assert response.get_json()['code'] == 'video_rejected' and response.get_json()['video_id'] == video_id
+    
+    print("✅ Video preflight works")
+    return True
+
+def test_download_strategies():
+    """Test that download failures are classified and routed."""
+    from downloads import DownloadFailed, DownloadStats, run_strategies
+    
+    strategies = [
+        {'name': 'preferred', 'postprocess': True},
+        {'name': 'worst_audio', 'postprocess': True},
+        {'name': 'no_postprocess', 'postprocess': False},
+    ]
+    
+    def run(errors):
+        calls = []
+        def attempt(strategy, refresh):
+            calls.append((strategy['name'], refresh))
+            if errors:
+                raise Exception(errors.pop(0))
+            return 'audio.opus'
+        stats = DownloadStats()
+        try:
+            result = run_strategies(strategies, attempt, stats=stats, sleep=lambda seconds: None)
+        except DownloadFailed as e:
+            result = e.error_class
+        return result, calls, stats.stats()
+    
+    result, calls, stats = run(['ERROR: HTTP Error 403: Forbidden'])
+    assert result == 'audio.opus' and calls == [('preferred', False), ('preferred', True)]
+    assert stats['backoff_seconds'] > 0
+    
+    result, calls, _ = run(['ERROR: Postprocessing: audio conversion failed'])
+    assert calls[-1][0] == 'no_postprocess'
+    
+    result, calls, stats = run(['ERROR: [youtube] abc: Private video. Sign in if you have access'])
+    assert result == 'unavailable' and len(calls) == 1 and stats['failed'] == 1
+    
+    print("✅ Download strategies work")
+    return True
+
+def test_batch_runner():
+    """Test that batches run items concurrently and report partial failures."""
+    import time
+    from jobs import JobQueue
+    from batches import BatchRunner
+    
+    def process(url, video_id):
+        time.sleep(0.1)
+        if video_id == 'broken':
+            raise RuntimeError('download failed')
+        return {'transcript_id': f'id-{video_id}', 'cached': False}
+    
+    runner = BatchRunner(JobQueue(max_workers=4), concurrency=3)
+    items = [{'video_id': video_id, 'url': f'https://youtu.be/{video_id}'}
+             for video_id in ('one', 'two', 'broken', 'cached')]
+    lookup = lambda video_id: {'transcript_id': 'id-cached', 'cached': True} if video_id == 'cached' else None
+    
+    started = time.time()
+    batch = runner.start(items, process, lookup=lookup)
+    while runner.get(batch.id)['status'] != 'done':
+        time.sleep(0.02)
+    assert time.time() - started < 0.3  # the three jobs ran concurrently
+    
+    status = runner.get(batch.id)
+    assert status['counts'] == {'queued': 0, 'running': 0, 'done': 3, 'failed': 1}
+    assert status['progress'] == 1.0
+    assert status['items'][2]['error'] == 'download failed'
+    assert status['items'][3]['cached'] is True
+    
+    # Batches share one limit, and a hung job fails its item instead of its thread
+    shared = BatchRunner(JobQueue(max_workers=4), concurrency=1, wait_timeout=0.2)
+    def hang(url, video_id):
+        time.sleep(0.5 if video_id == 'hung' else 0.05)
+        return {'transcript_id': f'id-{video_id}'}
+    first = shared.start([{'video_id': 'hung', 'url': 'https://youtu.be/hung'}], hang)
+    second = shared.start([{'video_id': 'quick', 'url': 'https://youtu.be/quick'}], hang)
+    time.sleep(0.1)
+    assert shared.get(second.id)['counts']['queued'] == 1  # waits for the shared thread
+    while shared.get(second.id)['status'] != 'done':
+        time.sleep(0.02)
+    assert shared.get(first.id)['items'][0]['error'].startswith('Timed out')
+    assert shared.get(second.id)['counts']['done'] == 1
+    
+    print("✅ Batch runner works")
+    return True
+
+def test_metrics():
+    """Test histograms, counters and stage spans in Prometheus format."""
+    import metrics
+    
+    registry = metrics.Registry()
+    latency = registry.histogram('test_seconds', 'Test latency', ('stage',), buckets=(0.1, 1))
+    hits = registry.counter('test_hits_total', 'Test hits', ('cache',))
+    latency.observe(0.05, stage='a')
+    latency.observe(0.5, stage='a')
+    hits.inc(cache='x')
+    hits.inc(2, cache='x')
+    
+    text = registry.render()
+    assert '# TYPE test_seconds histogram' in text
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 2' in text
+    assert 'test_hits_total{cache="x"} 3' in text
+    
+    metrics.start_request_timing()
+    try:
+        with metrics.span('test_stage'):
+            raise ValueError('boom')
+    except ValueError:
+        pass
+    assert metrics.ERRORS.value(stage='test_stage', type='ValueError') == 1
+    timings = metrics.request_timings()
+    assert [stage for stage, _ in timings] == ['test_stage']
+    assert metrics.server_timing_header(timings).startswith('test_stage;dur=')
+    
+    print("✅ Metrics work")
+    return True
+
+def test_segment_index():
+    """Test time-range lookups and phrase search over timestamped segments."""
+    from segments import SegmentIndex, parse_timestamp, detect_time_window
+    
+    timeline = SegmentIndex([
+        {'start': 0.0, 'end': 4.0, 'text': 'Welcome to the lecture.'},
+        {'start': 4.0, 'end': 9.5, 'text': 'Today we cover the Krebs cycle.'},
+        {'start': 9.5, 'end': 15.0, 'text': 'The Krebs cycle makes ATP.'},
+        {'start': 2.0, 'end': 20.0, 'text': 'Background music.'},
+    ])
+    assert timeline.timed and timeline.duration == 20.0
+    assert [s['text'] for s in timeline.time_range(5, 10)] == [
+        'Background music.', 'Today we cover the Krebs cycle.', 'The Krebs cycle makes ATP.']
+    assert [s['start'] for s in timeline.time_range(16, 30)] == [2.0]
+    assert timeline.excerpt(0, 3).startswith('[0:00] Welcome')
+    
+    matches = timeline.search('krebs   CYCLE')
+    assert [m['start'] for m in matches] == [4.0, 9.5]
+    assert 'Krebs cycle' in matches[0]['snippet']
+    assert timeline.search('photosynthesis') == []
+    assert not SegmentIndex([{'start': 0.0, 'end': None, 'text': 'No timestamps'}]).timed
+    
+    assert parse_timestamp('1:02:03') == 3723 and parse_timestamp('12:30') == 750
+    for bad in ('inf', '-inf', 'nan', float('inf'), float('nan'), '-5', 'soon'):
+        try:
+            parse_timestamp(bad)
+            assert False, f'expected ValueError for {bad!r}'
+        except ValueError:
+            pass
+    assert detect_time_window('What happens around 12:30?', padding=30) == (720, 780)
+    assert detect_time_window('Explain minutes 3 to 5') == (180, 300)
+    assert detect_time_window('What is this video about?') is None
+    
+    print("✅ Segment index works")
+    return True
+
+def test_transcript_search():
+    """Test ranked full-text search and incremental re-indexing."""
+    from search import TranscriptSearch, fts5_available
+    
+    if not fts5_available():
+        print("⚠️ SQLite FTS5 not available, skipping")
+        return True
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index = TranscriptSearch(os.path.join(temp_dir, 'search.sqlite3'))
+        assert index.add('bio', 'Photosynthesis happens in the chloroplast.', 't1', 'Plant biology')
+        assert index.add('chem', 'Acids and bases; photosynthesis is mentioned once.', 't2', 'Chemistry')
+        assert not index.add('bio', 'Photosynthesis happens in the chloroplast.', 't1', 'Plant biology')
+        
+        results = index.search('photosynth')
+        assert {r['video_id'] for r in results} == {'bio', 'chem'}
+        assert '[Photosynthesis]' in results[0]['snippet']
+        assert [r['video_id'] for r in index.search('plant photosynthesis')] == ['bio']
+        assert index.search('"unbalanced AND (') == []
+        
+        # Re-indexing replaces the old text; removal drops the video
+        assert index.add('bio', 'Now about mitochondria.', 't3', 'Plant biology')
+        assert index.search('chloroplast') == []
+        assert index.search('mitochondria')[0]['transcript_id'] == 't3'
+        assert index.remove('chem') and not index.remove('chem')
+        assert len(index) == 1
+        
+        # Concurrent re-indexing of one video leaves exactly one FTS row behind
+        # it, even when every add saw the same (missing) row before writing
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        barrier, seen = threading.Barrier(8), threading.local()
+        unchanged = index._unchanged
+        def checked(*args):
+            if not getattr(seen, 'checked', False):
+                seen.checked = True
+                barrier.wait(5)
+            return unchanged(*args)
+        with patch.object(index, '_unchanged', checked), ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda i: index.add('race', f'Concurrent ribosome text {i}', f'r{i}'), range(8)))
+        assert [r['video_id'] for r in index.search('ribosome')] == ['race']
+        conn = index._connect()
+        assert conn.execute(
+            "SELECT COUNT(*) FROM transcripts WHERE transcripts MATCH 'ribosome'"
+        ).fetchone()[0] == 1
+    
+    # The route keeps limit and offset in range and rejects non-numbers
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
+        import app
+    if app.search_index is not None:
+        for number in range(3):
+            app.search_index.add(f'lim{number}', 'Limit check about lysosomes', f'lim-t{number}')
+        client = app.app.test_client()
+        assert len(client.get('/search?q=lysosomes&limit=-1').get_json()['results']) == 1
+        assert len(client.get('/search?q=lysosomes&offset=-5').get_json()['results']) == 3
+        assert client.get('/search?q=lysosomes&limit=abc').status_code == 400
+    
+    print("✅ Transcript search works")
+    return True
+
+def test_llm_scheduler():
+    """Test concurrency cap, coalescing, rate-limit retries and queue timeouts."""
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import llm
+    
+    running = {'now': 0, 'peak': 0, 'calls': 0}
+    lock = threading.Lock()
+    def call(seconds=0.05):
+        with lock:
+            running['now'] += 1
+            running['calls'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+        time.sleep(seconds)
+        with lock:
+            running['now'] -= 1
+        return 'ok'
+    
+    scheduler = llm.Scheduler(max_concurrent=2, sleep=lambda seconds: None)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        assert list(pool.map(lambda i: scheduler.run(call), range(6))) == ['ok'] * 6
+    assert running['peak'] == 2
+    
+    # Identical in-flight prompts share one call
+    running['calls'] = 0
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda i: scheduler.run(lambda: call(0.2), key='same'), range(4)))
+    assert results == ['ok'] * 4 and running['calls'] == 1
+    assert scheduler.stats()['coalesced'] == 3
+    
+    # Rate-limit errors are retried, other errors are not, and retries run out
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Exception('429 Resource has been exhausted (e.g. check quota).')
+        return 'done'
+    assert scheduler.run(flaky) == 'done' and scheduler.stats()['retries'] == 2
+    try:
+        scheduler.run(lambda: (_ for _ in ()).throw(ValueError('bad prompt')))
+        assert False, 'expected ValueError'
+    except ValueError:
+        pass
+    try:
+        llm.Scheduler(max_retries=1, sleep=lambda seconds: None).run(
+            lambda: (_ for _ in ()).throw(Exception('HTTP 429 Too Many Requests')))
+        assert False, 'expected LLMUnavailable'
+    except llm.LLMUnavailable:
+        pass
+    
+    # A full queue is rejected after queue_timeout; held streaming slots count
+    busy = llm.Scheduler(max_concurrent=1, queue_timeout=0.05)
+    with busy.streaming(lambda: iter(['a', 'b'])):
+        try:
+            busy.run(call)
+            assert False, 'expected LLMUnavailable'
+        except llm.LLMUnavailable as e:
+            assert e.retry_after == 0.05
+    assert busy.run(call) == 'ok' and busy.stats()['rejected'] == 1
+    
+    # An interrupted leader (GreenletExit, KeyboardInterrupt) releases its
+    # followers with LLMUnavailable and gives its slot back
+    class Interrupt(BaseException):
+        pass
+    def interrupted():
+        time.sleep(0.1)
+        raise Interrupt()
+    solo = llm.Scheduler(max_concurrent=1, queue_timeout=1)
+    outcomes = []
+    def follow():
+        time.sleep(0.03)
+        try:
+            solo.run(lambda: 'never', key='interrupted')
+        except llm.LLMUnavailable:
+            outcomes.append('unavailable')
+    follower = threading.Thread(target=follow, daemon=True)
+    follower.start()
+    try:
+        solo.run(interrupted, key='interrupted')
+        assert False, 'expected the interrupt'
+    except Interrupt:
+        pass
+    follower.join(2)
+    assert outcomes == ['unavailable'] and solo.run(call) == 'ok'
+    assert solo.stats()['in_flight'] == 0
+    
+    bucket = llm.TokenBucket(60, burst=2, clock=lambda: 0.0)
+    assert [bucket.reserve(), bucket.reserve(), bucket.reserve()] == [0.0, 0.0, 1.0]
+    assert bucket.reserve(timeout=1.5) is None
+    
+    print("✅ LLM scheduler works")
+    return True
+
+def test_model_registry():
+    """Test that model clients are shared and heavy SDKs are not imported with the app."""
+    import subprocess
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    import llm
+    
+    created = []
+    class FakeSDK:
+        class GenerativeModel:
+            def __init__(self, name):
+                created.append(name)
+    
+    with patch.object(llm, '_genai', FakeSDK), patch.dict(llm._models, clear=True):
+        first = llm.get_model('model-a')
+        assert llm.get_model('model-a') is first
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            assert set(pool.map(lambda i: llm.get_model('model-b'), range(8))) == {llm.get_model('model-b')}
+        assert created == ['model-a', 'model-b']
+    
+    heavy = ['google.generativeai', 'yt_dlp', 'pydub', 'google.cloud.speech']
+    with tempfile.TemporaryDirectory() as temp_dir:
+        env = dict(os.environ, GEMINI_API_KEY='test_key', ASKVID_CACHE_DIR=temp_dir)
+        loaded = subprocess.run(
+            [sys.executable, '-c',
+             f"import sys, app; print('loaded:', [m for m in {heavy!r} if m in sys.modules])"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+    assert loaded == 'loaded: []', f"imported at startup: {loaded}"
+    
+    print("✅ Model registry works")
+    return True
+
+def test_async_serving_config():
+    """Test the gevent gunicorn config and per-thread database connections."""
+    import threading
+    import gunicorn_async
+    from cache import connection_local
+    
+    assert gunicorn_async.worker_class == 'gevent'
+    assert gunicorn_async.worker_connections >= 100
+    
+    local = connection_local()
+    local.conn = 'main'
+    seen = []
+    worker = threading.Thread(target=lambda: seen.append(getattr(local, 'conn', None)))
+    worker.start()
+    worker.join()
+    assert seen == [None] and local.conn == 'main'
+    
+    print("✅ Async serving config works")
+    return True
+
+def test_context_cache():
+    """Test that transcripts are registered once and follow-ups reuse the context."""
+    import time
+    from cache import DiskCache
+    from contexts import ContextCache
+    
+    class Backend:
+        def __init__(self):
+            self.calls = []
+        def create_context(self, model, system_instruction, contents, ttl):
+            self.calls.append('create')
+            if 'unsupported' in contents:
+                raise Exception('400 Cached content is too small')
+            if 'busy' in contents:
+                raise Exception('429 Resource has been exhausted (e.g. check quota).')
+            return f'cachedContents/{len(self.calls)}'
+        def touch_context(self, name, ttl):
+            self.calls.append('touch')
+        def delete_context(self, name):
+            self.calls.append('delete')
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        backend = Backend()
+        store = DiskCache(os.path.join(temp_dir, 'cache.sqlite3'), 'contexts')
+        contexts = ContextCache(backend, store, 'model-002', ttl=600, min_tokens=100)
+        
+        assert contexts.get('short', 'rules', 'Transcript: hi', 10) is None
+        name = contexts.get('video', 'rules', 'Transcript: long', 500)
+        assert contexts.get('video', 'rules', 'Transcript: long', 500) == name
+        assert backend.calls == ['create']
+        
+        # Past half its TTL the provider-side expiry is pushed out again
+        store.set('video', {'name': name, 'expires_at': time.time() + 200}, ttl=600)
+        assert contexts.get('video', 'rules', 'Transcript: long', 500) == name
+        assert backend.calls == ['create', 'touch']
+        
+        # Refusals fall back to inline and are not retried on every question
+        assert contexts.get('bad', 'rules', 'unsupported', 500) is None
+        assert contexts.get('bad', 'rules', 'unsupported', 500) is None
+        assert backend.calls.count('create') == 2
+        assert store.get('bad')['expires_at'] <= time.time() + contexts.refusal_ttl
+        
+        # Transient failures are retried by the next question
+        assert contexts.get('rate', 'rules', 'busy', 500) is None
+        assert contexts.get('rate', 'rules', 'busy', 500) is None
+        assert backend.calls.count('create') == 4 and store.get('rate') is None
+        
+        contexts.expire('video')
+        assert contexts.get('video', 'rules', 'Transcript: long', 500) != name
+        contexts.delete('video')
+        assert backend.calls[-1] == 'delete'
+        assert contexts.stats()['reused'] == 2
+    
+    print("✅ Context cache works")
+    return True
+
+def test_batch_answers():
+    """Test that batched answers are split per question and gaps asked individually."""
+    import uuid
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
+        import app
+    
+    answers = app.parse_batch_answers(
+        "Preamble\n### Answer 1\nFirst.\n\n**Answer 3:**\nignored\n## answer 2\nSecond.\n### Answer 9\nStray.", 2)
+    assert answers == {1: 'First.\n\n**Answer 3:**\nignored', 2: 'Second.'}
+    assert app.parse_batch_answers('No headings at all', 2) == {}
+    
+    class Response:
+        def __init__(self, text):
+            self.text = text
+    
+    prompts = []
+    def generate(model, prompt, context=None):
+        prompts.append(prompt)
+        if len(prompts) == 1:
+            return Response("### Answer 1\nBatched answer.")
+        return Response("Individual answer.")
+    
+    transcript = f"Batch test transcript {uuid.uuid4()}"
+    with patch.object(app.llm, 'generate', generate), patch.object(app, 'answer_context', lambda t: None):
+        results, usage = app.get_batch_answers(['What is A?', 'What is B?', 'what is a'], transcript)
+        assert [r['source'] for r in results] == ['batch', 'individual', 'batch']
+        assert results[0]['answer'] == results[2]['answer'] == 'Batched answer.'
+        assert '1. What is A?' in prompts[0] and '2. What is B?' in prompts[0]
+        assert usage['model_calls'] == 2 and usage['prompt_tokens'] > 0
+        
+        # Answers from the batch are cached per question
+        results, usage = app.get_batch_answers(['What is A?', 'What is B?'], transcript)
+        assert [r['source'] for r in results] == ['cache', 'cache']
+        assert usage['model_calls'] == 0 and len(prompts) == 2
+    
+    print("✅ Batch answers work")
+    return True
+
+def test_audio_store():
+    """Test that concurrent downloads are shared, failures resume and old audio is evicted."""
+    import threading
+    import time
+    from audio_store import AudioStore
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = AudioStore(temp_dir, max_bytes=250, poll_interval=0.01)
+        downloads = []
+        
+        def download(target):
+            downloads.append(target)
+            time.sleep(0.1)
+            with open(target, 'wb') as f:
+                f.write(b'x' * 100)
+            return 'Title.opus'
+        
+        results = []
+        def fetch():
+            with store.checkout('abc', 'speech.opus', download) as (path, result):
+                results.append((open(path, 'rb').read(), result))
+        threads = [threading.Thread(target=fetch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(downloads) == 1
+        assert [r for _, r in results].count('Title.opus') == 1
+        assert all(data == b'x' * 100 for data, _ in results)
+        assert store.stats()['waited'] == 3
+        
+        # A failed download leaves its partial directory to resume from
+        def broken(target):
+            with open(target + '.part', 'wb') as f:
+                f.write(b'y' * 10)
+            raise IOError('connection reset')
+        try:
+            with store.checkout('def', 'speech.opus', broken):
+                pass
+            assert False, 'expected the download to fail'
+        except IOError:
+            pass
+        assert not store.has('def', 'speech.opus')
+        def resume(target):
+            assert os.path.exists(target + '.part')
+            return download(target)
+        with store.checkout('def', 'speech.opus', resume) as (path, _):
+            assert os.path.getsize(path) == 100
+        assert store.stats()['resumed'] == 1
+        
+        # Over quota, the least recently used artifact not in use goes first
+        os.utime(store.path('abc', 'speech.opus'), (1, 1))
+        with store.checkout('ghi', 'speech.opus', download):
+            pass
+        assert not store.has('abc', 'speech.opus')
+        assert store.has('def', 'speech.opus') and store.has('ghi', 'speech.opus')
+        
+        # Files being read are never evicted
+        with store.checkout('def', 'speech.opus', download):
+            os.utime(store.path('def', 'speech.opus'), (1, 1))
+            with store.checkout('jkl', 'speech.opus', download):
+                pass
+            assert store.has('def', 'speech.opus') and not store.has('ghi', 'speech.opus')
+        
+        # Readers of a stored file share it: a second reader does not wait
+        # for the first one's with block (e.g. a whole transcription) to end
+        reading, done = threading.Event(), threading.Event()
+        def slow_reader():
+            with store.checkout('jkl', 'speech.opus', download):
+                reading.set()
+                done.wait(5)
+        reader = threading.Thread(target=slow_reader)
+        reader.start()
+        reading.wait(5)
+        waited = store.stats()['waited']
+        started = time.monotonic()
+        with store.checkout('jkl', 'speech.opus', download) as (path, result):
+            assert result is None and os.path.getsize(path) == 100
+        assert time.monotonic() - started < 0.5 and store.stats()['waited'] == waited
+        done.set()
+        reader.join()
+        
+        assert store.remove('def') == 1
+        assert store.path('../etc', 'x').startswith(temp_dir)
+    
+    print("✅ Audio store works")
+    return True
+
+def test_content_classifier():
+    """Test that content rules classify by weighted keyword matches in one pass."""
+    from classifier import ContentClassifier
+    
+    rules = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'content_rules.json')
+    classifier = ContentClassifier.load(rules)
+    
+    assert classifier.describe('Sahiba - Jasleen Royal.opus').startswith("This is the song 'Sahiba'")
+    assert classifier.describe('Build a Portfolio Website with HTML.opus').startswith('This tutorial teaches')
+    assert 'career-related' in classifier.describe('Google internship interview.opus')
+    assert 'various content' in classifier.describe('Holiday vlog.opus')
+    assert classifier.describe(None).startswith('This video contains')
+    
+    # Substring semantics, including keywords hidden behind an earlier match
+    assert classifier.keywords_in('Songs and Learning HOW TO') == {'song', 'learn', 'how to'}
+    assert classifier.keywords_in('jobeginner') == {'job', 'beginner'}
+    
+    # Tags and description count, with less weight than the title
+    assert classifier.classify('Holiday vlog', tags=['comedy'])['name'] == 'entertainment'
+    assert classifier.classify('Holiday vlog', description='a new song') is None
+    assert classifier.classify('Movie night', description='song, album and lyrics')['name'] == 'music'
+    assert classifier.classify('Movie night', description='song')['name'] == 'entertainment'
+    
+    print("✅ Content classifier works")
+    return True
+
+def test_response_compression():
+    """Test compression negotiation, fingerprinted static URLs and conditional responses."""
+    import gzip
+    from flask import Flask, jsonify, request
+    from compression import Compressor
+    
+    demo = Flask(__name__)
+    compressor = Compressor(min_bytes=100)
+    
+    @demo.route('/big')
+    def big():
+        return jsonify({'transcript': 'words ' * 500})
+    
+    @demo.route('/small')
+    def small():
+        return jsonify({'ok': True})
+    
+    @demo.after_request
+    def compress(response):
+        return compressor.apply(response, request.accept_encodings)
+    
+    client = demo.test_client()
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert b'words words' in gzip.decompress(response.data)
+    assert 'Content-Encoding' not in client.get('/big', headers={'Accept-Encoding': 'gzip;q=0'}).headers
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    if 'br' in compressor.encodings:
+        assert client.get('/big', headers={'Accept-Encoding': 'gzip, br'}).headers['Content-Encoding'] == 'br'
+        assert client.get('/big', headers={'Accept-Encoding': 'gzip, br;q=0.5'}).headers['Content-Encoding'] == 'gzip'
+    
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
+        import app
+    client = app.app.test_client()
+    from flask import url_for
+    with app.app.test_request_context():
+        url = url_for('static', filename='css/style.css')
+    assert '?v=' in url
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get('/static/css/style.css').headers['Cache-Control'] == 'no-cache'
+    
+    page = client.get('/')
+    assert url in page.get_data(as_text=True)
+    assert client.get('/', headers={'If-None-Match': page.headers['ETag']}).status_code == 304
+    
+    print("✅ Response compression and caching work")
+    return True
+
 def main():
     """Run all tests."""
     print("🧪 Testing AskVid application setup...\n")
@@ -62,7 +1141,30 @@ def main():
     tests = [
         ("Module Imports", test_imports),
         ("Flask App Creation", test_flask_app),
-        ("File Structure", test_templates_exist)
+        ("File Structure", test_templates_exist),
+        ("Transcript Cache", test_transcript_cache),
+        ("Response Cache", test_response_cache),
+        ("Job Queue", test_job_queue),
+        ("Offline Transcription", test_offline_transcription),
+        ("Transcription Fallback", test_transcription_fallback),
+        ("Transcript Sessions", test_transcript_sessions),
+        ("Retrieval Context", test_retrieval_context),
+        ("Streaming Responses", test_streaming_responses),
+        ("Analysis Reuse", test_analysis_reuse),
+        ("Video Preflight", test_video_preflight),
+        ("Download Strategies", test_download_strategies),
+        ("Batch Runner", test_batch_runner),
+        ("Metrics", test_metrics),
+        ("Segment Index", test_segment_index),
+        ("Transcript Search", test_transcript_search),
+        ("LLM Scheduler", test_llm_scheduler),
+        ("Model Registry", test_model_registry),
+        ("Async Serving Config", test_async_serving_config),
+        ("Context Cache", test_context_cache),
+        ("Batch Answers", test_batch_answers),
+        ("Audio Store", test_audio_store),
+        ("Content Classifier", test_content_classifier),
+        ("Response Compression", test_response_compression)
     ]
     
     passed = 0
@@ -0,0 +1,296 @@
+"""
+Pluggable speech-to-text engines.
+
+Every engine splits the audio into silence-aligned chunks with pydub,
+transcribes the chunks concurrently on a thread pool and stitches the results
+back together as timestamped segments, so wall time shrinks with the number of
+workers instead of growing linearly with video length. transcribe_stream() does
+the same for raw PCM arriving on a pipe, starting on each chunk as soon as it
+has arrived. Subclasses only have to implement transcribe_chunk().
+
+pydub and the Cloud Speech client are imported on first use to keep worker
+start-up fast.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Audio is normalised to this before chunking; it is all speech recognition needs
+SAMPLE_RATE = 16000
+# Raw PCM is 16-bit mono, so this many bytes per millisecond
+BYTES_PER_MS = SAMPLE_RATE * 2 // 1000
+# How much of a PCM stream is read at a time (about two seconds of audio)
+STREAM_READ_BYTES = 64 * 1024
+
+
+def pcm_stream_command(source, headers=None):
+    """FFmpeg command that decodes a file or URL to 16 kHz mono PCM on stdout"""
+    command = ['ffmpeg', '-nostdin', '-loglevel', 'error']
+    if headers and source.startswith(('http://', 'https://')):
+        command += ['-headers', ''.join(f"{name}: {value}\r\n" for name, value in headers.items())]
+    return command + [
+        '-i', source, '-vn', '-f', 's16le', '-acodec', 'pcm_s16le',
+        '-ar', str(SAMPLE_RATE), '-ac', '1', 'pipe:1'
+    ]
+
+
+def format_timestamp(seconds):
+    """Render seconds as M:SS or H:MM:SS"""
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+def join_segments(segments):
+    """Flatten timestamped segments into plain transcript text"""
+    return ' '.join(segment['text'].strip() for segment in segments if segment['text'].strip())
+
+
+class TranscriptionEngine:
+    """Chunk audio on silence and transcribe the chunks concurrently"""
+
+    name = 'base'
+
+    def __init__(self, max_workers=4, max_chunk_ms=55000, min_silence_ms=500,
+                 silence_offset_db=16, seek_step_ms=20):
+        self.max_workers = max_workers
+        self.max_chunk_ms = max_chunk_ms
+        self.min_silence_ms = min_silence_ms
+        self.silence_offset_db = silence_offset_db
+        self.seek_step_ms = seek_step_ms
+
+    def load(self, audio):
+        """Accept a path or an AudioSegment and normalise it to 16 kHz mono"""
+        from pydub import AudioSegment
+
+        if not isinstance(audio, AudioSegment):
+            audio = AudioSegment.from_file(audio)
+        return audio.set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(2)
+
+    def chunk_bounds(self, audio):
+        """Split points (start_ms, end_ms) that fall in the middle of silences.
+
+        Chunks are as long as possible without exceeding max_chunk_ms; speech
+        that runs longer than that without a pause is cut hard.
+        """
+        from pydub.silence import detect_nonsilent
+
+        length = len(audio)
+        if length == 0:
+            return []
+
+        silence_thresh = audio.dBFS - self.silence_offset_db if audio.dBFS != float('-inf') else -60
+        ranges = detect_nonsilent(
+            audio,
+            min_silence_len=self.min_silence_ms,
+            silence_thresh=silence_thresh,
+            seek_step=self.seek_step_ms
+        )
+
+        cuts = [0]
+        previous_end = 0
+        for start, end in ranges:
+            if end - cuts[-1] > self.max_chunk_ms:
+                middle = (previous_end + start) // 2
+                if middle > cuts[-1]:
+                    cuts.append(middle)
+            while end - cuts[-1] > self.max_chunk_ms:
+                cuts.append(cuts[-1] + self.max_chunk_ms)
+            previous_end = end
+        while length - cuts[-1] > self.max_chunk_ms:
+            cuts.append(cuts[-1] + self.max_chunk_ms)
+        cuts.append(length)
+
+        return [(start, end) for start, end in zip(cuts, cuts[1:]) if end > start]
+
+    def split_point(self, audio):
+        """Where to end a chunk cut from a stream: mid-silence in its second half, else the end"""
+        from pydub.silence import detect_silence
+
+        if audio.dBFS == float('-inf'):
+            return len(audio)
+        silences = detect_silence(
+            audio,
+            min_silence_len=self.min_silence_ms,
+            silence_thresh=audio.dBFS - self.silence_offset_db,
+            seek_step=self.seek_step_ms
+        )
+        if silences:
+            middle = (silences[-1][0] + silences[-1][1]) // 2
+            if middle > len(audio) // 2:
+                return middle
+        return len(audio)
+
+    def transcribe_chunk(self, chunk):
+        """Return the text spoken in one chunk (16 kHz mono AudioSegment)"""
+        raise NotImplementedError
+
+    def transcribe(self, audio, offset_ms=0):
+        """Transcribe a path or AudioSegment into [{'start', 'end', 'text'}] segments.
+
+        Timestamps are in seconds; offset_ms shifts them when the audio is
+        itself a slice of a longer recording.
+        """
+        audio = self.load(audio)
+        bounds = self.chunk_bounds(audio)
+        if not bounds:
+            return []
+
+        def run(bound):
+            start, end = bound
+            return self.transcribe_chunk(audio[start:end])
+
+        if len(bounds) == 1 or self.max_workers <= 1:
+            texts = [run(bound) for bound in bounds]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(bounds))) as pool:
+                texts = list(pool.map(run, bounds))
+
+        return [
+            {
+                'start': round((start + offset_ms) / 1000, 3),
+                'end': round((end + offset_ms) / 1000, 3),
+                'text': text.strip(),
+            }
+            for (start, end), text in zip(bounds, texts) if text and text.strip()
+        ]
+
+    def transcribe_stream(self, stream, on_segment=None, max_pending=None):
+        """Transcribe 16-bit 16 kHz mono PCM read from a file-like stream.
+
+        A chunk is cut (on a silence where possible) as soon as max_chunk_ms
+        of audio has arrived and is transcribed while the rest streams in.
+        Once max_pending chunks are waiting, reading stops until the oldest
+        finishes, so memory stays flat however long the stream is. Segments
+        are returned, and passed to on_segment as they complete, in order.
+        """
+        from pydub import AudioSegment
+
+        max_pending = max_pending or 2 * self.max_workers
+        max_chunk_bytes = self.max_chunk_ms * BYTES_PER_MS
+        segments = []
+        pending = deque()
+        buffer = bytearray()
+        position_ms = 0
+
+        def finish_oldest():
+            start, end, future = pending.popleft()
+            text = future.result()
+            if text and text.strip():
+                segment = {'start': round(start / 1000, 3), 'end': round(end / 1000, 3), 'text': text.strip()}
+                segments.append(segment)
+                if on_segment is not None:
+                    on_segment(segment)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            def submit(data):
+                nonlocal position_ms
+                chunk = AudioSegment(data=bytes(data), sample_width=2, frame_rate=SAMPLE_RATE, channels=1)
+                start = position_ms
+                position_ms += len(chunk)
+                while len(pending) >= max_pending:
+                    finish_oldest()
+                pending.append((start, position_ms, pool.submit(self.transcribe_chunk, chunk)))
+
+            while True:
+                data = stream.read(STREAM_READ_BYTES)
+                if not data:
+                    break
+                buffer.extend(data)
+                while len(buffer) >= max_chunk_bytes:
+                    window = AudioSegment(data=bytes(buffer[:max_chunk_bytes]), sample_width=2,
+                                          frame_rate=SAMPLE_RATE, channels=1)
+                    cut = self.split_point(window) * BYTES_PER_MS
+                    submit(buffer[:cut])
+                    del buffer[:cut]
+                while pending and pending[0][2].done():
+                    finish_oldest()
+
+            tail = len(buffer) - len(buffer) % 2
+            if tail:
+                submit(buffer[:tail])
+            while pending:
+                finish_oldest()
+
+        return segments
+
+
+class GoogleSpeechEngine(TranscriptionEngine):
+    """Google Cloud Speech-to-Text, one synchronous recognize call per chunk"""
+
+    name = 'google'
+
+    def __init__(self, language_code='en-US', **kwargs):
+        super().__init__(**kwargs)
+        self.language_code = language_code
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # SpeechClient is thread-safe; share one across chunk workers
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from google.cloud import speech
+                    self._client = speech.SpeechClient()
+        return self._client
+
+    def transcribe_chunk(self, chunk):
+        from google.cloud import speech
+
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=SAMPLE_RATE,
+            language_code=self.language_code,
+            enable_automatic_punctuation=True,
+        )
+        response = self.client.recognize(
+            config=config,
+            audio=speech.RecognitionAudio(content=chunk.raw_data)
+        )
+        return ' '.join(
+            result.alternatives[0].transcript
+            for result in response.results if result.alternatives
+        )
+
+
+class OfflineEngine(TranscriptionEngine):
+    """Local stand-in that needs no network or credentials.
+
+    Produces a deterministic description of each chunk and can simulate a
+    per-chunk recognition latency, which makes it useful for exercising the
+    chunking and concurrency without a real speech backend.
+    """
+
+    name = 'offline'
+
+    def __init__(self, latency=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    def transcribe_chunk(self, chunk):
+        if self.latency:
+            time.sleep(self.latency)
+        if chunk.dBFS == float('-inf'):
+            return ''
+        return f"[speech {len(chunk) / 1000:.1f}s at {chunk.dBFS:.0f} dBFS]"
+
+
+ENGINES = {
+    GoogleSpeechEngine.name: GoogleSpeechEngine,
+    OfflineEngine.name: OfflineEngine,
+}
+
+
+def create_engine(name, **kwargs):
+    """Build a registered engine by name"""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown transcription engine '{name}'")
+    return ENGINES[name](**kwargs)